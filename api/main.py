@@ -1,40 +1,1216 @@
+import os
 import sys
+import queue
+import asyncio
+import calendar
+import concurrent.futures
+import contextvars
+import functools
+import hashlib
+import heapq
+import importlib.util
+import json
+import itertools
+import random
+import logging
+import logging.handlers
+import mmap
 import sqlite3
-from fastapi import FastAPI, HTTPException, Query,  Depends, status, Response
-from pydantic import BaseModel, Field, conint, validator, ValidationError
+import struct
+import threading
+import time
+import zlib
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, HTTPException, Query, status, Response, Request, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel, validator
 from typing import ClassVar, List, Optional
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.routing import Match
 import re
-#librerias de session
-#from sqlalchemy.orm import Session
-from fastapi.security import OAuth2AuthorizationCodeBearer, OAuth2PasswordRequestForm
-#from jose import JWSError, jwt 
-from datetime import datetime, timedelta
-#from passlib.context import CryptContext
-#from database import SessionLocal, engine
-#from models import User
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
 #librerias acceso a api externa
 import httpx
-from fastapi.responses import JSONResponse
+import orjson
+from fastapi.responses import ORJSONResponse, StreamingResponse
+try:
+    import fcntl
+except ImportError:  # windows: los contadores de version quedan locales al proceso
+    fcntl = None
 
 
-#configuracion para session de usuarios
-#base de datos
-dbJwt ="session.db"
-#outh2 scheme
-#oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+db ="dbReservas.db"
 
-#fin configuracion para session de usuarios
+# Logging estructurado (una linea JSON por evento) y asincronico: los handlers
+# solo encolan el registro y un hilo aparte lo escribe, asi el event loop no
+# se bloquea escribiendo en stdout. Nivel configurable con LOG_LEVEL.
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
 
-db ="dbReservas.db"
+
+class FormatoJSON(logging.Formatter):
+    def format(self, record):
+        datos = {
+            "ts": round(record.created, 3),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": record.getMessage(),
+        }
+        # campos adicionales: log.info("...", extra={"datos": {...}})
+        datos.update(getattr(record, "datos", {}))
+        if record.exc_info:
+            datos["excepcion"] = self.formatException(record.exc_info)
+        return orjson.dumps(datos, default=str).decode("utf-8")
+
+
+class ColaLog(logging.handlers.QueueHandler):
+    # Sin el listener corriendo (antes del lifespan, sin lifespan como cuando la
+    # app se usa directo por ASGI, o en un hijo de un fork) el registro se
+    # escribe directo en vez de quedar acumulado en la cola
+    def emit(self, record):
+        hilo = log_listener._thread
+        if hilo is None or not hilo.is_alive():
+            _salida_log.handle(record)
+        else:
+            super().emit(record)
+
+
+log = logging.getLogger("padel_reservas")
+log.setLevel(LOG_LEVEL)
+log.propagate = False
+_cola_log = queue.SimpleQueue()
+log.addHandler(ColaLog(_cola_log))
+_salida_log = logging.StreamHandler(sys.stdout)
+_salida_log.setFormatter(FormatoJSON())
+log_listener = logging.handlers.QueueListener(_cola_log, _salida_log)
+
+
+# Metricas en memoria expuestas en /metrics con el formato de texto de
+# Prometheus. Cada worker lleva las suyas (el pid va en proceso_pid).
+# Los histogramas guardan conteos por bucket; los acumulados se calculan al exportar.
+METRICAS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metricas:
+    def __init__(self, buckets=METRICAS_BUCKETS):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self._tipos = {}  # nombre -> (tipo, ayuda)
+        self._valores = {}  # (nombre, etiquetas) -> valor de contadores y medidores
+        self._histogramas = {}  # (nombre, etiquetas) -> [conteo por bucket..., +Inf, suma]
+        self._recolectores = []  # funciones que devuelven [(nombre, etiquetas, valor)] al exportar
+
+    def registrar(self, nombre, tipo, ayuda):
+        self._tipos[nombre] = (tipo, ayuda)
+
+    def incrementar(self, nombre, etiquetas=(), valor=1):
+        # 'etiquetas' es una tupla de pares (clave, valor)
+        clave = (nombre, etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def observar(self, nombre, etiquetas, segundos):
+        clave = (nombre, etiquetas)
+        with self._lock:
+            conteos = self._histogramas.get(clave)
+            if conteos is None:
+                conteos = self._histogramas[clave] = [0] * (len(self.buckets) + 1) + [0.0]
+            conteos[bisect_left(self.buckets, segundos)] += 1
+            conteos[-1] += segundos
+
+    @contextmanager
+    def medir(self, nombre, etiquetas=()):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(nombre, etiquetas, time.perf_counter() - inicio)
+
+    def recolector(self, fn):
+        self._recolectores.append(fn)
+        return fn
+
+    def exportar(self):
+        with self._lock:
+            muestras = {}
+            for (nombre, etiquetas), valor in self._valores.items():
+                muestras.setdefault(nombre, []).append((nombre, etiquetas, valor))
+            histogramas = [(clave, list(conteos)) for clave, conteos in self._histogramas.items()]
+        for recolector in self._recolectores:
+            for nombre, etiquetas, valor in recolector():
+                muestras.setdefault(nombre, []).append((nombre, etiquetas, valor))
+        for (nombre, etiquetas), conteos in histogramas:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + ("+Inf",), conteos):
+                acumulado += conteo
+                muestras.setdefault(nombre, []).append((nombre + "_bucket", etiquetas + (("le", str(limite)),), acumulado))
+            muestras[nombre].append((nombre + "_sum", etiquetas, round(conteos[-1], 6)))
+            muestras[nombre].append((nombre + "_count", etiquetas, acumulado))
+
+        lineas = []
+        for nombre in sorted(muestras):
+            tipo, ayuda = self._tipos.get(nombre, ("untyped", ""))
+            lineas.append("# HELP {} {}".format(nombre, ayuda))
+            lineas.append("# TYPE {} {}".format(nombre, tipo))
+            for serie, etiquetas, valor in muestras[nombre]:
+                if etiquetas:
+                    texto = ",".join('{}="{}"'.format(clave, str(dato).replace("\\", "\\\\").replace('"', '\\"'))
+                                     for clave, dato in etiquetas)
+                    lineas.append("{}{{{}}} {}".format(serie, texto, valor))
+                else:
+                    lineas.append("{} {}".format(serie, valor))
+        return "\n".join(lineas) + "\n"
+
+
+metricas = Metricas()
+metricas.registrar("http_requests_total", "counter", "Requests HTTP por ruta, metodo y codigo de estado")
+metricas.registrar("http_request_segundos", "histogram", "Latencia de los requests HTTP por ruta")
+metricas.registrar("http_requests_en_curso", "gauge", "Requests HTTP en curso")
+metricas.registrar("db_sentencia_segundos", "histogram", "Tiempo de ejecucion de las sentencias SQL (hasta la primera fila)")
+metricas.registrar("db_pool_conexiones", "gauge", "Conexiones del pool por estado")
+metricas.registrar("upstream_segundos", "histogram", "Latencia de las llamadas a la api externa")
+metricas.registrar("upstream_errores_total", "counter", "Errores de las llamadas a la api externa por tipo")
+metricas.registrar("catalogo_cache_total", "counter", "Operaciones sobre los catalogos externos y su espejo local")
+metricas.registrar("catalogo_edad_segundos", "gauge", "Segundos desde la ultima sincronizacion exitosa de cada catalogo")
+metricas.registrar("upstream_circuito_estado", "gauge", "Estado del circuito upstream (0 cerrado, 1 semiabierto, 2 abierto)")
+metricas.registrar("upstream_circuito_aperturas_total", "counter", "Veces que se abrio el circuito upstream")
+metricas.registrar("upstream_circuito_rechazos_total", "counter", "Llamadas upstream rechazadas con el circuito abierto")
+metricas.registrar("eventos_suscripciones", "gauge", "Suscripciones SSE/WebSocket abiertas")
+metricas.registrar("eventos_publicados_total", "counter", "Eventos publicados a los suscriptores")
+metricas.registrar("idempotencia_total", "counter", "Requests con Idempotency-Key por resultado")
+metricas.registrar("limites_rechazos_total", "counter", "Requests rechazadas con 429 por regla y motivo")
+metricas.registrar("limites_costosas", "gauge", "Requests a rutas costosas en curso y en cola")
+metricas.registrar("proceso_pid", "gauge", "Pid del worker que responde")
+
+
+@functools.lru_cache(maxsize=512)
+def etiqueta_sentencia(sql):
+    # "SELECT reservas", "INSERT reservas", ... en lugar del SQL completo, que
+    # tendria demasiadas variantes como etiqueta
+    partes = sql.split(None, 1)
+    verbo = partes[0].upper() if partes else ""
+    tabla = re.search(r"\b(?:FROM|INTO|UPDATE|TABLE)\s+([A-Za-z_][A-Za-z0-9_]*)", sql, re.IGNORECASE)
+    return "{} {}".format(verbo, tabla.group(1)) if tabla else verbo
+
+
+class CursorMedido(sqlite3.Cursor):
+    # Mide execute/executemany; el resto de las filas se lee despues al iterar
+    def execute(self, sql, parametros=()):
+        with metricas.medir("db_sentencia_segundos", (("sentencia", etiqueta_sentencia(sql)),)):
+            return super().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        with metricas.medir("db_sentencia_segundos", (("sentencia", etiqueta_sentencia(sql)),)):
+            return super().executemany(sql, parametros)
+
+
+# Escrituras confirmadas por la request en curso, para que IdempotenciaMiddleware
+# sepa si puede liberar la clave de una request que fallo. Es una lista que
+# comparten las copias del contexto (hilos de db_call y de los handlers sync)
+escrituras_request = contextvars.ContextVar("escrituras_request", default=None)
+
+
+def marcar_escritura():
+    escrituras = escrituras_request.get()
+    if escrituras is not None:
+        escrituras.append(True)
+
+
+class ConexionMedida(sqlite3.Connection):
+    def cursor(self, factory=CursorMedido):
+        return super().cursor(factory)
+
+    def commit(self):
+        # con el modo de transacciones implicito solo hay una abierta si hubo escrituras
+        escribio = self.in_transaction
+        super().commit()
+        if escribio:
+            marcar_escritura()
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+#pool de conexiones a la base de datos
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+DB_CACHE_KB = int(os.environ.get("DB_CACHE_KB", "16384"))
+DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+# NORMAL: con WAL solo hace fsync en los checkpoints; FULL: fsync en cada commit
+DB_SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL").upper()
+
+
+class ConnectionPool:
+    # Pool acotado de conexiones sqlite reutilizables dentro de cada worker.
+    # Las conexiones se abren bajo demanda hasta 'size' y se devuelven al pool
+    # al terminar cada request, asi no se repite la apertura del archivo ni el
+    # calentamiento del esquema y de la cache de paginas.
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self._libres = queue.LifoQueue(maxsize=size)
+        self._abiertas = 0
+        self._lock = threading.Lock()
+
+    def _abrir(self):
+        asegurar_esquema()
+        conn = sqlite3.connect(self.path, timeout=DB_POOL_TIMEOUT, check_same_thread=False, factory=ConexionMedida)
+        # WAL: los lectores no se bloquean mientras hay una escritura en curso
+        conn.execute("PRAGMA journal_mode=WAL")
+        # con WAL, NORMAL solo hace fsync en los checkpoints y sigue siendo seguro ante caidas del proceso
+        conn.execute("PRAGMA synchronous={}".format(DB_SYNCHRONOUS))
+        conn.execute("PRAGMA cache_size=-{}".format(DB_CACHE_KB))
+        conn.execute("PRAGMA mmap_size={}".format(DB_MMAP_SIZE))
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _tomar(self):
+        try:
+            return self._libres.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            crear = self._abiertas < self.size
+            if crear:
+                self._abiertas += 1
+        if crear:
+            try:
+                return self._abrir()
+            except Exception:
+                with self._lock:
+                    self._abiertas -= 1
+                raise
+
+        # Pool lleno: esperar a que se libere una conexion
+        try:
+            return self._libres.get(timeout=DB_POOL_TIMEOUT)
+        except queue.Empty:
+            raise HTTPException(status_code=503, detail="Base de datos ocupada, reintente")
+
+    def _devolver(self, conn):
+        # Nunca devolver al pool una conexion con una transaccion abierta
+        if conn.in_transaction:
+            conn.rollback()
+        self._libres.put_nowait(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self._tomar()
+        try:
+            yield conn
+        finally:
+            self._devolver(conn)
+
+    @contextmanager
+    def conexion_dedicada(self):
+        # Conexion fuera del pool para lecturas largas (exportaciones) que no
+        # deben retener una de las conexiones compartidas
+        conn = self._abrir()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def precalentar(self, cantidad):
+        # Abre de antemano hasta 'cantidad' conexiones, con el esquema ya leido,
+        # para que los primeros requests no paguen la apertura (ver ciclo_de_vida)
+        conexiones = []
+        try:
+            while len(conexiones) < min(cantidad, self.size):
+                conn = self._tomar()
+                conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
+                conexiones.append(conn)
+        finally:
+            for conn in conexiones:
+                self._devolver(conn)
+
+    def close(self):
+        # Cerrar las conexiones libres; las que esten en uso se reabren bajo demanda
+        while True:
+            try:
+                conn = self._libres.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._abiertas -= 1
+
+
+pool = ConnectionPool(db, DB_POOL_SIZE)
+
+
+@metricas.recolector
+def metricas_pool():
+    abiertas = pool._abiertas
+    libres = pool._libres.qsize()
+    return [("db_pool_conexiones", (("estado", "en_uso"),), abiertas - libres),
+            ("db_pool_conexiones", (("estado", "libre"),), libres),
+            ("proceso_pid", (), os.getpid())]
+
+# Hilos dedicados a la base de datos para los handlers async: sqlite3 es
+# bloqueante, asi que las consultas se ejecutan fuera del event loop
+db_executor = None
+
+
+def _get_db_executor():
+    global db_executor
+    if db_executor is None:
+        db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+    return db_executor
+
+
+def _ejecutar_con_conexion(fn, args, kwargs):
+    with pool.connection() as conn:
+        return fn(conn, *args, **kwargs)
+
+
+async def db_call(fn, *args, **kwargs):
+    # Ejecuta fn(conn, *args, **kwargs) en un hilo de la base de datos con una conexion del pool
+    loop = asyncio.get_running_loop()
+    # con el contexto de la request (ver escrituras_request)
+    return await loop.run_in_executor(_get_db_executor(), functools.partial(
+        contextvars.copy_context().run, _ejecutar_con_conexion, fn, args, kwargs))
+
+
+# Group commit (opcional, GRUPO_COMMIT=1): las altas de requests concurrentes se
+# encolan a un unico hilo escritor que las aplica en una sola transaccion, cada
+# una en su SAVEPOINT, y hace un solo commit (un solo fsync) por grupo. El grupo
+# se cierra a los GRUPO_COMMIT_MS milisegundos de la primera alta o al llegar a
+# GRUPO_COMMIT_MAX. Cada request recibe su propio resultado (lastrowid) o su
+# propia excepcion, y solo despues de que el commit del grupo termino. Si el
+# hilo escritor muere (por ejemplo no pudo abrir la conexion) falla las altas
+# encoladas y la siguiente crea otro; ninguna espera mas de GRUPO_COMMIT_ESPERA.
+GRUPO_COMMIT = os.environ.get("GRUPO_COMMIT", "0") == "1"
+GRUPO_COMMIT_MS = float(os.environ.get("GRUPO_COMMIT_MS", "2"))
+GRUPO_COMMIT_MAX = int(os.environ.get("GRUPO_COMMIT_MAX", "256"))
+GRUPO_COMMIT_ESPERA = float(os.environ.get("GRUPO_COMMIT_ESPERA", "30"))
+metricas.registrar("db_grupo_commits_total", "counter", "Transacciones del escritor de group commit")
+metricas.registrar("db_grupo_operaciones_total", "counter", "Altas aplicadas por el escritor de group commit")
+
+
+class EscritorAgrupado:
+    def __init__(self, espera, maximo):
+        self.espera = espera
+        self.maximo = maximo
+        self.cola = queue.Queue()
+        self.commits = 0
+        self.operaciones = 0
+        # 'activo' y la cola se tocan bajo el lock: lo que se encola antes de
+        # que el hilo muera lo falla el propio hilo, lo de despues ni entra
+        self._lock = threading.Lock()
+        self.activo = True
+        self.error = None
+        self._hilo = threading.Thread(target=self._bucle, name="db-escritor", daemon=True)
+        self._hilo.start()
+
+    def enviar(self, fn, *args):
+        # fn(cursor, *args) sin commit; devuelve un concurrent.futures.Future
+        futuro = concurrent.futures.Future()
+        with self._lock:
+            if not self.activo:
+                raise self._terminado()
+            self.cola.put((fn, args, futuro))
+        return futuro
+
+    def _tomar(self, lote, pedido):
+        # las altas canceladas mientras esperaban (request abortada o vencida)
+        # no se aplican; las tomadas ya no se pueden cancelar
+        if pedido[2].set_running_or_notify_cancel():
+            lote.append(pedido)
+
+    def _bucle(self):
+        conn = None
+        error = None
+        try:
+            conn = pool._abrir()
+            conn.isolation_level = None  # BEGIN/SAVEPOINT/COMMIT a mano
+            terminar = False
+            while not terminar:
+                pedido = self.cola.get()
+                if pedido is None:
+                    break
+                lote = []
+                self._tomar(lote, pedido)
+                limite = time.monotonic() + self.espera
+                while len(lote) < self.maximo:
+                    try:
+                        pedido = self.cola.get(timeout=max(limite - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if pedido is None:
+                        terminar = True
+                        break
+                    self._tomar(lote, pedido)
+                if lote:
+                    self._escribir(conn, lote)
+        except BaseException as e:
+            error = e
+            log.exception("el escritor de group commit termino con error")
+        finally:
+            self._terminar(error)
+            if conn is not None:
+                conn.close()
+
+    def _terminado(self):
+        error = RuntimeError("el escritor de group commit termino")
+        error.__cause__ = self.error
+        return error
+
+    def _terminar(self, error):
+        # nadie mas puede encolar; la proxima alta crea otro escritor
+        global escritor
+        with self._lock:
+            self.activo = False
+            self.error = error
+        with escritor_lock:
+            if escritor is self:
+                escritor = None
+        while True:
+            try:
+                pedido = self.cola.get_nowait()
+            except queue.Empty:
+                break
+            if pedido is not None and pedido[2].set_running_or_notify_cancel():
+                pedido[2].set_exception(self._terminado())
+
+    def _escribir(self, conn, lote):
+        resultados = []
+        c = conn.cursor()
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            for fn, args, _ in lote:
+                c.execute("SAVEPOINT alta")
+                try:
+                    resultados.append((True, fn(c, *args)))
+                except Exception as e:
+                    c.execute("ROLLBACK TO alta")
+                    resultados.append((False, e))
+                c.execute("RELEASE alta")
+            c.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for _, _, futuro in lote:
+                futuro.set_exception(e)
+            return
+        self.commits += 1
+        self.operaciones += len(lote)
+        for (_, _, futuro), (ok, resultado) in zip(lote, resultados):
+            if ok:
+                futuro.set_result(resultado)
+            else:
+                futuro.set_exception(resultado)
+
+    def cerrar(self):
+        # aplica lo que ya estaba encolado y termina el hilo
+        self.cola.put(None)
+        self._hilo.join()
+
+
+escritor = None
+escritor_lock = threading.Lock()
+
+
+def _get_escritor():
+    global escritor
+    with escritor_lock:
+        if escritor is None or not escritor.activo:
+            escritor = EscritorAgrupado(GRUPO_COMMIT_MS / 1000.0, GRUPO_COMMIT_MAX)
+        return escritor
+
+
+def _con_commit(conn, fn, args):
+    resultado = fn(conn.cursor(), *args)
+    conn.commit()
+    return resultado
+
+
+async def db_alta(fn, *args):
+    # Ejecuta fn(cursor, *args) y confirma: en el grupo del escritor si GRUPO_COMMIT
+    # esta activo, si no en su propia transaccion con una conexion del pool
+    if GRUPO_COMMIT:
+        futuro = _get_escritor().enviar(fn, *args)
+        try:
+            resultado = await asyncio.wait_for(asyncio.wrap_future(futuro), GRUPO_COMMIT_ESPERA)
+        except asyncio.TimeoutError:
+            # si el escritor ya la habia tomado se puede confirmar igual: para
+            # Idempotency-Key cuenta como escrita y no se vuelve a ejecutar
+            if not futuro.cancelled():
+                marcar_escritura()
+            raise
+        # el commit lo hizo el hilo escritor, fuera del contexto de la request
+        marcar_escritura()
+        return resultado
+    return await db_call(_con_commit, fn, args)
+
+
+@metricas.recolector
+def metricas_escritor():
+    if escritor is None:
+        return []
+    return [("db_grupo_commits_total", (), escritor.commits), ("db_grupo_operaciones_total", (), escritor.operaciones)]
+
+
+# Version de cambios por tabla, incrementada por cada alta, modificacion o baja.
+# Con ella se arman ETags fuertes para los GET: si el cliente ya tiene la
+# version actual se responde 304 sin consultar la base ni serializar nada.
+class VersionesTablas:
+    # Contadores de version por tabla compartidos entre los workers de gunicorn
+    # a traves de un archivo mapeado en memoria junto a la base. Cada escritura
+    # incrementa el contador bajo un flock y cada worker lo lee sin consultar la
+    # base, asi los ETags coinciden entre workers y las caches en memoria de un
+    # worker se enteran de los cambios hechos por los demas.
+    # Formato: cabecera (magia, instancia) + (version, modificado) por tabla.
+    MAGIA = b"PADELVR1"
+
+    def __init__(self, tablas, archivo=None):
+        self._lock = threading.Lock()
+        self.tablas = tuple(tablas)
+        self.archivo = archivo
+        self._pid = None
+        self._mapa = None
+        self._fd = None
+        # sin archivo compartido (o sin fcntl) los contadores son locales al proceso
+        self.instancia = os.urandom(4).hex()
+        self.versiones = dict.fromkeys(self.tablas, 0)
+        self.modificado = dict.fromkeys(self.tablas, int(time.time()))
+
+    def _abrir(self):
+        # se abre una vez por proceso: despues de un fork el flock del padre no
+        # excluye a los hijos porque comparten la descripcion del archivo
+        if self.archivo is None or fcntl is None:
+            return None
+        if self._pid == os.getpid():
+            return self._mapa
+        tamano = 16 + 16 * len(self.tablas)
+        fd = os.open(self.archivo, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                cabecera = os.pread(fd, tamano, 0)
+                if len(cabecera) < tamano or cabecera[:8] != self.MAGIA:
+                    # archivo nuevo o de otra version: se reinicia con otra instancia
+                    ahora = int(time.time())
+                    contenido = self.MAGIA + os.urandom(8) + struct.pack("<" + "QQ" * len(self.tablas), *([0, ahora] * len(self.tablas)))
+                    os.ftruncate(fd, tamano)
+                    os.pwrite(fd, contenido, 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            mapa = mmap.mmap(fd, tamano)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd, self._mapa, self._pid = fd, mapa, os.getpid()
+        self.instancia = mapa[8:16].hex()
+        return mapa
+
+    def _offset(self, tabla):
+        return 16 + 16 * self.tablas.index(tabla)
+
+    def incrementar(self, tabla):
+        # devuelve la nueva version de la tabla
+        with self._lock:
+            mapa = self._abrir()
+            ahora = int(time.time())
+            if mapa is None:
+                self.versiones[tabla] += 1
+                self.modificado[tabla] = ahora
+                return self.versiones[tabla]
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                offset = self._offset(tabla)
+                nueva = struct.unpack_from("<Q", mapa, offset)[0] + 1
+                struct.pack_into("<QQ", mapa, offset, nueva, ahora)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            return nueva
+
+    def _leer(self, tablas):
+        # [(version, modificado)] de cada tabla
+        mapa = self._abrir()
+        if mapa is None:
+            return [(self.versiones[tabla], self.modificado[tabla]) for tabla in tablas]
+        fcntl.flock(self._fd, fcntl.LOCK_SH)
+        try:
+            return [struct.unpack_from("<QQ", mapa, self._offset(tabla)) for tabla in tablas]
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def version(self, tabla):
+        with self._lock:
+            return self._leer((tabla,))[0][0]
+
+    def validadores(self, tablas, extra=""):
+        # (etag, ultima modificacion) para una respuesta que depende de 'tablas'
+        with self._lock:
+            leidas = self._leer(tablas)
+            instancia = self.instancia
+        version = "-".join(str(numero) for numero, _ in leidas)
+        modificado = max(momento for _, momento in leidas)
+        return '"{}-{}{}"'.format(instancia, version, extra), modificado
+
+    def close(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                self._mapa.close()
+                os.close(self._fd)
+            self._pid = self._mapa = self._fd = None
+
+
+DB_VERSIONES = os.environ.get("DB_VERSIONES", db + "-versiones")
+versiones = VersionesTablas(("reservas", "recordatorios", "horarios", "canchas", "usuarios"), DB_VERSIONES or None)
+
+
+def validar_cache_http(request, tablas, extra=""):
+    # Devuelve (respuesta 304 o None, headers de validacion para la respuesta 200).
+    # 'extra' distingue respuestas distintas sobre las mismas tablas (filtros, ids)
+    etag, modificado = versiones.validadores(tablas, "-{:08x}".format(zlib.crc32(extra.encode("utf-8"))))
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(modificado, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etags = [valor.strip() for valor in if_none_match.split(",")]
+        if etag in etags or "*" in etags:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers), headers
+    else:
+        # If-Modified-Since solo se considera si no vino If-None-Match
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                desde = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                desde = None
+            # la resolucion es de segundos: si hubo cambios en el segundo actual no se responde 304
+            if desde is not None and modificado <= desde and modificado < int(time.time()):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers), headers
+    return None, headers
 
 version = "{sys.version_info.major}.{sys.version_info.minor}"
 
-app = FastAPI()
+# orjson serializa varias veces mas rapido que json de la libreria estandar
+app = FastAPI(default_response_class=ORJSONResponse)
 
 #origins = ["http://localhost:3000","https://padel-app-odwu.onrender.com,*"]
 origins = ["*"]
-# Add CORS middleware
+
+
+def endpoint_de(scope):
+    # Endpoint de la ruta que atenderia el request, para que MetricasMiddleware
+    # etiquete tambien las respuestas que un middleware da antes del router
+    for route in app.routes:
+        coincidencia, hijo = route.matches(scope)
+        if coincidencia == Match.FULL:
+            return hijo.get("endpoint")
+    return None
+
+
+class MetricasMiddleware:
+    # Middleware ASGI (sin BaseHTTPMiddleware, que no se lleva bien con las
+    # respuestas en streaming) que cuenta requests y mide latencias por ruta.
+    # La ruta es la plantilla ("/reservas/{id}"), no la URL, para acotar las series.
+    def __init__(self, app):
+        self.app = app
+        self._rutas = None
+
+    def ruta(self, scope):
+        # rutas por endpoint; si un endpoint atiende varias (get_horario_reserva)
+        # se busca entre ellas la que coincide, como en el router
+        if self._rutas is None:
+            self._rutas = {}
+            for route in app.routes:
+                if hasattr(route, "endpoint"):
+                    self._rutas.setdefault(route.endpoint, []).append(route)
+        rutas = self._rutas.get(scope.get("endpoint"))
+        if not rutas:
+            return "sin_ruta"
+        if len(rutas) == 1:
+            return rutas[0].path
+        for route in rutas:
+            if route.matches(scope)[0] == Match.FULL:
+                return route.path
+        return "sin_ruta"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        codigo = 500
+        inicio = time.perf_counter()
+
+        async def enviar(mensaje):
+            nonlocal codigo
+            if mensaje["type"] == "http.response.start":
+                codigo = mensaje["status"]
+            await send(mensaje)
+
+        metricas.incrementar("http_requests_en_curso")
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            metricas.incrementar("http_requests_en_curso", valor=-1)
+            ruta = self.ruta(scope)
+            metricas.observar("http_request_segundos", (("ruta", ruta),), time.perf_counter() - inicio)
+            metricas.incrementar("http_requests_total", (("ruta", ruta), ("metodo", scope["method"]), ("codigo", str(codigo))))
+
+
+# Idempotency-Key en las altas: la primera request con una clave la reclama en
+# la tabla idempotencia, se ejecuta y guarda su respuesta; las repeticiones con
+# la misma clave y el mismo cuerpo reciben la respuesta guardada sin volver a
+# validar ni escribir (con otro cuerpo: 422). Las repeticiones concurrentes
+# esperan a la primera: en el mismo worker con un future, entre workers
+# consultando la tabla, hasta IDEMPOTENCIA_ESPERA segundos (despues 409); ese
+# es tambien el tiempo que una clave queda tomada si el worker se cae a mitad.
+# Las respuestas 5xx no se guardan, asi el reintento se vuelve a ejecutar,
+# salvo que la request ya haya confirmado escrituras (escrituras_request): ahi
+# se guarda el error, porque reintentarla repetiria el alta.
+# Delante de la tabla hay un LRU con las ultimas IDEMPOTENCIA_LRU respuestas,
+# acotado a IDEMPOTENCIA_LRU_BYTES de cuerpos; las respuestas de mas de
+# IDEMPOTENCIA_LRU_CUERPO_MAX bytes (lotes grandes) se leen siempre de la tabla.
+IDEMPOTENCIA_RUTAS = {"/reservas", "/reservas/bulk", "/recordatorios"}
+IDEMPOTENCIA_TTL = float(os.environ.get("IDEMPOTENCIA_TTL", "86400"))
+IDEMPOTENCIA_LRU = int(os.environ.get("IDEMPOTENCIA_LRU", "10000"))
+IDEMPOTENCIA_LRU_BYTES = int(os.environ.get("IDEMPOTENCIA_LRU_BYTES", str(16 * 1024 * 1024)))
+IDEMPOTENCIA_LRU_CUERPO_MAX = int(os.environ.get("IDEMPOTENCIA_LRU_CUERPO_MAX", str(16 * 1024)))
+IDEMPOTENCIA_ESPERA = float(os.environ.get("IDEMPOTENCIA_ESPERA", "30"))
+IDEMPOTENCIA_SONDEO = 0.05
+IDEMPOTENCIA_PURGA = 60.0
+IDEMPOTENCIA_CLAVE_MAX = 255
+
+
+def reclamar_idempotencia(conn, clave, huella):
+    # None si la clave quedo reclamada para esta request; si no, la fila existente
+    ahora = time.time()
+    c = conn.cursor()
+    c.execute("""INSERT INTO idempotencia (clave, huella, expira) VALUES (?, ?, ?)
+                 ON CONFLICT (clave) DO UPDATE SET huella = excluded.huella, codigo = NULL, headers = NULL,
+                                                   cuerpo = NULL, expira = excluded.expira
+                 WHERE idempotencia.expira < ?""", (clave, huella, ahora + IDEMPOTENCIA_ESPERA, ahora))
+    fila = None
+    if c.rowcount != 1:
+        c.execute("SELECT huella, codigo, headers, cuerpo, expira FROM idempotencia WHERE clave = ?", (clave,))
+        fila = c.fetchone()
+    conn.commit()
+    return fila
+
+
+def guardar_idempotencia(conn, clave, codigo, headers, cuerpo, expira, purgar):
+    c = conn.cursor()
+    c.execute("UPDATE idempotencia SET codigo = ?, headers = ?, cuerpo = ?, expira = ? WHERE clave = ?",
+              (codigo, headers, cuerpo, expira, clave))
+    if purgar:
+        c.execute("DELETE FROM idempotencia WHERE expira < ?", (time.time(),))
+    conn.commit()
+
+
+def liberar_idempotencia(conn, clave):
+    conn.execute("DELETE FROM idempotencia WHERE clave = ? AND codigo IS NULL", (clave,))
+    conn.commit()
+
+
+class IdempotenciaMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.recientes = OrderedDict()  # clave -> (huella, codigo, headers, cuerpo, expira)
+        self.bytes_recientes = 0  # suma de los cuerpos en 'recientes'
+        self.en_vuelo = {}  # clave -> future que se completa cuando termina la primera request
+        self.proxima_purga = 0.0
+
+    def recordar(self, clave, guardada):
+        self.olvidar(clave)
+        if len(guardada[3]) > IDEMPOTENCIA_LRU_CUERPO_MAX:
+            return
+        self.recientes[clave] = guardada
+        self.bytes_recientes += len(guardada[3])
+        while len(self.recientes) > IDEMPOTENCIA_LRU or self.bytes_recientes > IDEMPOTENCIA_LRU_BYTES:
+            _, vieja = self.recientes.popitem(last=False)
+            self.bytes_recientes -= len(vieja[3])
+
+    def olvidar(self, clave):
+        guardada = self.recientes.pop(clave, None)
+        if guardada is not None:
+            self.bytes_recientes -= len(guardada[3])
+
+    async def respuesta_guardada(self, clave, huella):
+        # Devuelve la respuesta guardada, None si esta request reclamo la clave
+        # o False si se agoto la espera a la primera
+        limite = time.monotonic() + IDEMPOTENCIA_ESPERA
+        while True:
+            guardada = self.recientes.get(clave)
+            if guardada is not None:
+                if guardada[4] > time.time():
+                    self.recientes.move_to_end(clave)
+                    return guardada
+                self.olvidar(clave)
+            futuro = self.en_vuelo.get(clave)
+            if futuro is not None:
+                await asyncio.wait((futuro,), timeout=max(limite - time.monotonic(), 0))
+                if not futuro.done():
+                    return False
+                continue
+            fila = await db_call(reclamar_idempotencia, clave, huella)
+            if fila is None:
+                return None
+            if fila[1] is not None:
+                guardada = (fila[0], fila[1], orjson.loads(fila[2]), fila[3], fila[4])
+                self.recordar(clave, guardada)
+                return guardada
+            # la primera request esta en curso en otro worker
+            if fila[0] != huella:
+                return fila  # con otra huella: el llamador responde 422
+            if time.monotonic() >= limite:
+                return False
+            await asyncio.sleep(IDEMPOTENCIA_SONDEO)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in IDEMPOTENCIA_RUTAS:
+            await self.app(scope, receive, send)
+            return
+        clave_cliente = dict(scope["headers"]).get(b"idempotency-key")
+        if clave_cliente is None:
+            await self.app(scope, receive, send)
+            return
+        if not clave_cliente.strip() or len(clave_cliente) > IDEMPOTENCIA_CLAVE_MAX:
+            await responder_json(send, status.HTTP_400_BAD_REQUEST, {"detail": "Idempotency-Key invalida"})
+            return
+
+        partes = []
+        while True:
+            mensaje = await receive()
+            partes.append(mensaje.get("body", b""))
+            if not mensaje.get("more_body"):
+                break
+        cuerpo = b"".join(partes)
+        clave = hashlib.sha256(scope["path"].encode("utf-8") + b"\0" + clave_cliente).digest()[:16]
+        huella = hashlib.sha256(cuerpo).digest()[:16]
+
+        guardada = await self.respuesta_guardada(clave, huella)
+        if guardada is False:
+            metricas.incrementar("idempotencia_total", (("resultado", "conflicto"),))
+            await responder_json(send, status.HTTP_409_CONFLICT, {"detail": "Hay una request en curso con la misma Idempotency-Key"},
+                                 [(b"retry-after", b"1")])
+            return
+        if guardada is not None and guardada[0] != huella:
+            metricas.incrementar("idempotencia_total", (("resultado", "cuerpo_distinto"),))
+            await responder_json(send, status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                 {"detail": "Idempotency-Key ya usada con otro cuerpo"})
+            return
+        if guardada is not None:
+            metricas.incrementar("idempotencia_total", (("resultado", "repetida"),))
+            scope["endpoint"] = endpoint_de(scope)
+            headers = [(nombre.encode("latin-1"), valor.encode("latin-1")) for nombre, valor in guardada[2]]
+            await send({"type": "http.response.start", "status": guardada[1],
+                        "headers": headers + [(b"idempotent-replayed", b"true")]})
+            await send({"type": "http.response.body", "body": guardada[3]})
+            return
+
+        metricas.incrementar("idempotencia_total", (("resultado", "nueva"),))
+        self.en_vuelo[clave] = futuro = asyncio.get_running_loop().create_future()
+        leido = False
+
+        async def recibir():
+            nonlocal leido
+            if not leido:
+                leido = True
+                return {"type": "http.request", "body": cuerpo, "more_body": False}
+            return await receive()
+
+        inicio, respuesta = None, []
+
+        async def enviar(mensaje):
+            nonlocal inicio
+            if mensaje["type"] == "http.response.start":
+                inicio = mensaje
+            else:
+                respuesta.append(mensaje.get("body", b""))
+            await send(mensaje)
+
+        guardada, guardado, escrituras = None, False, []
+        token = escrituras_request.set(escrituras)
+        try:
+            try:
+                await self.app(scope, recibir, enviar)
+            except Exception:
+                if escrituras and inicio is None:
+                    # la respuesta que arma ServerErrorMiddleware
+                    inicio = {"status": 500, "headers": [(b"content-type", b"text/plain; charset=utf-8")]}
+                    respuesta[:] = [b"Internal Server Error"]
+                raise
+            finally:
+                escrituras_request.reset(token)
+                if inicio is not None and (inicio["status"] < 500 or escrituras):
+                    headers = [(nombre.decode("latin-1"), valor.decode("latin-1")) for nombre, valor in inicio.get("headers", ())]
+                    guardada = (huella, inicio["status"], headers, b"".join(respuesta), time.time() + IDEMPOTENCIA_TTL)
+                    purgar = time.monotonic() >= self.proxima_purga
+                    if purgar:
+                        self.proxima_purga = time.monotonic() + IDEMPOTENCIA_PURGA
+                    await db_call(guardar_idempotencia, clave, guardada[1], orjson.dumps(headers), guardada[3], guardada[4], purgar)
+                    guardado = True
+                    self.recordar(clave, guardada)
+        finally:
+            del self.en_vuelo[clave]
+            futuro.set_result(None)
+            if not guardado:
+                await db_call(liberar_idempotencia, clave)
+
+
+async def responder_json(send, codigo, cuerpo, headers=()):
+    await send({"type": "http.response.start", "status": codigo,
+                "headers": [(b"content-type", b"application/json")] + list(headers)})
+    await send({"type": "http.response.body", "body": orjson.dumps(cuerpo)})
+
+
+# Limites por cliente y admision a las rutas costosas. Cada regla es un token
+# bucket por (regla, cliente): 'tasa' requests por segundo con rafagas de hasta
+# 'rafaga'; sin tokens se responde 429 con el Retry-After hasta el proximo. Las
+# cubetas viven en un archivo mapeado en memoria compartido por los workers
+# (LIMITES_ARCHIVO; vacio: cada worker las suyas). El cliente es el valor de
+# LIMITE_CLIENTE_HEADER que completa un proxy propio (x-forwarded-for,
+# x-usuario-id, ...) o, sin header, la ip de la conexion. De una lista como la de
+# x-forwarded-for se toma el salto que agrego el primero de los LIMITE_PROXIES
+# proxies confiables contando desde la derecha: los de la izquierda los puede
+# poner el cliente. Detras de un proxy la ip de la conexion es la del proxy y
+# todos compartirian la cubeta, por eso sin LIMITE_CLIENTE_HEADER las reglas
+# vienen desactivadas (se activan poniendo LIMITE_ALTAS / LIMITE_CONSULTAS si la
+# app atiende directo a los clientes). Aparte, cada worker atiende a lo sumo
+# LIMITE_CONCURRENCIA requests a /horariosreservas a la vez; las demas esperan
+# en una cola de LIMITE_COLA lugares hasta LIMITE_COLA_ESPERA segundos y, con la
+# cola llena o agotada la espera, reciben 429. Los exports, que duran mucho mas,
+# tienen sus propios lugares (LIMITE_EXPORTS_CONCURRENCIA y LIMITE_EXPORTS_COLA)
+# para que unas pocas descargas no dejen sin lugar a las consultas.
+def leer_limite(variable, defecto):
+    # "tasa:rafaga"; vacio o 0 desactiva la regla
+    valor = os.environ.get(variable, defecto).strip()
+    if not valor or valor == "0":
+        return None
+    tasa, _, rafaga = valor.partition(":")
+    return float(tasa), float(rafaga or tasa)
+
+
+LIMITE_CLIENTE_HEADER = os.environ.get("LIMITE_CLIENTE_HEADER", "").lower().encode("latin-1")
+LIMITE_PROXIES = max(1, int(os.environ.get("LIMITE_PROXIES", "1")))
+# (nombre, metodo, prefijos de las rutas, (tasa, rafaga))
+REGLAS_LIMITE = [regla for regla in (
+    ("altas", "POST", ("/reservas", "/recordatorios"), leer_limite("LIMITE_ALTAS", "2:10" if LIMITE_CLIENTE_HEADER else "0")),
+    ("consultas", "GET", ("/horariosreservas", "/disponibilidad"), leer_limite("LIMITE_CONSULTAS", "10:30" if LIMITE_CLIENTE_HEADER else "0")),
+) if regla[3] is not None]
+LIMITES_ARCHIVO = os.environ.get("LIMITES_ARCHIVO", db + "-limites")
+LIMITES_CUBETAS = int(os.environ.get("LIMITES_CUBETAS", "4096"))
+LIMITE_CONCURRENCIA = int(os.environ.get("LIMITE_CONCURRENCIA", "8"))
+LIMITE_COLA = int(os.environ.get("LIMITE_COLA", "64"))
+LIMITE_COLA_ESPERA = float(os.environ.get("LIMITE_COLA_ESPERA", "5"))
+LIMITE_EXPORTS_CONCURRENCIA = int(os.environ.get("LIMITE_EXPORTS_CONCURRENCIA", "2"))
+LIMITE_EXPORTS_COLA = int(os.environ.get("LIMITE_EXPORTS_COLA", "8"))
+
+
+class CubetasTokens:
+    # Tabla hash de tamano fijo con sondeo lineal, en un archivo mapeado en
+    # memoria como VersionesTablas. Si no hay lugar se reemplaza la cubeta usada
+    # hace mas tiempo, que a esa altura normalmente ya se volvio a llenar.
+    # Formato: magia + (hash de la clave, tokens, ultimo uso) por cubeta.
+    MAGIA = b"PADELRL1"
+    CUBETA = struct.Struct("<Qdd")
+    SONDEO = 8
+
+    def __init__(self, cubetas, archivo=None):
+        self._lock = threading.Lock()
+        self.cubetas = cubetas
+        self.archivo = archivo
+        self._pid = None
+        self._mapa = None
+        self._fd = None
+        self._local = None
+
+    def _abrir(self):
+        # se abre una vez por proceso, por el mismo motivo que en VersionesTablas
+        if self.archivo is None or fcntl is None:
+            if self._local is None:
+                self._local = bytearray(8 + self.CUBETA.size * self.cubetas)
+            return self._local
+        if self._pid == os.getpid():
+            return self._mapa
+        tamano = 8 + self.CUBETA.size * self.cubetas
+        fd = os.open(self.archivo, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size != tamano or os.pread(fd, 8, 0) != self.MAGIA:
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, tamano)
+                    os.pwrite(fd, self.MAGIA, 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            mapa = mmap.mmap(fd, tamano)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd, self._mapa, self._pid = fd, mapa, os.getpid()
+        return mapa
+
+    def tomar(self, clave, tasa, rafaga):
+        # Consume un token de la cubeta de 'clave' (bytes). Devuelve 0 si habia,
+        # o los segundos que faltan para el proximo
+        hash_clave = int.from_bytes(hashlib.blake2b(clave, digest_size=8).digest(), "little") or 1
+        ahora = time.time()
+        with self._lock:
+            mapa = self._abrir()
+            if mapa is self._mapa:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                inicio = hash_clave % self.cubetas
+                offset = None
+                for i in range(min(self.SONDEO, self.cubetas)):
+                    candidato = 8 + self.CUBETA.size * ((inicio + i) % self.cubetas)
+                    hash_cubeta, tokens, ultimo = self.CUBETA.unpack_from(mapa, candidato)
+                    if hash_cubeta == hash_clave:
+                        offset = candidato
+                        tokens = min(rafaga, tokens + (ahora - ultimo) * tasa)
+                        break
+                    if offset is None or ultimo < mas_vieja:
+                        offset, mas_vieja = candidato, ultimo
+                else:
+                    # clave nueva: cubeta llena
+                    tokens = rafaga
+                if tokens >= 1:
+                    tokens -= 1
+                    espera = 0.0
+                else:
+                    espera = (1 - tokens) / tasa
+                self.CUBETA.pack_into(mapa, offset, hash_clave, tokens, ahora)
+            finally:
+                if mapa is self._mapa:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return espera
+
+    def close(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                self._mapa.close()
+                os.close(self._fd)
+            self._pid = self._mapa = self._fd = None
+
+
+class AdmisionConcurrente:
+    # Semaforo con cola acotada y espera maxima (por worker, en el event loop)
+    def __init__(self, limite, cola, espera):
+        self.limite = limite
+        self.cola = cola
+        self.espera = espera
+        self.en_curso = 0
+        self.esperando = deque()
+
+    async def entrar(self):
+        # True si consiguio lugar
+        if self.en_curso < self.limite and not self.esperando:
+            self.en_curso += 1
+            return True
+        if len(self.esperando) >= self.cola:
+            return False
+        turno = asyncio.get_running_loop().create_future()
+        self.esperando.append(turno)
+        try:
+            await asyncio.wait((turno,), timeout=self.espera)
+        except asyncio.CancelledError:
+            if turno.done():
+                self.salir()  # el lugar ya se lo habian pasado
+            else:
+                turno.cancel()
+                self.esperando.remove(turno)
+            raise
+        if turno.done():
+            return True
+        turno.cancel()
+        self.esperando.remove(turno)
+        return False
+
+    def salir(self):
+        # el lugar pasa directo al primero de la cola
+        while self.esperando:
+            turno = self.esperando.popleft()
+            if not turno.done():
+                turno.set_result(None)
+                return
+        self.en_curso -= 1
+
+
+cubetas = CubetasTokens(LIMITES_CUBETAS, LIMITES_ARCHIVO or None)
+# (clase, prefijos de las rutas, admision); un limite <= 0 desactiva la clase
+RUTAS_COSTOSAS = [(clase, prefijos, AdmisionConcurrente(limite, cola, LIMITE_COLA_ESPERA)) for clase, prefijos, limite, cola in (
+    ("horariosreservas", ("/horariosreservas",), LIMITE_CONCURRENCIA, LIMITE_COLA),
+    ("exports", ("/reservas/export", "/recordatorios/export"), LIMITE_EXPORTS_CONCURRENCIA, LIMITE_EXPORTS_COLA),
+) if limite > 0]
+
+
+def cliente_de(scope):
+    if LIMITE_CLIENTE_HEADER:
+        valor = dict(scope["headers"]).get(LIMITE_CLIENTE_HEADER)
+        if valor:
+            saltos = valor.split(b",")
+            return saltos[-min(LIMITE_PROXIES, len(saltos))].strip()
+    return scope["client"][0].encode("latin-1") if scope.get("client") else b"-"
+
+
+class LimitesMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def rechazar(self, scope, send, regla, motivo, espera):
+        metricas.incrementar("limites_rechazos_total", (("regla", regla), ("motivo", motivo)))
+        scope["endpoint"] = endpoint_de(scope)
+        await responder_json(send, status.HTTP_429_TOO_MANY_REQUESTS, {"detail": "Demasiadas requests, reintentar mas tarde"},
+                             [(b"retry-after", str(max(1, int(-(-espera // 1)))).encode("latin-1"))])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        metodo, path = scope["method"], scope["path"]
+        for nombre, metodo_regla, prefijos, (tasa, rafaga) in REGLAS_LIMITE:
+            if metodo == metodo_regla and path.startswith(prefijos):
+                espera = cubetas.tomar(nombre.encode("latin-1") + b"|" + cliente_de(scope), tasa, rafaga)
+                if espera:
+                    await self.rechazar(scope, send, nombre, "tasa", espera)
+                    return
+                break
+        admision = None
+        if metodo == "GET":
+            for clase, prefijos, admision_clase in RUTAS_COSTOSAS:
+                if path.startswith(prefijos):
+                    admision = admision_clase
+                    break
+        if admision is None:
+            await self.app(scope, receive, send)
+            return
+        if not await admision.entrar():
+            await self.rechazar(scope, send, clase, "concurrencia", 1)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admision.salir()
+
+
+@metricas.recolector
+def metricas_limites():
+    muestras = []
+    for clase, _, admision in RUTAS_COSTOSAS:
+        muestras.append(("limites_costosas", (("clase", clase), ("estado", "en_curso")), admision.en_curso))
+        muestras.append(("limites_costosas", (("clase", clase), ("estado", "en_cola")), len(admision.esperando)))
+    return muestras
+
+
+app.add_middleware(IdempotenciaMiddleware)
+app.add_middleware(LimitesMiddleware)
+app.add_middleware(MetricasMiddleware)
+# Add CORS middleware. Va ultimo para quedar por fuera de los demas: los 429,
+# 409, 422 y 400 que responden ellos tambien llevan Access-Control-Allow-Origin.
 app.add_middleware(
     CORSMiddleware,
     allow_origins= origins,  # Origins allowed to access the backend
@@ -44,6 +1220,35 @@ app.add_middleware(
 )
 
 
+def iniciar_logging():
+    if log_listener._thread is None:
+        log_listener.start()
+
+
+def detener_logging():
+    # vacia la cola pendiente antes de terminar
+    if log_listener._thread is not None:
+        log_listener.stop()
+
+
+def cerrar_pool():
+    global db_executor, escritor
+    if escritor is not None:
+        escritor.cerrar()
+        escritor = None
+    if db_executor is not None:
+        db_executor.shutdown(wait=True)
+        db_executor = None
+    pool.close()
+    versiones.close()
+    cubetas.close()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(metricas.exportar(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 async def read_root():
     message = "Hello world! From FastAPI running on Uvicorn with Gunicorn. Using Python {version}"
@@ -66,6 +1271,11 @@ class Recordatorio(BaseModel):
     def validate_fecha(cls, v):
         if not cls.fecha_pattern.match(v):
             raise ValueError("Fecha invalida. Usa el formato YYYY-MM-DD.")
+        # el formato no alcanza: 2024-02-30 o 2024-13-10 no son fechas
+        try:
+            datetime.strptime(v, "%Y-%m-%d")
+        except ValueError:
+            raise ValueError("Fecha invalida. No existe ese dia.")
         return v
 
     @validator("hora")
@@ -82,12 +1292,14 @@ class Reserva(BaseModel):
     descripcion: str
     num_personas: int
 
+# Reserva con su ID, para las modificaciones en lote
+class ReservaActualizacion(Reserva):
+    reserva_id: int
 
-# Conectar a la base de datos y crear la tabla si no existe
-def init_db():
-    conn = sqlite3.connect(db)
-    c = conn.cursor() 
-    
+
+# Migraciones del esquema. La version aplicada se guarda en PRAGMA user_version;
+# cada funcion lleva el esquema de la version n-1 a la n y se ejecuta una sola vez
+def migracion_1(c):
     #creacion tabla recordatorios
     c.execute('''
               CREATE TABLE IF NOT EXISTS recordatorios
@@ -108,14 +1320,274 @@ def init_db():
               descripcion TEXT,
               num_personas INTEGER)
               ''')
-    conn.commit()
-    conn.close()
 
-init_db()
+
+def migracion_2(c):
+    # horario_id pasa de DATETIME a INTEGER (sqlite no permite cambiar el tipo
+    # de una columna, hay que reconstruir la tabla) y se agregan los indices
+    # para los accesos por horario, cancha y usuario
+    c.execute("SELECT seq FROM sqlite_sequence WHERE name = 'reservas'")
+    secuencia = c.fetchone()
+    c.execute('''
+              CREATE TABLE reservas_nueva
+              (reserva_id INTEGER PRIMARY KEY AUTOINCREMENT,
+              cancha_id INTEGER,
+              usuario_id INTEGER,
+              horario_id INTEGER,
+              descripcion TEXT,
+              num_personas INTEGER)
+              ''')
+    c.execute('''
+              INSERT INTO reservas_nueva (reserva_id, cancha_id, usuario_id, horario_id, descripcion, num_personas)
+              SELECT reserva_id, cancha_id, usuario_id, CAST(horario_id AS INTEGER), descripcion, num_personas FROM reservas
+              ''')
+    c.execute("DROP TABLE reservas")
+    c.execute("ALTER TABLE reservas_nueva RENAME TO reservas")
+    # conservar el ultimo id asignado para no reutilizar ids de reservas borradas
+    if secuencia:
+        c.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = 'reservas'", secuencia)
+    c.execute("CREATE INDEX idx_reservas_horario_cancha ON reservas (horario_id, cancha_id)")
+    c.execute("CREATE INDEX idx_reservas_cancha_horario ON reservas (cancha_id, horario_id)")
+    c.execute("CREATE INDEX idx_reservas_usuario ON reservas (usuario_id)")
+
+
+def migracion_3(c):
+    # Un turno (horario_id, cancha_id) admite una sola reserva. Las reservas
+    # duplicadas existentes (todas menos la primera de cada turno) se mueven a
+    # reservas_duplicadas para poder crear el indice unico sin perder datos
+    c.execute('''
+              CREATE TABLE reservas_duplicadas
+              (reserva_id INTEGER PRIMARY KEY,
+              cancha_id INTEGER,
+              usuario_id INTEGER,
+              horario_id INTEGER,
+              descripcion TEXT,
+              num_personas INTEGER)
+              ''')
+    c.execute('''
+              INSERT INTO reservas_duplicadas
+              SELECT reserva_id, cancha_id, usuario_id, horario_id, descripcion, num_personas FROM reservas r
+              WHERE EXISTS (SELECT 1 FROM reservas o
+                            WHERE o.horario_id = r.horario_id AND o.cancha_id = r.cancha_id AND o.reserva_id < r.reserva_id)
+              ''')
+    c.execute("DELETE FROM reservas WHERE reserva_id IN (SELECT reserva_id FROM reservas_duplicadas)")
+    c.execute("DROP INDEX idx_reservas_horario_cancha")
+    c.execute("CREATE UNIQUE INDEX ux_reservas_horario_cancha ON reservas (horario_id, cancha_id)")
+
+
+def migracion_4(c):
+    # Espejo local de los catalogos de la api externa (ver CatalogoCache).
+    # 'orden' conserva el orden de upstream y 'datos' el item completo en JSON
+    c.execute("CREATE TABLE horarios (horario_id INTEGER PRIMARY KEY, orden INTEGER NOT NULL, fecha TEXT, hora TEXT, datos TEXT NOT NULL)")
+    c.execute("CREATE INDEX idx_horarios_orden ON horarios (orden)")
+    c.execute("CREATE INDEX idx_horarios_fecha ON horarios (fecha)")
+    c.execute("CREATE TABLE canchas (cancha_id INTEGER PRIMARY KEY, orden INTEGER NOT NULL, datos TEXT NOT NULL)")
+    c.execute("CREATE TABLE usuarios (usuario_id INTEGER PRIMARY KEY, orden INTEGER NOT NULL, nombre TEXT, apellido TEXT, datos TEXT NOT NULL)")
+    # estado de la sincronizacion de cada recurso upstream
+    c.execute("""CREATE TABLE sincronizacion (
+                    recurso TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    actualizado REAL,
+                    error TEXT,
+                    proxima REAL NOT NULL DEFAULT 0)""")
+
+
+# Vencimiento normalizado de un recordatorio: segundos desde 1970 de fecha + hora
+# tomadas como hora local (sin zona); la zona se aplica al compararlo con la hora
+# actual (ver ahora_recordatorios). Lo calculan triggers, asi vale tambien para
+# las filas que se escriben sin pasar por la app
+VENCE_EN_SQL = "CAST(strftime('%s', {0}.fecha || ' ' || {0}.hora) AS INTEGER)"
+
+
+def migracion_5(c):
+    # vence_en y disparado para el programador de recordatorios; el indice
+    # parcial solo contiene los pendientes, ordenados por vencimiento
+    c.execute("ALTER TABLE recordatorios ADD COLUMN vence_en INTEGER")
+    c.execute("ALTER TABLE recordatorios ADD COLUMN disparado REAL")
+    c.execute("UPDATE recordatorios SET vence_en = " + VENCE_EN_SQL.format("recordatorios"))
+    c.execute("CREATE INDEX idx_recordatorios_pendientes ON recordatorios (vence_en) WHERE disparado IS NULL")
+    c.execute("""CREATE TRIGGER recordatorios_vence_en_alta AFTER INSERT ON recordatorios
+                 BEGIN
+                     UPDATE recordatorios SET vence_en = {} WHERE id = NEW.id;
+                 END""".format(VENCE_EN_SQL.format("NEW")))
+    # al cambiar la fecha o la hora el recordatorio vuelve a quedar pendiente
+    c.execute("""CREATE TRIGGER recordatorios_vence_en_cambio AFTER UPDATE OF fecha, hora ON recordatorios
+                 BEGIN
+                     UPDATE recordatorios SET vence_en = {}, disparado = NULL WHERE id = NEW.id;
+                 END""".format(VENCE_EN_SQL.format("NEW")))
+
+
+def migracion_6(c):
+    # Claves de idempotencia (ver IdempotenciaMiddleware): clave y huella son
+    # hashes truncados a 16 bytes; codigo NULL = la primera request sigue en curso
+    c.execute("""CREATE TABLE idempotencia (
+                    clave BLOB PRIMARY KEY,
+                    huella BLOB NOT NULL,
+                    codigo INTEGER,
+                    headers BLOB,
+                    cuerpo BLOB,
+                    expira REAL NOT NULL) WITHOUT ROWID""")
+    c.execute("CREATE INDEX idx_idempotencia_expira ON idempotencia (expira)")
+
+
+# Resumenes de reservas para GET /estadisticas, por cancha y dia, por usuario y
+# dia y por horario. Los mantienen triggers sobre reservas (altas, bajas y
+# modificaciones, por cualquier camino) y sobre el espejo de horarios: si un
+# horario aparece, cambia de fecha o desaparece, sus reservas se mueven de dia.
+# El dia de una reserva es la fecha de su horario ('' si no esta en el espejo).
+FECHA_RESERVA_SQL = "COALESCE((SELECT fecha FROM horarios WHERE horario_id = {0}.horario_id), '')"
+RESUMENES_POR_DIA = (("estadisticas_cancha", "cancha_id"), ("estadisticas_usuario", "usuario_id"))
+
+
+def sql_sumar_reserva(fila):
+    # sentencias que suman la reserva NEW a los resumenes
+    # (las filas sin la columna del grupo, escritas por fuera de la app, no se cuentan)
+    sentencias = []
+    for tabla, columna in RESUMENES_POR_DIA + (("estadisticas_horario", "horario_id"),):
+        fecha = "" if tabla == "estadisticas_horario" else "fecha, "
+        sentencias.append("""INSERT INTO {0} ({1}, {3}reservas, personas) SELECT {2}.{1}, {4}1, COALESCE({2}.num_personas, 0)
+                             WHERE {2}.{1} IS NOT NULL
+                             ON CONFLICT DO UPDATE SET reservas = reservas + 1, personas = personas + excluded.personas""".format(
+            tabla, columna, fila, fecha, fecha and FECHA_RESERVA_SQL.format(fila) + ", "))
+    return sentencias
+
+
+def sql_restar_reserva(fila):
+    # sentencias que restan la reserva OLD; los grupos que quedan en cero se borran
+    sentencias = []
+    for tabla, columna in RESUMENES_POR_DIA + (("estadisticas_horario", "horario_id"),):
+        condicion = "{1} = {2}.{1}".format(tabla, columna, fila)
+        if tabla != "estadisticas_horario":
+            condicion += " AND fecha = " + FECHA_RESERVA_SQL.format(fila)
+        sentencias.append("UPDATE {} SET reservas = reservas - 1, personas = personas - COALESCE({}.num_personas, 0) WHERE {}"
+                          .format(tabla, fila, condicion))
+        sentencias.append("DELETE FROM {} WHERE {} AND reservas = 0".format(tabla, condicion))
+    return sentencias
+
+
+def sql_mover_horario(horario_id, desde, hacia):
+    # sentencias que pasan las reservas de un horario del dia 'desde' al dia 'hacia'
+    sentencias = []
+    for tabla, columna in RESUMENES_POR_DIA:
+        de_la_fila = "(SELECT {{}} FROM reservas r WHERE r.horario_id = {0} AND r.{1} = {2}.{1})".format(horario_id, columna, tabla)
+        sentencias.append("""UPDATE {0} SET reservas = reservas - {3}, personas = personas - {4}
+                             WHERE fecha = {5} AND {1} IN (SELECT {1} FROM reservas WHERE horario_id = {2})""".format(
+            tabla, columna, horario_id, de_la_fila.format("count(*)"), de_la_fila.format("COALESCE(sum(num_personas), 0)"), desde))
+        sentencias.append("DELETE FROM {0} WHERE fecha = {2} AND reservas = 0 AND {1} IN (SELECT {1} FROM reservas WHERE horario_id = {3})"
+                          .format(tabla, columna, desde, horario_id))
+        sentencias.append("""INSERT INTO {0} ({1}, fecha, reservas, personas)
+                             SELECT {1}, {3}, count(*), COALESCE(sum(num_personas), 0) FROM reservas
+                             WHERE horario_id = {2} AND {1} IS NOT NULL GROUP BY {1}
+                             ON CONFLICT ({1}, fecha) DO UPDATE SET reservas = reservas + excluded.reservas, personas = personas + excluded.personas"""
+                          .format(tabla, columna, horario_id, hacia))
+    return sentencias
+
+
+def crear_trigger(c, nombre, evento, sentencias):
+    c.execute("CREATE TRIGGER {} {} BEGIN {}; END".format(nombre, evento, "; ".join(sentencias)))
+
+
+def migracion_7(c):
+    for tabla, columna in RESUMENES_POR_DIA:
+        c.execute("""CREATE TABLE {0} ({1} INTEGER NOT NULL, fecha TEXT NOT NULL, reservas INTEGER NOT NULL,
+                     personas INTEGER NOT NULL, PRIMARY KEY ({1}, fecha)) WITHOUT ROWID""".format(tabla, columna))
+        c.execute("CREATE INDEX idx_{0}_fecha ON {0} (fecha)".format(tabla))
+        c.execute("""INSERT INTO {0} ({1}, fecha, reservas, personas)
+                     SELECT r.{1}, COALESCE(h.fecha, ''), count(*), COALESCE(sum(r.num_personas), 0)
+                     FROM reservas r LEFT JOIN horarios h ON h.horario_id = r.horario_id
+                     WHERE r.{1} IS NOT NULL GROUP BY 1, 2""".format(tabla, columna))
+    c.execute("""CREATE TABLE estadisticas_horario (horario_id INTEGER PRIMARY KEY, reservas INTEGER NOT NULL,
+                 personas INTEGER NOT NULL)""")
+    c.execute("""INSERT INTO estadisticas_horario (horario_id, reservas, personas)
+                 SELECT horario_id, count(*), COALESCE(sum(num_personas), 0) FROM reservas
+                 WHERE horario_id IS NOT NULL GROUP BY horario_id""")
+    crear_trigger(c, "estadisticas_reserva_alta", "AFTER INSERT ON reservas", sql_sumar_reserva("NEW"))
+    crear_trigger(c, "estadisticas_reserva_baja", "AFTER DELETE ON reservas", sql_restar_reserva("OLD"))
+    crear_trigger(c, "estadisticas_reserva_cambio",
+                  "AFTER UPDATE OF cancha_id, usuario_id, horario_id, num_personas ON reservas",
+                  sql_restar_reserva("OLD") + sql_sumar_reserva("NEW"))
+    crear_trigger(c, "estadisticas_horario_alta", "AFTER INSERT ON horarios",
+                  sql_mover_horario("NEW.horario_id", "''", "COALESCE(NEW.fecha, '')"))
+    crear_trigger(c, "estadisticas_horario_cambio", "AFTER UPDATE OF fecha ON horarios WHEN OLD.fecha IS NOT NEW.fecha",
+                  sql_mover_horario("NEW.horario_id", "COALESCE(OLD.fecha, '')", "COALESCE(NEW.fecha, '')"))
+    crear_trigger(c, "estadisticas_horario_baja", "AFTER DELETE ON horarios",
+                  sql_mover_horario("OLD.horario_id", "COALESCE(OLD.fecha, '')", "''"))
+
+
+# Registro de cambios de reservas que reaplica IndiceDisponibilidad: cada alta
+# ocupa un turno (ocupar = 1), cada baja lo libera (0) y un cambio de turno hace
+# las dos cosas. Lo escriben triggers, asi incluye las escrituras de todos los
+# workers y las que no pasan por la app; se conservan los ultimos
+# DISPONIBILIDAD_CAMBIOS (un worker mas atrasado reconstruye el indice).
+DISPONIBILIDAD_CAMBIOS = 10000
+
+
+def migracion_8(c):
+    c.execute("""CREATE TABLE reservas_cambios (seq INTEGER PRIMARY KEY AUTOINCREMENT, horario_id INTEGER,
+                 cancha_id INTEGER, ocupar INTEGER NOT NULL)""")
+    ocupar = "INSERT INTO reservas_cambios (horario_id, cancha_id, ocupar) VALUES (NEW.horario_id, NEW.cancha_id, 1)"
+    liberar = "INSERT INTO reservas_cambios (horario_id, cancha_id, ocupar) VALUES (OLD.horario_id, OLD.cancha_id, 0)"
+    podar = "DELETE FROM reservas_cambios WHERE seq <= last_insert_rowid() - {}".format(DISPONIBILIDAD_CAMBIOS)
+    crear_trigger(c, "reservas_cambios_alta", "AFTER INSERT ON reservas", [ocupar, podar])
+    crear_trigger(c, "reservas_cambios_baja", "AFTER DELETE ON reservas", [liberar, podar])
+    crear_trigger(c, "reservas_cambios_cambio",
+                  "AFTER UPDATE OF horario_id, cancha_id ON reservas "
+                  "WHEN OLD.horario_id IS NOT NEW.horario_id OR OLD.cancha_id IS NOT NEW.cancha_id",
+                  [liberar, ocupar, podar])
+
+
+MIGRACIONES = [migracion_1, migracion_2, migracion_3, migracion_4, migracion_5, migracion_6, migracion_7, migracion_8]
+
+
+# Conectar a la base de datos y aplicar las migraciones pendientes
+def init_db():
+    conn = sqlite3.connect(db, timeout=DB_POOL_TIMEOUT)
+    try:
+        c = conn.cursor()
+        c.execute("PRAGMA user_version")
+        if c.fetchone()[0] >= len(MIGRACIONES):
+            return
+
+        # BEGIN IMMEDIATE toma el lock de escritura: si varios workers arrancan a
+        # la vez solo uno migra y los demas ven la version ya actualizada
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("PRAGMA user_version")
+        version = c.fetchone()[0]
+        for migracion in MIGRACIONES[version:]:
+            migracion(c)
+        c.execute("PRAGMA user_version = {}".format(len(MIGRACIONES)))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# El esquema se verifica (y migra si hace falta) una sola vez por proceso, al
+# abrir la primera conexion del pool y no al importar el modulo
+esquema_listo = False
+esquema_lock = threading.Lock()
+
+
+def asegurar_esquema():
+    global esquema_listo
+    if esquema_listo:
+        return
+    with esquema_lock:
+        if not esquema_listo:
+            init_db()
+            esquema_listo = True
+
+
+def insertar_recordatorio(c, recordatorio):
+    # Sin commit: se ejecuta via db_alta
+    c.execute("INSERT INTO recordatorios (titulo, descripcion, fecha, hora) VALUES (?, ?, ?, ?)",
+              (recordatorio.titulo, recordatorio.descripcion, recordatorio.fecha, recordatorio.hora))
+    return c.lastrowid
+
 
 # Ruta para crear un nuevo recordatorio (Alta)
 @app.post("/recordatorios",status_code=status.HTTP_201_CREATED)
-def create_recordatorio(recordatorio: Recordatorio,response:Response):
+async def create_recordatorio(recordatorio: Recordatorio,response:Response):
        
                      
     
@@ -156,15 +1628,9 @@ def create_recordatorio(recordatorio: Recordatorio,response:Response):
         }      
      
     # Si las validaciones son correctas, se inserta el recordatorio en la base de datos
-    conn = sqlite3.connect(db)
-    c = conn.cursor()
-    c.execute("INSERT INTO recordatorios (titulo, descripcion, fecha, hora) VALUES (?, ?, ?, ?)",
-              (recordatorio.titulo, recordatorio.descripcion, recordatorio.fecha, recordatorio.hora))
-    conn.commit()
-    conn.close()
-    
-     # Obtenemos el ID del recordatorio recien creado
-    recordatorio_id = c.lastrowid
+    # y obtenemos el ID del recordatorio recien creado
+    recordatorio_id = await db_alta(insertar_recordatorio, recordatorio)
+    recordatorio_modificado(nuevo=dict(recordatorio.dict(), id=recordatorio_id))
 
     # Respuesta exitosa con los datos del recordatorio y el codigo 201
     return {
@@ -175,187 +1641,304 @@ def create_recordatorio(recordatorio: Recordatorio,response:Response):
             "fecha": recordatorio.fecha,
             "hora": recordatorio.hora
     }
-# Ruta para traer recordatorios existente (GET)
-@app.get("/recordatorios")
-async def get_recordatorios():
-    # Conectar a la base de datos
-    conn = sqlite3.connect(db)
-    c = conn.cursor()
-    
-    # Ejecutar consulta para obtener todos los recordatorios
-    c.execute("SELECT id, titulo, descripcion, fecha, hora FROM recordatorios")
-    rows = c.fetchall()
-    conn.close()
-    
-    # Forzar un error dividiendo entre cero (SIRVE PARA TIRAR UN ERROR 500)
-    # error_forzado = 1 / 0  # Esto provocara un error 500   
-    
-    # Crear los objetos Recordatorio con los resultados de la base de datos
-    recordatorios = [{"id": row[0], "titulo": row[1], "descripcion": row[2], "fecha": row[3], "hora": row[4]} for row in rows]
-    
-    # Devolver la lista de recordatorios con un codigo de estado 200 y estructura personalizada
-    return JSONResponse(
-        recordatorios,
-        status_code=status.HTTP_200_OK
-    )
-# Ruta para modificar un recordatorio existente
-@app.put("/recordatorios/{id}",status_code=status.HTTP_200_OK)
-def update_recordatorio(id: int, recordatorio: Recordatorio,response:Response):
-    conn = sqlite3.connect(db)
-    c = conn.cursor()
+COLUMNAS_RECORDATORIO = ("id", "titulo", "descripcion", "fecha", "hora")
 
-                                   
-                     
 
-    # Verificar si el recordatorio existe
-    c.execute("SELECT * FROM recordatorios WHERE id = ?", (id,))
-    existing_recordatorio = c.fetchone()
+def fila_recordatorio(row):
+    return dict(zip(COLUMNAS_RECORDATORIO, row))
 
-    if existing_recordatorio:
-        # Validaciones antes de actualizar
-        if not recordatorio.titulo.strip():
-            response.status_code = status.HTTP_400_BAD_REQUEST
-            return {
-            "detail":"titulo",
-            "msg": "El campo 'titulo' no puede estar vacio."
-        }   
-        elif not recordatorio.descripcion.strip():
-            response.status_code = status.HTTP_400_BAD_REQUEST
-            return {
-            "detail":"descripcion",
-            "msg": "El campo 'descripcion' no puede estar vacio."
-        }   
-        elif not recordatorio.fecha.strip():
-            response.status_code = status.HTTP_400_BAD_REQUEST
-            return {
-            "detail":"fecha",
-            "msg": "El campo 'fecha' no puede estar vacio."
-        }   
-        elif not recordatorio.hora.strip():
-            response.status_code = status.HTTP_400_BAD_REQUEST
+
+# Paginacion por cursor (keyset) sobre la clave primaria: cada pagina es un
+# "WHERE clave > after ORDER BY clave LIMIT n" que usa el indice de la PK, asi
+# que el costo no depende de cuantas paginas se recorrieron antes
+PAGINA_LIMITE_DEFAULT = int(os.environ.get("PAGINA_LIMITE_DEFAULT", "100"))
+PAGINA_LIMITE_MAX = int(os.environ.get("PAGINA_LIMITE_MAX", "1000"))
+FECHA_REGEX = r"^\d{4}-\d{2}-\d{2}$"
+
+
+def objeto_json_sql(columnas):
+    # Expresion SQL que arma el objeto JSON de la fila dentro de sqlite, asi los
+    # listados no construyen un dict por fila ni lo vuelven a serializar
+    return "json_object({})".format(", ".join("'{0}', {0}".format(columna) for columna in columnas))
+
+
+def leer_pagina(conn, columnas, tabla, clave, filtros, after, limit):
+    # filtros: lista de (condicion sql, parametro). Devuelve el cuerpo JSON de
+    # la pagina ya codificado y el cursor de la pagina siguiente
+    condiciones = [condicion for condicion, _ in filtros]
+    parametros = [parametro for _, parametro in filtros]
+    if after is not None:
+        condiciones.append("{} > ?".format(clave))
+        parametros.append(after)
+    sql = "SELECT {}, {} FROM {}".format(clave, objeto_json_sql(columnas), tabla)
+    if condiciones:
+        sql += " WHERE " + " AND ".join(condiciones)
+    sql += " ORDER BY {} LIMIT ?".format(clave)
+    # se pide una fila de mas para saber si hay otra pagina
+    parametros.append(limit + 1)
+    c = conn.cursor()
+    c.execute(sql, parametros)
+    rows = c.fetchall()
+    siguiente = rows[limit - 1][0] if len(rows) > limit else None
+    cuerpo = "[" + ",".join(row[1] for row in rows[:limit]) + "]"
+    return cuerpo.encode("utf-8"), siguiente
+
+
+def respuesta_paginada(request, cuerpo, siguiente, headers=None):
+    # El cuerpo sigue siendo la lista; el cursor de la pagina siguiente va en headers
+    headers = dict(headers or {})
+    if siguiente is not None:
+        headers["X-Next-Cursor"] = str(siguiente)
+        headers["Link"] = '<{}>; rel="next"'.format(request.url.include_query_params(after=siguiente))
+    return Response(cuerpo, status_code=status.HTTP_200_OK, headers=headers, media_type="application/json")
+
+
+# Exportacion completa de una tabla en streaming (NDJSON o CSV, opcionalmente
+# gzip). Las filas se leen del cursor de sqlite de a EXPORT_LOTE con fetchmany y
+# se envian a medida que se leen, asi la memoria no depende del tamano de la tabla
+EXPORT_LOTE = int(os.environ.get("EXPORT_LOTE", "1000"))
+EXPORT_FORMATOS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def codificar_lote(rows, formato):
+    if formato == "csv":
+        import csv
+        import io
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+    # ndjson: cada fila ya viene como un objeto JSON armado por sqlite
+    return "".join(row[0] + "\n" for row in rows).encode("utf-8")
+
+
+def exportar_tabla(tabla, columnas, clave, formato, comprimir):
+    compresor = zlib.compressobj(wbits=31) if comprimir else None  # wbits=31: formato gzip
+
+    def salida(chunk):
+        if compresor is None:
+            return chunk
+        # Z_SYNC_FLUSH para que cada lote llegue al cliente sin esperar al final
+        return compresor.compress(chunk) + compresor.flush(zlib.Z_SYNC_FLUSH)
+
+    with pool.conexion_dedicada() as conn:
+        c = conn.cursor()
+        seleccion = ", ".join(columnas) if formato == "csv" else objeto_json_sql(columnas)
+        c.execute("SELECT {} FROM {} ORDER BY {}".format(seleccion, tabla, clave))
+        if formato == "csv":
+            yield salida((",".join(columnas) + "\n").encode("utf-8"))
+        while True:
+            rows = c.fetchmany(EXPORT_LOTE)
+            if not rows:
+                break
+            yield salida(codificar_lote(rows, formato))
+    if compresor is not None:
+        yield compresor.flush()
+
+
+def respuesta_exportacion(tabla, columnas, clave, formato, comprimir):
+    headers = {"Content-Disposition": 'attachment; filename="{}.{}{}"'.format(tabla, formato, ".gz" if comprimir else "")}
+    if comprimir:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(exportar_tabla(tabla, columnas, clave, formato, comprimir),
+                             media_type=EXPORT_FORMATOS[formato], headers=headers)
+
+
+# Ruta para exportar todos los recordatorios
+@app.get("/recordatorios/export")
+async def export_recordatorios(formato: str = Query("ndjson", regex="^(ndjson|csv)$"), gzip: bool = False):
+    return respuesta_exportacion("recordatorios", COLUMNAS_RECORDATORIO, "id", formato, gzip)
+
+
+# Ruta para traer recordatorios existente (GET)
+@app.get("/recordatorios")
+async def get_recordatorios(request: Request,
+                            limit: int = Query(PAGINA_LIMITE_DEFAULT, ge=1, le=PAGINA_LIMITE_MAX),
+                            after: Optional[int] = None,
+                            fecha_desde: Optional[str] = Query(None, regex=FECHA_REGEX),
+                            fecha_hasta: Optional[str] = Query(None, regex=FECHA_REGEX)):
+    # Si el cliente ya tiene esta version del listado se responde 304
+    no_modificado, headers_cache = validar_cache_http(request, ("recordatorios",), str(request.url.query))
+    if no_modificado:
+        return no_modificado
+
+    filtros = []
+    if fecha_desde is not None:
+        filtros.append(("fecha >= ?", fecha_desde))
+    if fecha_hasta is not None:
+        filtros.append(("fecha <= ?", fecha_hasta))
+
+    # Ejecutar consulta para obtener la pagina de recordatorios, ya codificada en JSON
+    recordatorios, siguiente = await db_call(leer_pagina, COLUMNAS_RECORDATORIO, "recordatorios", "id", filtros, after, limit)
+    
+    # Forzar un error dividiendo entre cero (SIRVE PARA TIRAR UN ERROR 500)
+    # error_forzado = 1 / 0  # Esto provocara un error 500   
+    
+    # Devolver la lista de recordatorios con un codigo de estado 200 y estructura personalizada
+    return respuesta_paginada(request, recordatorios, siguiente, headers_cache)
+# Ruta para modificar un recordatorio existente
+@app.put("/recordatorios/{id}",status_code=status.HTTP_200_OK)
+def update_recordatorio(id: int, recordatorio: Recordatorio,response:Response):
+    with pool.connection() as conn:
+        c = conn.cursor()
+
+        # Verificar si el recordatorio existe
+        c.execute("SELECT * FROM recordatorios WHERE id = ?", (id,))
+        existing_recordatorio = c.fetchone()
+
+        if existing_recordatorio:
+            # Validaciones antes de actualizar
+            if not recordatorio.titulo.strip():
+                response.status_code = status.HTTP_400_BAD_REQUEST
+                return {
+                "detail":"titulo",
+                "msg": "El campo 'titulo' no puede estar vacio."
+            }   
+            elif not recordatorio.descripcion.strip():
+                response.status_code = status.HTTP_400_BAD_REQUEST
+                return {
+                "detail":"descripcion",
+                "msg": "El campo 'descripcion' no puede estar vacio."
+            }   
+            elif not recordatorio.fecha.strip():
+                response.status_code = status.HTTP_400_BAD_REQUEST
+                return {
+                "detail":"fecha",
+                "msg": "El campo 'fecha' no puede estar vacio."
+            }   
+            elif not recordatorio.hora.strip():
+                response.status_code = status.HTTP_400_BAD_REQUEST
+                return {
+                "detail":"hora",
+                "msg": "El campo 'hora' no puede estar vacio."
+            }   
+
+            # Actualizar el recordatorio
+            c.execute('''
+                      UPDATE recordatorios
+                      SET titulo = ?, descripcion = ?, fecha = ?, hora = ?
+                      WHERE id = ?
+                      ''', (recordatorio.titulo, recordatorio.descripcion, recordatorio.fecha, recordatorio.hora, id))
+            conn.commit()
+            recordatorio_modificado(fila_recordatorio(existing_recordatorio), dict(recordatorio.dict(), id=id))
+
+           # Crear el cuerpo de respuesta con el detalle de lo actualizado
             return {
-            "detail":"hora",
-            "msg": "El campo 'hora' no puede estar vacio."
-        }   
-        
-                                               
-                        
-                        
-                                                                     
-
-        # Actualizar el recordatorio
-        c.execute('''
-                  UPDATE recordatorios
-                  SET titulo = ?, descripcion = ?, fecha = ?, hora = ?
-                  WHERE id = ?
-                  ''', (recordatorio.titulo, recordatorio.descripcion, recordatorio.fecha, recordatorio.hora, id))
-        conn.commit()
-        conn.close()
+                    "id": id,
+                    "titulo": recordatorio.titulo,
+                    "descripcion": recordatorio.descripcion,
+                    "fecha": recordatorio.fecha,
+                    "hora": recordatorio.hora
+            }
 
-       # Crear el cuerpo de respuesta con el detalle de lo actualizado
-        return {
-                     
-                "id": id,
-                "titulo": recordatorio.titulo,
-                "descripcion": recordatorio.descripcion,
-                "fecha": recordatorio.fecha,
-                "hora": recordatorio.hora
-            
-        }
-    else:
-        conn.close()
-        # Enviar un error si no se encuentra el recordatorio
-        raise HTTPException(status_code=404, detail="Recordatorio no encontrado")
+    # Enviar un error si no se encuentra el recordatorio
+    raise HTTPException(status_code=404, detail="Recordatorio no encontrado")
 
 # Ruta para eliminar un recordatorio por ID
 @app.delete("/recordatorios/{id}",status_code=status.HTTP_200_OK)
 def delete_recordatorio(id: int):
-    conn = sqlite3.connect(db)
-    c = conn.cursor()
+    with pool.connection() as conn:
+        c = conn.cursor()
 
-    # Inicializamos el detalleError
-    detalleError = ""
+        # Verificar si el recordatorio existe
+        c.execute("SELECT * FROM recordatorios WHERE id = ?", (id,))
+        existing_recordatorio = c.fetchone()
 
-    # Verificar si el recordatorio existe
-    c.execute("SELECT * FROM recordatorios WHERE id = ?", (id,))
-    existing_recordatorio = c.fetchone()
+        if existing_recordatorio:
+            # Eliminar el recordatorio
+            c.execute("DELETE FROM recordatorios WHERE id = ?", (id,))
+            conn.commit()
+            recordatorio_modificado(anterior=fila_recordatorio(existing_recordatorio))
 
-    if existing_recordatorio:
-        # Eliminar el recordatorio
-        c.execute("DELETE FROM recordatorios WHERE id = ?", (id,))
-        conn.commit()
-        conn.close()
+            # Crear el cuerpo de respuesta con los detalles de lo eliminado
+            return {         
+                    "id": id,
+                    "titulo": existing_recordatorio[1],
+                    "descripcion": existing_recordatorio[2],
+                    "fecha": existing_recordatorio[3],
+                    "hora": existing_recordatorio[4]
+            }
 
-        # Crear el cuerpo de respuesta con los detalles de lo eliminado
-        return {         
-                "id": id,
-                "titulo": existing_recordatorio[1],
-                "descripcion": existing_recordatorio[2],
-                "fecha": existing_recordatorio[3],
-                "hora": existing_recordatorio[4]
-        }
-    else:
-        conn.close()
-        # Enviar un error si no se encuentra el recordatorio
-        raise HTTPException(status_code=404, detail="Recordatorio no encontrado")
+    # Enviar un error si no se encuentra el recordatorio
+    raise HTTPException(status_code=404, detail="Recordatorio no encontrado")
 
-# Ruta para crear una nueva reserva 
-@app.post('/reservas',status_code=status.HTTP_201_CREATED)                    
-async def create_reserva(reserva: Reserva, response:Response):
-                                                 
-                     
-    
+# Validaciones de una reserva; devuelve el cuerpo del error o None si es valida
+def validar_reserva(reserva):
     # Validar que cancha_id sea un entero mayor a 0
     if not isinstance(reserva.cancha_id, int) or reserva.cancha_id <= 0:
-        response.status_code = status.HTTP_400_BAD_REQUEST
         return {
             "detail":"cancha",
             "msg": "debe seleccionar una cancha valida"
         }
-        
+
     # Validar que usuario_id sea un entero mayor a 0
-    if not isinstance(reserva.usuario_id, int) or reserva.usuario_id <= 0:
-        response.status_code = status.HTTP_400_BAD_REQUEST
+    elif not isinstance(reserva.usuario_id, int) or reserva.usuario_id <= 0:
         return {
             "detail":"usuario",
             "msg": "debe seleccionar un usuario valida"
-        }      
-        
-    
+        }
+
     # Validar que horario_id sea un entero mayor a 0
     elif not isinstance(reserva.horario_id, int) or reserva.horario_id <= 0:
-        response.status_code = status.HTTP_400_BAD_REQUEST
         return {
             "detail":"horario",
             "msg": "debe seleccionar un horario valido"
-        }      
-    
+        }
+
     # Validar que descripcion no este vacia
-    elif not reserva.descripcion.strip():  # Validamos que descripcion no este vacia
-        response.status_code = status.HTTP_400_BAD_REQUEST
+    elif not reserva.descripcion.strip():
         return {
             "detail":"descripcion",
             "msg": "el campo 'descripcion' no debe estar vacio"
-        }      
-    
+        }
+
     # Validar que num_personas sea un entero mayor a 0
     elif not isinstance(reserva.num_personas, int) or reserva.num_personas <= 0 or reserva.num_personas > 16:
-        response.status_code = status.HTTP_400_BAD_REQUEST         
         return {
             "detail":"jugadores",
             "msg": "debe haber al menos 1 jugador y hasta 16 jugadores"
-                                        
-        } 
+        }
+    return None
+
+# Respuesta cuando la cancha ya esta reservada en ese horario
+TURNO_OCUPADO = {
+    "detail": "turno",
+    "msg": "la cancha ya esta reservada en ese horario"
+}
+
+def insertar_reserva(c, reserva):
+    # La exclusividad del turno la garantiza el indice unico: si otro request
+    # reservo el mismo (horario_id, cancha_id) no se inserta nada y devuelve None.
+    # Sin commit: se ejecuta via db_alta
+    c.execute('''
+              INSERT INTO reservas (cancha_id, usuario_id, horario_id, descripcion, num_personas) VALUES (?, ?, ?, ?, ?)
+              ON CONFLICT (horario_id, cancha_id) DO NOTHING
+              ''', (reserva.cancha_id, reserva.usuario_id, reserva.horario_id, reserva.descripcion, reserva.num_personas))
+    return c.lastrowid if c.rowcount == 1 else None
+
+def leer_reserva(conn, reserva_id):
+    c = conn.cursor()
+    c.execute("SELECT * FROM reservas WHERE reserva_id = ?", (reserva_id,))
+    return c.fetchone()
+
+# Ruta para crear una nueva reserva 
+@app.post('/reservas',status_code=status.HTTP_201_CREATED)                    
+async def create_reserva(reserva: Reserva, response:Response):
+    # Validar los campos de la reserva
+    error = validar_reserva(reserva)
+    if error:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return error
     
     # Si las validaciones son correctas, insertamos en la base de datos
-    conn = sqlite3.connect(db)
-    c = conn.cursor()
-    c.execute("INSERT INTO reservas (cancha_id, usuario_id, horario_id, descripcion, num_personas) VALUES (?, ?, ?, ?, ?)",
-              (reserva.cancha_id, reserva.usuario_id, reserva.horario_id, reserva.descripcion, reserva.num_personas))
-     # Obtenemos el ID del recordatorio recien creado
-    reserva_id = c.lastrowid
-    conn.commit()
-    conn.close()
+    # Obtenemos el ID de la reserva recien creada
+    reserva_id = await db_alta(insertar_reserva, reserva)
+    if reserva_id is None:
+        response.status_code = status.HTTP_409_CONFLICT
+        return TURNO_OCUPADO
+    reserva_modificada(nueva=dict(reserva.dict(), reserva_id=reserva_id))
 
     # Respuesta exitosa
     return {
@@ -367,264 +1950,1494 @@ async def create_reserva(reserva: Reserva, response:Response):
             "num_personas": reserva.num_personas
     }
 
+# Operaciones en lote: se valida todo el lote antes de escribir y se aplica en
+# una unica transaccion (un solo commit/fsync) con executemany
+BULK_MAX = int(os.environ.get("BULK_MAX", "1000"))
+COLUMNAS_RESERVA = ("reserva_id", "cancha_id", "usuario_id", "horario_id", "descripcion", "num_personas")
+
+
+def fila_reserva(row):
+    return dict(zip(COLUMNAS_RESERVA, row))
+
+
+def validar_lote(reservas):
+    if not reservas:
+        return {"detail": "lote", "msg": "el lote no puede estar vacio"}
+    if len(reservas) > BULK_MAX:
+        return {"detail": "lote", "msg": "el lote no puede tener mas de {} elementos".format(BULK_MAX)}
+    errores = []
+    for indice, reserva in enumerate(reservas):
+        error = validar_reserva(reserva)
+        if error:
+            errores.append(dict(error, indice=indice))
+    if errores:
+        return {"detail": "lote", "msg": "hay reservas invalidas, no se aplico ningun cambio", "errores": errores}
+    return None
+
+
+def leer_reservas_por_id(c, reserva_ids):
+    c.execute("SELECT reserva_id, cancha_id, usuario_id, horario_id, descripcion, num_personas FROM reservas "
+              "WHERE reserva_id IN (SELECT value FROM json_each(?))", (json.dumps(reserva_ids),))
+    return {row[0]: row for row in c.fetchall()}
+
+
+def turnos_ocupados(c, reservas):
+    turnos = json.dumps([[r.horario_id, r.cancha_id] for r in reservas])
+    c.execute("SELECT horario_id, cancha_id FROM reservas WHERE (horario_id, cancha_id) IN "
+              "(SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?))", (turnos,))
+    return set(c.fetchall())
+
+
+def insertar_reservas(conn, reservas):
+    # Devuelve el id asignado a cada reserva, o None si su turno estaba ocupado
+    c = conn.cursor()
+    # BEGIN IMMEDIATE toma el lock de escritura: nadie mas puede ocupar turnos
+    # mientras se revisan, y con AUTOINCREMENT los ids del lote quedan
+    # consecutivos y terminan en el valor final de sqlite_sequence
+    c.execute("BEGIN IMMEDIATE")
+    ocupados = turnos_ocupados(c, reservas)
+    nuevas = []
+    for r in reservas:
+        turno = (r.horario_id, r.cancha_id)
+        # tambien se descartan los turnos repetidos dentro del mismo lote
+        nuevas.append(turno not in ocupados)
+        ocupados.add(turno)
+    c.executemany("INSERT INTO reservas (cancha_id, usuario_id, horario_id, descripcion, num_personas) VALUES (?, ?, ?, ?, ?)",
+                  [(r.cancha_id, r.usuario_id, r.horario_id, r.descripcion, r.num_personas)
+                   for r, nueva in zip(reservas, nuevas) if nueva])
+    c.execute("SELECT seq FROM sqlite_sequence WHERE name = 'reservas'")
+    row = c.fetchone()
+    conn.commit()
+    ids = iter(range(row[0] - sum(nuevas) + 1, row[0] + 1) if row else ())
+    return [next(ids) if nueva else None for nueva in nuevas]
+
+
+def actualizar_reservas(conn, reservas):
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    existentes = leer_reservas_por_id(c, [r.reserva_id for r in reservas])
+    sql = '''
+          UPDATE reservas
+          SET cancha_id = ?, usuario_id = ?, horario_id = ?, descripcion = ?, num_personas = ?
+          WHERE reserva_id = ?
+          '''
+    parametros = [(r.cancha_id, r.usuario_id, r.horario_id, r.descripcion, r.num_personas, r.reserva_id)
+                  for r in reservas if r.reserva_id in existentes]
+    conflictos = set()
+    c.execute("SAVEPOINT lote")
+    try:
+        c.executemany(sql, parametros)
+        c.execute("RELEASE lote")
+    except sqlite3.IntegrityError:
+        # Algun turno ya esta ocupado: se aplica item por item para saber cuales
+        c.execute("ROLLBACK TO lote")
+        c.execute("RELEASE lote")
+        for p in parametros:
+            c.execute("SAVEPOINT item")
+            try:
+                c.execute(sql, p)
+            except sqlite3.IntegrityError:
+                c.execute("ROLLBACK TO item")
+                conflictos.add(p[-1])
+            c.execute("RELEASE item")
+    conn.commit()
+    return existentes, conflictos
+
+
+def eliminar_reservas(conn, reserva_ids):
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    existentes = leer_reservas_por_id(c, reserva_ids)
+    c.executemany("DELETE FROM reservas WHERE reserva_id = ?", [(reserva_id,) for reserva_id in existentes])
+    conn.commit()
+    return existentes
+
+
+# Ruta para crear reservas en lote
+@app.post('/reservas/bulk', status_code=status.HTTP_201_CREATED)
+async def create_reservas_bulk(reservas: List[Reserva], response: Response):
+    error = validar_lote(reservas)
+    if error:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return error
+
+    reserva_ids = await db_call(insertar_reservas, reservas)
+    resultados = []
+    for indice, (reserva, reserva_id) in enumerate(zip(reservas, reserva_ids)):
+        if reserva_id is None:
+            resultados.append(dict(TURNO_OCUPADO, indice=indice, status=status.HTTP_409_CONFLICT))
+        else:
+            reserva_modificada(nueva=dict(reserva.dict(), reserva_id=reserva_id))
+            resultados.append(dict(reserva.dict(), indice=indice, status=status.HTTP_201_CREATED, id=reserva_id))
+    return resultados
+
+
+# Ruta para modificar reservas en lote; las que no existen se informan con 404
+@app.put('/reservas/bulk', status_code=status.HTTP_200_OK)
+async def update_reservas_bulk(reservas: List[ReservaActualizacion], response: Response):
+    error = validar_lote(reservas)
+    if error:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return error
+
+    existentes, conflictos = await db_call(actualizar_reservas, reservas)
+    resultados = []
+    for indice, reserva in enumerate(reservas):
+        if reserva.reserva_id in conflictos:
+            resultados.append(dict(TURNO_OCUPADO, indice=indice, reserva_id=reserva.reserva_id,
+                                   status=status.HTTP_409_CONFLICT))
+        elif reserva.reserva_id in existentes:
+            reserva_modificada(fila_reserva(existentes[reserva.reserva_id]), reserva.dict())
+            resultados.append(dict(reserva.dict(), indice=indice, status=status.HTTP_200_OK))
+        else:
+            resultados.append({"indice": indice, "reserva_id": reserva.reserva_id,
+                               "status": status.HTTP_404_NOT_FOUND, "detail": "Reserva no encontrada"})
+    return resultados
+
+
+# Ruta para eliminar reservas en lote a partir de sus IDs
+@app.delete('/reservas/bulk', status_code=status.HTTP_200_OK)
+async def delete_reservas_bulk(reserva_ids: List[int], response: Response):
+    if not reserva_ids or len(reserva_ids) > BULK_MAX:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {"detail": "lote", "msg": "el lote debe tener entre 1 y {} elementos".format(BULK_MAX)}
+
+    existentes = await db_call(eliminar_reservas, reserva_ids)
+    resultados = []
+    for indice, reserva_id in enumerate(reserva_ids):
+        # un id repetido en el lote solo se elimina una vez
+        row = existentes.pop(reserva_id, None)
+        if row:
+            reserva_modificada(anterior=fila_reserva(row))
+            resultados.append(dict(zip(COLUMNAS_RESERVA, row), indice=indice, status=status.HTTP_200_OK))
+        else:
+            resultados.append({"indice": indice, "reserva_id": reserva_id,
+                               "status": status.HTTP_404_NOT_FOUND, "detail": "Reserva no encontrada"})
+    return resultados
+
+
+# Ruta para exportar todas las reservas (declarada antes de /reservas/{reserva_id})
+@app.get("/reservas/export")
+async def export_reservas(formato: str = Query("ndjson", regex="^(ndjson|csv)$"), gzip: bool = False):
+    return respuesta_exportacion("reservas", ("reserva_id", "cancha_id", "usuario_id", "horario_id", "descripcion", "num_personas"),
+                                 "reserva_id", formato, gzip)
+
 # Ruta para obtener una reserva por su ID
 
 @app.get('/reservas/{reserva_id}',status_code=status.HTTP_200_OK)
-async def get_reserva(reserva_id: int):
-    conn = sqlite3.connect(db)
-    c = conn.cursor()
+async def get_reserva(reserva_id: int, request: Request):
+    no_modificado, headers_cache = validar_cache_http(request, ("reservas",), str(reserva_id))
+    if no_modificado:
+        return no_modificado
 
     # Verificar si la reserva existe
-    c.execute("SELECT * FROM reservas WHERE reserva_id = ?", (reserva_id,))
-    reserva = c.fetchone()
-
-    conn.close()
+    reserva = await db_call(leer_reserva, reserva_id)
 
     if reserva:
-        return {
-                                                      
-                        
+        return ORJSONResponse({
                 "id": reserva[0],  # reserva_id
                 "cancha_id": reserva[1],
                 "usuario_id": reserva[2],
                 "horario_id": reserva[3],
                 "descripcion": reserva[4],
                 "num_personas": reserva[5],
-              
-                               
-                              
-        }
+        }, headers=headers_cache)
     else:
         raise HTTPException(status_code=404, detail="Reserva no encontrada")
 
     
 # Ruta para obtener la lista de reservas
 @app.get("/reservas",status_code=status.HTTP_200_OK)
-async def get_reservas():
-    conn = sqlite3.connect(db)
-    c = conn.cursor()
-    
-	# Ejecutar la consulta para obtener todas las reservas
-    c.execute("SELECT reserva_id, cancha_id, usuario_id, horario_id, descripcion, num_personas FROM reservas")
-    rows = c.fetchall()
-    conn.close()
+async def get_reservas(request: Request,
+                       limit: int = Query(PAGINA_LIMITE_DEFAULT, ge=1, le=PAGINA_LIMITE_MAX),
+                       after: Optional[int] = None,
+                       cancha_id: Optional[int] = None,
+                       usuario_id: Optional[int] = None,
+                       horario_id: Optional[int] = None,
+                       fecha_desde: Optional[str] = Query(None, regex=FECHA_REGEX),
+                       fecha_hasta: Optional[str] = Query(None, regex=FECHA_REGEX)):
+    # Si el cliente ya tiene esta version del listado se responde 304 (el rango
+    # de fechas depende tambien del catalogo de horarios)
+    tablas = ("reservas",)
+    if fecha_desde is not None or fecha_hasta is not None:
+        await catalogos[HORARIOS_API_URL].obtener()
+        tablas = ("reservas", "horarios")
+    no_modificado, headers_cache = validar_cache_http(request, tablas, str(request.url.query))
+    if fecha_desde is not None or fecha_hasta is not None:
+        headers_cache.update(headers_stale(catalogos[HORARIOS_API_URL]))
+    if no_modificado:
+        no_modificado.headers.update(headers_cache)
+        return no_modificado
 
-    # Crear una lista de diccionarios con los datos de cada reserva
-    reservas_list = [{"reserva_id": row[0], "cancha_id": row[1],"usuario_id": row[2],"horario_id": row[3],"descripcion": row[4],"num_personas": row[5]} for row in rows]
+    filtros = []
+    if cancha_id is not None:
+        filtros.append(("cancha_id = ?", cancha_id))
+    if usuario_id is not None:
+        filtros.append(("usuario_id = ?", usuario_id))
+    if horario_id is not None:
+        filtros.append(("horario_id = ?", horario_id))
+    # reservas no tiene fecha: el rango se resuelve contra el espejo de horarios
+    if fecha_desde is not None:
+        filtros.append(("horario_id IN (SELECT horario_id FROM horarios WHERE fecha >= ?)", fecha_desde))
+    if fecha_hasta is not None:
+        filtros.append(("horario_id IN (SELECT horario_id FROM horarios WHERE fecha <= ?)", fecha_hasta))
+
+    # Ejecutar la consulta para obtener la pagina de reservas, ya codificada en JSON
+    reservas_list, siguiente = await db_call(leer_pagina, COLUMNAS_RESERVA, "reservas", "reserva_id", filtros, after, limit)
     
 	 # Devolver la lista de recordatorios con un codigo de estado 200 y estructura personalizada
-    return JSONResponse(reservas_list)
+    return respuesta_paginada(request, reservas_list, siguiente, headers_cache)
    
 # Ruta para modificar una reserva existente
 @app.put("/reservas/{reserva_id}",status_code=status.HTTP_200_OK)
 def update_reserva(reserva_id: int, reserva: Reserva,response:Response):
-    conn = sqlite3.connect(db)
-    c = conn.cursor()
+    with pool.connection() as conn:
+        c = conn.cursor()
 
-    # Verificar si la reserva existe
-    c.execute("SELECT * FROM reservas WHERE reserva_id = ?", (reserva_id,))
-    existing_reserva = c.fetchone()
-    
-    if existing_reserva:
-    # Validar que cancha_id sea un entero mayor a 0
-        if not isinstance(reserva.cancha_id, int) or reserva.cancha_id <= 0:
-            response.status_code = status.HTTP_400_BAD_REQUEST
-            return {
-            "detail":"cancha",
-            "msg": "debe seleccionar una cancha valida"
-        }
-            
-         # Validar que usuario_id sea un entero mayor a 0
-        elif not isinstance(reserva.usuario_id, int) or reserva.usuario_id <= 0:
-            response.status_code = status.HTTP_400_BAD_REQUEST
-            return {
-            "detail":"usuario",
-            "msg": "debe seleccionar un usuario valida"
-        }          
-        
-    
-    # Validar que horario_id sea un entero mayor a 0
-        elif not isinstance(reserva.horario_id, int) or reserva.horario_id <= 0:
-            response.status_code = status.HTTP_400_BAD_REQUEST
-            return {
-            "detail":"horario",
-            "msg": "debe seleccionar un horario valido"
-        }      
-    
-    # Validar que descripcion no este vacia
-        elif not reserva.descripcion.strip():  # Validamos que descripcion no este vacia
-            response.status_code = status.HTTP_400_BAD_REQUEST
-            return {
-            "detail":"descripcion",
-            "msg": "el campo 'descripcion' no debe estar vacio"
-        }      
-    
-    # Validar que num_personas sea un entero mayor a 0
-        elif not isinstance(reserva.num_personas, int) or reserva.num_personas <= 0 or reserva.num_personas > 16:
-            response.status_code = status.HTTP_400_BAD_REQUEST
+        # Verificar si la reserva existe
+        c.execute("SELECT * FROM reservas WHERE reserva_id = ?", (reserva_id,))
+        existing_reserva = c.fetchone()
+
+        if existing_reserva:
+            # Validar los campos de la reserva
+            error = validar_reserva(reserva)
+            if error:
+                response.status_code = status.HTTP_400_BAD_REQUEST
+                return error
+
+            # Actualizar la reserva; el indice unico rechaza moverla a un turno ocupado
+            try:
+                c.execute('''
+                          UPDATE reservas
+                          SET cancha_id = ?, usuario_id = ?, horario_id = ?, descripcion = ?, num_personas = ?
+                          WHERE reserva_id = ?
+                          ''', (reserva.cancha_id, reserva.usuario_id, reserva.horario_id, reserva.descripcion, reserva.num_personas, reserva_id))
+            except sqlite3.IntegrityError:
+                conn.rollback()
+                response.status_code = status.HTTP_409_CONFLICT
+                return TURNO_OCUPADO
+            conn.commit()
+            reserva_modificada(fila_reserva(existing_reserva), dict(reserva.dict(), reserva_id=reserva_id))
+
+         # Crear la respuesta con los detalles de los campos actualizados
             return {
-            "detail":"jugadores",
-            "msg": "debe haber al menos 1 jugador y hasta 16 jugadores"
-        } 
-
-    if existing_reserva:
-        # Actualizar la reserva
-        c.execute('''
-                  UPDATE reservas
-                  SET cancha_id = ?, usuario_id = ?, horario_id = ?, descripcion = ?, num_personas = ?
-                  WHERE reserva_id = ?
-                  ''', (reserva.cancha_id, reserva.usuario_id, reserva.horario_id, reserva.descripcion, reserva.num_personas, reserva_id))
-        conn.commit()
-        conn.close()
-        
+                    "reserva_id": reserva_id,
+                    "cancha_id": reserva.cancha_id,
+                    "usuario_id": reserva.usuario_id,
+                    "horario_id": reserva.horario_id,
+                    "descripcion": reserva.descripcion,
+                    "num_personas": reserva.num_personas
+            }
 
-     # Crear la respuesta con los detalles de los campos actualizados
-        return {
-                "reserva_id": reserva_id,
-                "cancha_id": reserva.cancha_id,
-                "usuario_id": reserva.usuario_id,
-                "horario_id": reserva.horario_id,
-                "descripcion": reserva.descripcion,
-                "num_personas": reserva.num_personas
-        }
-    else:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Reserva no encontrada")
+    raise HTTPException(status_code=404, detail="Reserva no encontrada")
 
 # Ruta para eliminar una reserva por ID
 @app.delete("/reservas/{reserva_id}",status_code=status.HTTP_200_OK)
 def delete_reserva(reserva_id: int):
-    conn = sqlite3.connect(db)
-    c = conn.cursor()
+    with pool.connection() as conn:
+        c = conn.cursor()
 
-    # Verificar si la reserva existe
-    c.execute("SELECT * FROM reservas WHERE reserva_id = ?", (reserva_id,))
-    existing_reserva = c.fetchone()
+        # Verificar si la reserva existe
+        c.execute("SELECT * FROM reservas WHERE reserva_id = ?", (reserva_id,))
+        existing_reserva = c.fetchone()
 
-    if existing_reserva:
-        # Eliminar la reserva
-        c.execute("DELETE FROM reservas WHERE reserva_id = ?", (reserva_id,))
-        conn.commit()
-        conn.close()
-  # Crear la respuesta con los detalles de la reserva eliminada
-        return {     
-            "reserva_id": reserva_id,
-            "cancha_id": existing_reserva[1],
-            "usuario_id": existing_reserva[2],
-            "horario_id": existing_reserva[3],
-            "descripcion": existing_reserva[4],
-            "num_personas": existing_reserva[5]
-            }
-    else:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Reserva no encontrada")
+        if existing_reserva:
+            # Eliminar la reserva
+            c.execute("DELETE FROM reservas WHERE reserva_id = ?", (reserva_id,))
+            conn.commit()
+            reserva_modificada(anterior=fila_reserva(existing_reserva))
+      # Crear la respuesta con los detalles de la reserva eliminada
+            return {     
+                "reserva_id": reserva_id,
+                "cancha_id": existing_reserva[1],
+                "usuario_id": existing_reserva[2],
+                "horario_id": existing_reserva[3],
+                "descripcion": existing_reserva[4],
+                "num_personas": existing_reserva[5]
+                }
+
+    raise HTTPException(status_code=404, detail="Reserva no encontrada")
     
 
 #llamada a api externa
-PREFIX = "https://db39-2800-40-16-31e-a468-6f93-336a-2045.ngrok-free.app"
+PREFIX = os.environ.get("UPSTREAM_PREFIX", "https://db39-2800-40-16-31e-a468-6f93-336a-2045.ngrok-free.app")
 HORARIOS_API_URL = "/api/horarios"
 CANCHAS_API_URL = "/api/canchas"
 USUARIOS_API_URL = "/api/usuarios"
 
+# Cliente http compartido por toda la app: reutiliza conexiones (keep-alive,
+# HTTP/2 si esta instalado 'h2') en lugar de abrir una sesion TLS por request
+UPSTREAM_TIMEOUT = float(os.environ.get("UPSTREAM_TIMEOUT", "5"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", "2"))
+UPSTREAM_MAX_CONEXIONES = int(os.environ.get("UPSTREAM_MAX_CONEXIONES", "20"))
+UPSTREAM_HEADERS = {
+    'Content-Type': 'application/json',
+    'Accept': 'application/json'
+}
+http_client = None
+
+
+def get_http_client():
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(max_connections=UPSTREAM_MAX_CONEXIONES,
+                                max_keepalive_connections=UPSTREAM_MAX_CONEXIONES,
+                                keepalive_expiry=60),
+            timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT, pool=UPSTREAM_CONNECT_TIMEOUT),
+            headers=UPSTREAM_HEADERS,
+        )
+    return http_client
+
+
+async def cerrar_http_client():
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
+
+# Resiliencia ante la api externa: cada llamada se reintenta hasta
+# UPSTREAM_REINTENTOS veces ante timeouts, errores de conexion o 5xx, con
+# backoff exponencial y jitter completo para no sincronizar los reintentos de
+# todos los workers. Tras CIRCUITO_FALLAS fallas seguidas el circuito se abre y
+# durante CIRCUITO_ESPERA segundos las llamadas fallan al instante; despues se
+# deja pasar una sola llamada de prueba que lo cierra o lo vuelve a abrir, y
+# las llamadas que llegan mientras tanto esperan su resultado, hasta
+# CIRCUITO_SONDA_ESPERA segundos (despues fallan como con el circuito abierto).
+UPSTREAM_REINTENTOS = int(os.environ.get("UPSTREAM_REINTENTOS", "2"))
+UPSTREAM_BACKOFF = float(os.environ.get("UPSTREAM_BACKOFF", "0.1"))
+UPSTREAM_BACKOFF_MAX = float(os.environ.get("UPSTREAM_BACKOFF_MAX", "2"))
+CIRCUITO_FALLAS = int(os.environ.get("CIRCUITO_FALLAS", "5"))
+CIRCUITO_ESPERA = float(os.environ.get("CIRCUITO_ESPERA", "30"))
+CIRCUITO_SONDA_ESPERA = float(os.environ.get("CIRCUITO_SONDA_ESPERA", "10"))
+
+
+class UpstreamNoDisponible(Exception):
+    def __init__(self, url, motivo, reintentar_en=None):
+        super().__init__("{}: {}".format(url, motivo))
+        self.url = url
+        self.motivo = motivo
+        self.reintentar_en = reintentar_en
+
+
+class CircuitoUpstream:
+    # Solo se usa desde el event loop, no necesita lock
+    def __init__(self, fallas, espera, espera_sonda):
+        self.fallas = fallas
+        self.espera = espera
+        self.espera_sonda = espera_sonda
+        self.estado = "cerrado"
+        self.fallas_seguidas = 0
+        self.abierto_hasta = 0.0
+        self._sonda = None  # future que se resuelve al terminar la llamada de prueba
+        # contadores
+        self.aperturas = 0
+        self.rechazos = 0
+
+    async def permitir(self):
+        if self.estado == "abierto":
+            if time.monotonic() < self.abierto_hasta:
+                self.rechazos += 1
+                return False
+            self.estado = "semiabierto"
+        if self.estado == "semiabierto":
+            if self._sonda is not None:
+                # asyncio.wait no cancela la sonda si se cancela quien espera
+                await asyncio.wait((self._sonda,), timeout=self.espera_sonda)
+                if self.estado != "cerrado":
+                    self.rechazos += 1
+                    return False
+                return True
+            self._sonda = asyncio.get_running_loop().create_future()
+        return True
+
+    def _fin_sonda(self):
+        if self._sonda is not None:
+            self._sonda.set_result(None)
+            self._sonda = None
+
+    def exito(self):
+        self.estado = "cerrado"
+        self.fallas_seguidas = 0
+        self._fin_sonda()
+
+    def cancelada(self):
+        # la llamada de prueba se cancelo sin resultado: la proxima vuelve a probar
+        self._fin_sonda()
+
+    def falla(self):
+        self._fin_sonda()
+        self.fallas_seguidas += 1
+        if self.estado == "semiabierto" or self.fallas_seguidas >= self.fallas:
+            if self.estado != "abierto":
+                self.aperturas += 1
+                log.warning("circuito upstream abierto", extra={"datos": {"fallas_seguidas": self.fallas_seguidas, "espera": self.espera}})
+            self.estado = "abierto"
+            self.abierto_hasta = time.monotonic() + self.espera
+
+    def reintentar_en(self):
+        return max(0.0, self.abierto_hasta - time.monotonic()) if self.estado == "abierto" else None
+
+
+circuito = CircuitoUpstream(CIRCUITO_FALLAS, CIRCUITO_ESPERA, CIRCUITO_SONDA_ESPERA)
+
+
+@app.exception_handler(UpstreamNoDisponible)
+async def upstream_no_disponible(request: Request, exc: UpstreamNoDisponible):
+    # Solo llega aca si no hay ningun snapshot del catalogo para responder
+    headers = {"Retry-After": str(max(1, int(-(-exc.reintentar_en // 1))))} if exc.reintentar_en else {}
+    return ORJSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, headers=headers,
+                          content={"detail": "Servicio externo no disponible ({})".format(exc.motivo)})
+
+
+async def fetch_upstream(url, etag=None, last_modified=None):
+    full_route = "{}{}".format(PREFIX, url)
+    log.debug("consulta upstream", extra={"datos": {"url": full_route}})
+    # Revalidacion condicional: si el recurso no cambio upstream responde 304 sin cuerpo
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    for intento in range(UPSTREAM_REINTENTOS + 1):
+        if not await circuito.permitir():
+            metricas.incrementar("upstream_errores_total", (("recurso", url), ("tipo", "circuito_abierto")))
+            raise UpstreamNoDisponible(url, "circuito abierto", circuito.reintentar_en())
+        inicio = time.perf_counter()
+        try:
+            response = await get_http_client().get(full_route, headers=headers)
+        except httpx.TimeoutException:
+            motivo = "timeout"
+        except httpx.HTTPError:
+            motivo = "conexion"
+        except asyncio.CancelledError:
+            circuito.cancelada()
+            raise
+        except BaseException:
+            # cualquier otro error (url invalida, cliente cerrado, ...) tambien
+            # termina la llamada: si era la sonda, las que esperan no quedan colgadas
+            circuito.falla()
+            metricas.incrementar("upstream_errores_total", (("recurso", url), ("tipo", "error")))
+            raise
+        else:
+            if response.status_code == 200 or (response.status_code == 304 and headers):
+                circuito.exito()
+                return response
+            motivo = "status_{}".format(response.status_code)
+            if response.status_code < 500 and response.status_code != 429:
+                # upstream responde pero no tiene el recurso: no es una falla transitoria
+                circuito.exito()
+                metricas.incrementar("upstream_errores_total", (("recurso", url), ("tipo", motivo)))
+                log.warning("respuesta upstream inesperada", extra={"datos": {"url": full_route, "status": response.status_code}})
+                raise HTTPException(status_code=404)
+        finally:
+            metricas.observar("upstream_segundos", (("recurso", url),), time.perf_counter() - inicio)
+        circuito.falla()
+        metricas.incrementar("upstream_errores_total", (("recurso", url), ("tipo", motivo)))
+        log.warning("error upstream", extra={"datos": {"url": full_route, "motivo": motivo, "intento": intento + 1}})
+        if intento < UPSTREAM_REINTENTOS:
+            await asyncio.sleep(random.uniform(0, min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF * 2 ** intento)))
+    raise UpstreamNoDisponible(url, motivo, circuito.reintentar_en())
+
+
+# Espejo local de los catalogos externos (horarios, canchas, usuarios) en
+# tablas sqlite junto a reservas. Una tarea en segundo plano los sincroniza
+# cada 'intervalo' segundos (y POST /sincronizar a pedido) con un GET
+# condicional: si upstream responde 304 no se escribe nada y si cambio solo se
+# tocan las filas nuevas, modificadas o borradas. Los requests leen del espejo,
+# asi que siguen funcionando con upstream caido; mientras la ultima
+# sincronizacion haya fallado las respuestas llevan el header X-Upstream-Stale.
+# Entre workers las sincronizaciones se reparten con la columna 'proxima' y
+# cada worker recarga su copia en memoria cuando cambia la version compartida
+# de la tabla.
+SINCRONIZACION_TICK = float(os.environ.get("SINCRONIZACION_TICK", "5"))
+
+
+class CatalogoCache:
+    def __init__(self, url, intervalo, clave, tabla, columna, columnas=(), transformar=None):
+        self.url = url
+        self.intervalo = intervalo
+        # clave del item upstream, tabla espejo y su clave primaria
+        self.clave = clave
+        self.tabla = tabla
+        self.columna = columna
+        self.columnas = columnas  # campos del item copiados a columnas propias
+        # indice {item[clave]: item} recalculado solo cuando cambian los datos
+        self.transformar = transformar
+        self.indice = {}
+        self.datos = None
+        self.version = None  # version compartida de la tabla al cargar 'datos'
+        self.actualizado = None  # time.time() de la ultima sincronizacion exitosa
+        self.error = None  # motivo de la ultima sincronizacion fallida
+        self._en_vuelo = None
+        self._sincronizando = asyncio.Lock()
+        # contadores
+        self.hits = 0
+        self.cargas = 0
+        self.sincronizaciones = 0
+        self.revalidaciones = 0
+        self.filas_cambiadas = 0
+        self.errores = 0
+
+    async def obtener(self):
+        if self.datos is not None and self.version == versiones.version(self.tabla):
+            self.hits += 1
+            return self.datos
+        # single-flight: una sola carga en curso por catalogo
+        if self._en_vuelo is None:
+            self._en_vuelo = asyncio.ensure_future(self._cargar())
+            self._en_vuelo.add_done_callback(self._fin_carga)
+        return await asyncio.shield(self._en_vuelo)
+
+    def _fin_carga(self, tarea):
+        self._en_vuelo = None
+        if not tarea.cancelled():
+            tarea.exception()  # marca la excepcion como leida
+
+    async def _cargar(self):
+        # la version se lee antes que la tabla: un cambio en el medio fuerza otra carga
+        version = versiones.version(self.tabla)
+        cuerpo, actualizado, error = await db_call(self._leer)
+        if actualizado is None:
+            # espejo nunca sincronizado (primer arranque): se sincroniza antes de responder
+            await self.sincronizar()
+            version = versiones.version(self.tabla)
+            cuerpo, actualizado, error = await db_call(self._leer)
+        self.datos = orjson.loads(cuerpo)
+        self.indice = self._indexar(self.datos)
+        self.version, self.actualizado, self.error = version, actualizado, error
+        self.cargas += 1
+        return self.datos
+
+    def _leer(self, conn):
+        c = conn.cursor()
+        c.execute("SELECT actualizado, error FROM sincronizacion WHERE recurso = ?", (self.url,))
+        actualizado, error = c.fetchone() or (None, None)
+        c.execute("SELECT json_group_array(json(datos)) FROM (SELECT datos FROM {} ORDER BY orden)".format(self.tabla))
+        return c.fetchone()[0], actualizado, error
+
+    def _indexar(self, datos):
+        indice = {}
+        for item in datos:
+            indice.setdefault(item[self.clave], self.transformar(item) if self.transformar else item)
+        return indice
+
+    async def sincronizar(self):
+        # Si upstream falla se registra el error en el espejo y se propaga la excepcion
+        async with self._sincronizando:
+            etag, last_modified = await db_call(self._estado)
+            try:
+                response = await fetch_upstream(self.url, etag, last_modified)
+            except (UpstreamNoDisponible, HTTPException) as e:
+                self.errores += 1
+                motivo = e.motivo if isinstance(e, UpstreamNoDisponible) else "status {}".format(e.status_code)
+                if await db_call(self._registrar_error, motivo):
+                    versiones.incrementar(self.tabla)
+                raise
+            revalidado = response.status_code == 304
+            cuerpo = None if revalidado else response.text
+            cambios, habia_error = await db_call(self._guardar, cuerpo, response.headers.get('ETag'),
+                                                 response.headers.get('Last-Modified'))
+        self.sincronizaciones += 1
+        self.revalidaciones += revalidado
+        self.filas_cambiadas += cambios
+        if cambios or habia_error:
+            versiones.incrementar(self.tabla)
+        return {"revalidado": revalidado, "filas_cambiadas": cambios}
+
+    def _estado(self, conn):
+        # validadores para el GET condicional, solo si el espejo ya tiene datos
+        c = conn.cursor()
+        c.execute("SELECT etag, last_modified FROM sincronizacion WHERE recurso = ? AND actualizado IS NOT NULL", (self.url,))
+        return c.fetchone() or (None, None)
+
+    def _guardar(self, conn, cuerpo, etag, last_modified):
+        # Aplica la lista de upstream (JSON tal cual llego) sobre la tabla espejo
+        # dentro de sqlite; devuelve (filas cambiadas, si habia un error registrado)
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("INSERT OR IGNORE INTO sincronizacion (recurso) VALUES (?)", (self.url,))
+        c.execute("SELECT error FROM sincronizacion WHERE recurso = ?", (self.url,))
+        habia_error = c.fetchone()[0] is not None
+        cambios = 0
+        if cuerpo is not None:
+            clave = "json_extract(value, '$.{}')".format(self.clave)
+            columnas = (self.columna, "orden") + self.columnas + ("datos",)
+            # con ids repetidos gana el primero, como en el indice en memoria
+            valores = [clave, "MIN(key)"] + ["json_extract(value, '$.{}')".format(columna) for columna in self.columnas] + ["value"]
+            c.execute("""INSERT INTO {tabla} ({columnas})
+                         SELECT {valores} FROM json_each(?) GROUP BY {clave}
+                         ON CONFLICT ({columna}) DO UPDATE SET {asignaciones}
+                         WHERE {tabla}.datos IS NOT excluded.datos OR {tabla}.orden IS NOT excluded.orden""".format(
+                tabla=self.tabla, columnas=", ".join(columnas), valores=", ".join(valores), clave=clave,
+                columna=self.columna,
+                asignaciones=", ".join("{0} = excluded.{0}".format(columna) for columna in columnas[1:])),
+                (cuerpo,))
+            cambios += c.rowcount
+            c.execute("DELETE FROM {} WHERE {} NOT IN (SELECT {} FROM json_each(?))".format(self.tabla, self.columna, clave),
+                      (cuerpo,))
+            # rowcount no cuenta lo que cambian los triggers (estadisticas)
+            cambios += c.rowcount
+        c.execute("""UPDATE sincronizacion SET etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified),
+                     actualizado = ?, error = NULL WHERE recurso = ?""", (etag, last_modified, time.time(), self.url))
+        conn.commit()
+        return cambios, habia_error
+
+    def _registrar_error(self, conn, motivo):
+        # devuelve True si el espejo pasa de estar al dia a tener un error;
+        # proxima = 0 hace que el siguiente ciclo vuelva a intentar
+        c = conn.cursor()
+        c.execute("INSERT OR IGNORE INTO sincronizacion (recurso) VALUES (?)", (self.url,))
+        c.execute("SELECT error FROM sincronizacion WHERE recurso = ?", (self.url,))
+        nuevo = c.fetchone()[0] is None
+        c.execute("UPDATE sincronizacion SET error = ?, proxima = 0 WHERE recurso = ?", (motivo, self.url))
+        conn.commit()
+        return nuevo
+
+    def edad(self):
+        return time.time() - self.actualizado if self.actualizado is not None else None
+
+    def vencido(self):
+        return self.error is not None and self.actualizado is not None
+
+    def estadisticas(self):
+        return {
+            "hits": self.hits,
+            "cargas": self.cargas,
+            "sincronizaciones": self.sincronizaciones,
+            "revalidaciones": self.revalidaciones,
+            "filas_cambiadas": self.filas_cambiadas,
+            "errores": self.errores,
+            "intervalo": self.intervalo,
+            "edad": round(self.edad(), 3) if self.actualizado is not None else None,
+            "error": self.error,
+        }
+
+
+def headers_stale(*caches):
+    # Marca las respuestas armadas con catalogos cuya ultima sincronizacion
+    # fallo, con la edad (en segundos) del espejo mas viejo
+    edades = [cache.edad() for cache in caches if cache.vencido()]
+    return {"X-Upstream-Stale": str(int(max(edades)))} if edades else {}
+
+
+def resumen_usuario(usuario):
+    return {'usuario_id': usuario['id'], 'nombre': usuario['nombre'], 'apellido': usuario['apellido']}
+
+
+catalogos = {
+    HORARIOS_API_URL: CatalogoCache(HORARIOS_API_URL, float(os.environ.get("CACHE_TTL_HORARIOS", "60")), 'horario_id',
+                                    'horarios', 'horario_id', ('fecha', 'hora')),
+    CANCHAS_API_URL: CatalogoCache(CANCHAS_API_URL, float(os.environ.get("CACHE_TTL_CANCHAS", "300")), 'cancha_id',
+                                   'canchas', 'cancha_id'),
+    USUARIOS_API_URL: CatalogoCache(USUARIOS_API_URL, float(os.environ.get("CACHE_TTL_USUARIOS", "120")), 'id',
+                                    'usuarios', 'usuario_id', ('nombre', 'apellido'), resumen_usuario),
+}
+
+
+def reclamar_sincronizacion(conn, recurso, intervalo):
+    # Reparte las sincronizaciones entre workers: solo sincroniza el que logra mover 'proxima'
+    ahora = time.time()
+    c = conn.cursor()
+    c.execute("INSERT OR IGNORE INTO sincronizacion (recurso) VALUES (?)", (recurso,))
+    c.execute("UPDATE sincronizacion SET proxima = ? WHERE recurso = ? AND proxima <= ?", (ahora + intervalo, recurso, ahora))
+    reclamada = c.rowcount == 1
+    conn.commit()
+    return reclamada
+
+
+async def bucle_sincronizacion():
+    while True:
+        for cache in catalogos.values():
+            try:
+                if await db_call(reclamar_sincronizacion, cache.url, cache.intervalo):
+                    await cache.sincronizar()
+            except (UpstreamNoDisponible, HTTPException):
+                pass  # ya quedo registrado en el espejo, en el log y en las metricas
+            except Exception:
+                log.exception("error sincronizando catalogo", extra={"datos": {"recurso": cache.url}})
+        await asyncio.sleep(SINCRONIZACION_TICK)
+
+
+tarea_sincronizacion = None
+
+
+async def iniciar_sincronizacion():
+    global tarea_sincronizacion
+    if SINCRONIZACION_TICK > 0 and tarea_sincronizacion is None:
+        tarea_sincronizacion = asyncio.ensure_future(bucle_sincronizacion())
+
+
+async def detener_sincronizacion():
+    global tarea_sincronizacion
+    if tarea_sincronizacion is not None:
+        tarea_sincronizacion.cancel()
+        try:
+            await tarea_sincronizacion
+        except asyncio.CancelledError:
+            pass
+        tarea_sincronizacion = None
+
+
+# Ruta para sincronizar a pedido los catalogos (todos o uno: horarios, canchas, usuarios)
+@app.post("/sincronizar")
+async def post_sincronizar(response: Response, recurso: Optional[str] = None):
+    seleccion = [cache for cache in catalogos.values() if recurso is None or cache.tabla == recurso]
+    if not seleccion:
+        raise HTTPException(status_code=404, detail="Catalogo no encontrado")
+    resultados = await asyncio.gather(*(cache.sincronizar() for cache in seleccion), return_exceptions=True)
+    cuerpo = {}
+    for cache, resultado in zip(seleccion, resultados):
+        if isinstance(resultado, UpstreamNoDisponible):
+            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+            cuerpo[cache.tabla] = {"error": resultado.motivo}
+        elif isinstance(resultado, HTTPException):
+            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+            cuerpo[cache.tabla] = {"error": "status {}".format(resultado.status_code)}
+        elif isinstance(resultado, BaseException):
+            raise resultado
+        else:
+            cuerpo[cache.tabla] = resultado
+    return cuerpo
+
+
+# Ruta para consultar los contadores de la cache de catalogos externos
+@app.get("/cache/catalogos")
+async def get_cache_catalogos():
+    return {url: cache.estadisticas() for url, cache in catalogos.items()}
+
+
+@metricas.recolector
+def metricas_catalogos():
+    muestras = []
+    for url, cache in catalogos.items():
+        for resultado in ("hits", "cargas", "sincronizaciones", "revalidaciones", "filas_cambiadas", "errores"):
+            muestras.append(("catalogo_cache_total", (("catalogo", url), ("resultado", resultado)), getattr(cache, resultado)))
+        if cache.actualizado is not None:
+            muestras.append(("catalogo_edad_segundos", (("catalogo", url),), round(cache.edad(), 3)))
+    estados = {"cerrado": 0, "semiabierto": 1, "abierto": 2}
+    muestras.append(("upstream_circuito_estado", (), estados[circuito.estado]))
+    muestras.append(("upstream_circuito_aperturas_total", (), circuito.aperturas))
+    muestras.append(("upstream_circuito_rechazos_total", (), circuito.rechazos))
+    return muestras
+
+
+def leer_horarios_reservas(conn, horario_id=None, reserva_id=None):
+    # Join horarios x primera reserva del horario x cancha x usuario sobre el
+    # espejo local, en una sola consulta y con el JSON de la respuesta armado
+    # por sqlite. La primera reserva es la de menor reserva_id.
+    parametros = []
+    filtro_reserva = ""
+    if reserva_id is not None:
+        filtro_reserva = " AND reserva_id = ?"
+        parametros.append(reserva_id)
+    filtro_horario = ""
+    if horario_id is not None:
+        filtro_horario = " WHERE h.horario_id = ?"
+        parametros.append(horario_id)
+    c = conn.cursor()
+    c.execute("""
+        SELECT json_group_array(json(fila)) FROM (
+            SELECT json_object(
+                'horario_id', h.horario_id, 'fecha', h.fecha, 'hora', h.hora,
+                'reserva', CASE WHEN r.reserva_id IS NOT NULL THEN json_object(
+                    'reserva_id', r.reserva_id,
+                    'descripcion', r.descripcion,
+                    'num_personas', r.num_personas,
+                    'cancha', COALESCE(json(ca.datos), json_object()),
+                    'usuario', CASE WHEN u.usuario_id IS NOT NULL
+                                    THEN json_object('usuario_id', u.usuario_id, 'nombre', u.nombre, 'apellido', u.apellido)
+                                    ELSE json_object() END) END) AS fila
+            FROM horarios h
+            LEFT JOIN reservas r ON r.reserva_id = (
+                SELECT MIN(reserva_id) FROM reservas WHERE horario_id = h.horario_id{})
+            LEFT JOIN canchas ca ON ca.cancha_id = r.cancha_id
+            LEFT JOIN usuarios u ON u.usuario_id = r.usuario_id{}
+            ORDER BY h.orden)""".format(filtro_reserva, filtro_horario), parametros)
+    return c.fetchone()[0].encode("utf-8")
+
+
 @app.get("/horariosreservas/{horario_id}/reserva/{reserva_id}")
 @app.get("/horariosreservas/{horario_id}")
 @app.get("/horariosreservas")
-async def get_horario_reserva(horario_id: Optional[int] = None, reserva_id: Optional[int] = None):
-    headers = {
-        'Content-Type': 'application/json',
-        'Accept': 'application/json'
-    }
-    async with httpx.AsyncClient() as client:
-        # Fetching the external data
-        full_route = "{}{}".format(PREFIX, HORARIOS_API_URL)
-        print(full_route)
-        horarios_response = await client.get(full_route)
-        if horarios_response.status_code == 200:
-            horarios = horarios_response.json()
-        else:
-            print("Error: {horarios_response.status_code}")
-            raise HTTPException(status_code=404)
-        
-        full_route = "{}{}".format(PREFIX, CANCHAS_API_URL)
-        print(full_route)
-        canchas_response = await client.get(full_route)
-        if canchas_response.status_code == 200:
-            canchas = canchas_response.json()
+async def get_horario_reserva(request: Request, horario_id: Optional[int] = None, reserva_id: Optional[int] = None):
+    # Los catalogos salen del espejo local; esto solo hace falta para el primer
+    # arranque (espejo vacio) y para saber si la ultima sincronizacion fallo
+    await asyncio.gather(*(cache.obtener() for cache in catalogos.values()))
+
+    # La respuesta depende de las reservas y de los tres catalogos
+    no_modificado, headers_cache = validar_cache_http(request, ("reservas", "horarios", "canchas", "usuarios"),
+                                                      "{}|{}".format(horario_id, reserva_id))
+    headers_cache.update(headers_stale(*catalogos.values()))
+    if no_modificado:
+        no_modificado.headers.update(headers_cache)
+        return no_modificado
+
+    cuerpo = await db_call(leer_horarios_reservas, horario_id, reserva_id)
+    if horario_id is not None and cuerpo == b"[]":
+        raise HTTPException(status_code=404, detail="Horario no encontrado")
+    return Response(cuerpo, headers=headers_cache, media_type="application/json")
+
+
+# Indice de disponibilidad en memoria: por cada (cancha_id, fecha) un bitmap con
+# un bit por horario del dia (ordenados por hora), en 1 si el turno esta
+# reservado. Se construye una vez a partir del catalogo de horarios y de las
+# reservas, y despues se actualiza de forma incremental reaplicando el registro
+# reservas_cambios (migracion_8) desde el ultimo cambio visto: una consulta por
+# indice que trae solo las filas nuevas, tanto para las escrituras de este
+# worker como para las de los demas. Mientras la version de "reservas" no cambie
+# consultar los turnos libres no toca ni upstream ni la base de datos.
+class IndiceDisponibilidad:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # catalogos con los que se construyo el indice
+        self.horarios = None
+        self.catalogo_canchas = None
+        self.canchas = []
+        self.horarios_por_fecha = {}  # fecha -> [horario] ordenados por hora
+        self.posiciones = {}  # horario_id -> (fecha, bit)
+        self.ocupacion = {}  # (cancha_id, fecha) -> bitmap
+        # version compartida de "reservas" y ultimo cambio del registro que
+        # refleja el indice. La version se lee antes que el registro: todo
+        # cambio que ella cuenta ya esta confirmado y tiene su fila
+        self.version = None
+        self.seq = None
+
+    def construir(self, conn, horarios, canchas):
+        version = versiones.version("reservas")
+        c = conn.cursor()
+        # lo que cambie mientras se lee la tabla se reaplica desde 'seq' en la
+        # proxima puesta al dia (la version avanzo y ya no coincide)
+        c.execute("SELECT COALESCE(max(seq), 0) FROM reservas_cambios")
+        seq = c.fetchone()[0]
+        horarios_por_fecha = {}
+        for horario in horarios:
+            horarios_por_fecha.setdefault(horario['fecha'], []).append(horario)
+        posiciones = {}
+        for fecha, del_dia in horarios_por_fecha.items():
+            del_dia.sort(key=lambda horario: horario['hora'])
+            for bit, horario in enumerate(del_dia):
+                posiciones[horario['horario_id']] = (fecha, bit)
+
+        ocupacion = {}
+        c.execute("SELECT horario_id, cancha_id FROM reservas")
+        for horario_id, cancha_id in c:
+            posicion = posiciones.get(horario_id)
+            if posicion:
+                clave = (cancha_id, posicion[0])
+                ocupacion[clave] = ocupacion.get(clave, 0) | (1 << posicion[1])
+
+        with self._lock:
+            self.horarios = horarios
+            self.catalogo_canchas = canchas
+            self.canchas = sorted(cancha['cancha_id'] for cancha in canchas)
+            self.horarios_por_fecha = horarios_por_fecha
+            self.posiciones = posiciones
+            self.ocupacion = ocupacion
+            self.version = version
+            self.seq = seq
+
+    def poner_al_dia(self, conn, horarios, canchas):
+        # aplica en orden los cambios posteriores al ultimo visto; si el registro
+        # ya los descarto (mas de DISPONIBILIDAD_CAMBIOS de atraso) reconstruye
+        version = versiones.version("reservas")
+        with self._lock:
+            seq = self.seq
+        if seq is None:
+            self.construir(conn, horarios, canchas)
+            return
+        c = conn.cursor()
+        c.execute("SELECT seq, horario_id, cancha_id, ocupar FROM reservas_cambios WHERE seq > ? ORDER BY seq", (seq,))
+        cambios = c.fetchall()
+        if cambios and cambios[0][0] != seq + 1:
+            self.construir(conn, horarios, canchas)
+            return
+        hasta = cambios[-1][0] if cambios else seq
+        with self._lock:
+            # otra puesta al dia o una reconstruccion concurrente pudo haber
+            # movido self.seq: se aplica solo la continuacion, sin saltear cambios
+            for cambio, horario_id, cancha_id, ocupar in cambios:
+                if cambio == self.seq + 1:
+                    self._aplicar(ocupar, horario_id, cancha_id)
+                    self.seq = cambio
+            # la version solo avanza si el indice cubre todo lo leido
+            if self.seq >= hasta and version > self.version:
+                self.version = version
+
+    def _aplicar(self, ocupar, horario_id, cancha_id):
+        posicion = self.posiciones.get(horario_id)
+        if posicion is None:
+            return
+        clave = (cancha_id, posicion[0])
+        if ocupar:
+            self.ocupacion[clave] = self.ocupacion.get(clave, 0) | (1 << posicion[1])
         else:
-            print("Error: {canchas_response.status_code}")
-            raise HTTPException(status_code=404)
-        
-        full_route = "{}{}".format(PREFIX, USUARIOS_API_URL)
-        print(full_route)      
-        usuarios_response = await client.get(full_route, headers=headers)
-                                            
-                                          
-        if usuarios_response.status_code == 200:
-            usuarios = usuarios_response.json()
+            self.ocupacion[clave] = self.ocupacion.get(clave, 0) & ~(1 << posicion[1])
+
+    def libres(self, fecha, cancha_id=None):
+        with self._lock:
+            del_dia = self.horarios_por_fecha.get(fecha, [])
+            canchas = self.canchas if cancha_id is None else [cancha_id]
+            resultado = []
+            for cancha in canchas:
+                ocupados = self.ocupacion.get((cancha, fecha), 0)
+                resultado.append({
+                    "cancha_id": cancha,
+                    "libres": [{"horario_id": horario['horario_id'], "hora": horario['hora']}
+                               for bit, horario in enumerate(del_dia) if not ocupados >> bit & 1],
+                })
+            return resultado
+
+
+disponibilidad = IndiceDisponibilidad()
+
+
+# Difusion de cambios en tiempo real. Cada cambio se publica una sola vez
+# (ya serializado) y se reparte a las suscripciones SSE/WebSocket cuyo filtro
+# de cancha/fecha coincide. Cada suscripcion tiene una cola acotada: si un
+# cliente lento la llena se descartan sus eventos pendientes y recibe un
+# evento "desincronizado" para que vuelva a consultar el estado completo; el
+# que publica nunca se bloquea.
+EVENTOS_COLA = int(os.environ.get("EVENTOS_COLA", "100"))
+EVENTOS_KEEPALIVE = float(os.environ.get("EVENTOS_KEEPALIVE", "15"))
+
+
+class Suscripcion:
+    def __init__(self, cancha_id=None, fecha=None):
+        self.cancha_id = cancha_id
+        self.fecha = fecha
+        self.cola = asyncio.Queue(maxsize=EVENTOS_COLA)
+        self.descartados = 0
+
+    def acepta(self, canchas, fechas):
+        return ((self.cancha_id is None or self.cancha_id in canchas)
+                and (self.fecha is None or self.fecha in fechas))
+
+    def entregar(self, mensaje):
+        try:
+            self.cola.put_nowait(mensaje)
+        except asyncio.QueueFull:
+            self.descartados += self.cola.qsize()
+            while not self.cola.empty():
+                self.cola.get_nowait()
+            self.cola.put_nowait(MENSAJE_DESINCRONIZADO)
+
+
+class Difusor:
+    def __init__(self):
+        self.suscripciones = set()
+        self.loop = None
+        self._ids = itertools.count(1)
+        self.publicados = 0
+
+    def suscribir(self, cancha_id=None, fecha=None):
+        self.loop = asyncio.get_running_loop()
+        suscripcion = Suscripcion(cancha_id, fecha)
+        self.suscripciones.add(suscripcion)
+        return suscripcion
+
+    def desuscribir(self, suscripcion):
+        self.suscripciones.discard(suscripcion)
+
+    def publicar(self, evento, canchas=(), fechas=()):
+        # Se puede llamar desde el event loop o desde los hilos de los handlers sync
+        if not self.suscripciones or self.loop is None or self.loop.is_closed():
+            return
+        try:
+            en_el_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            en_el_loop = False
+        if en_el_loop:
+            self._repartir(evento, canchas, fechas)
         else:
-            print("Error: {usuarios_response.status_code}")
-            raise HTTPException(status_code=404)
-                                                                                                                                                                                                                                                                                                                                                                                 
-        
+            self.loop.call_soon_threadsafe(self._repartir, evento, canchas, fechas)
+
+    def _repartir(self, evento, canchas, fechas):
+        self.publicados += 1
+        mensaje = (next(self._ids), orjson.dumps(evento))
+        for suscripcion in tuple(self.suscripciones):
+            if suscripcion.acepta(canchas, fechas):
+                suscripcion.entregar(mensaje)
+
+
+MENSAJE_DESINCRONIZADO = (0, b'{"tipo":"desincronizado"}')
+difusor = Difusor()
+
+
+@metricas.recolector
+def metricas_eventos():
+    return [("eventos_suscripciones", (), len(difusor.suscripciones)),
+            ("eventos_publicados_total", (), difusor.publicados)]
+
+
+def accion_cambio(anterior, nueva):
+    if anterior is None:
+        return "creada"
+    if nueva is None:
+        return "eliminada"
+    return "modificada"
+
+
+def publicar_reserva(anterior, nueva):
+    horarios = catalogos[HORARIOS_API_URL].indice
+    reservas = [reserva for reserva in (anterior, nueva) if reserva is not None]
+    canchas = {reserva['cancha_id'] for reserva in reservas}
+    fechas = {horarios[reserva['horario_id']]['fecha'] for reserva in reservas if reserva['horario_id'] in horarios}
+    evento = {"tipo": "reserva", "accion": accion_cambio(anterior, nueva), "reserva": nueva or anterior}
+    if anterior is not None and nueva is not None:
+        evento["anterior"] = anterior
+    difusor.publicar(evento, canchas, fechas)
+
+
+# Cambios en reservas: avanza la version (el indice de disponibilidad la ve y
+# lee el cambio de reservas_cambios) y publica el evento.
+# anterior/nueva son dicts con las columnas de la reserva (None en altas/bajas)
+def reserva_modificada(anterior=None, nueva=None):
+    versiones.incrementar("reservas")
+    publicar_reserva(anterior, nueva)
+
+
+# Cambios en recordatorios (anterior/nuevo con las columnas del recordatorio)
+def recordatorio_modificado(anterior=None, nuevo=None):
+    versiones.incrementar("recordatorios")
+    fechas = {recordatorio['fecha'] for recordatorio in (anterior, nuevo) if recordatorio is not None}
+    evento = {"tipo": "recordatorio", "accion": accion_cambio(anterior, nuevo), "recordatorio": nuevo or anterior}
+    difusor.publicar(evento, (), fechas)
+    vence_en = vencimiento(nuevo['fecha'], nuevo['hora']) if nuevo is not None else None
+    if vence_en is not None:
+        programador.agendar(nuevo['id'], vence_en)
+
+
+# Ruta de eventos via Server-Sent Events, filtrables por cancha y fecha
+@app.get("/eventos")
+async def get_eventos(cancha_id: Optional[int] = None, fecha: Optional[str] = Query(None, regex=FECHA_REGEX)):
+    suscripcion = difusor.suscribir(cancha_id, fecha)
+
+    async def stream():
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                try:
+                    evento_id, datos = await asyncio.wait_for(suscripcion.cola.get(), EVENTOS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # comentario SSE para mantener viva la conexion a traves de proxies
+                    yield b": keepalive\n\n"
+                    continue
+                yield b"id: %d\ndata: %s\n\n" % (evento_id, datos)
+        finally:
+            difusor.desuscribir(suscripcion)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# Ruta de eventos via WebSocket, con los mismos filtros
+@app.websocket("/ws/eventos")
+async def ws_eventos(websocket: WebSocket, cancha_id: Optional[int] = None, fecha: Optional[str] = None):
+    await websocket.accept()
+    suscripcion = difusor.suscribir(cancha_id, fecha)
+    # el cliente no envia nada; se escucha igual para enterarse enseguida del cierre
+    recepcion = asyncio.ensure_future(websocket.receive())
+    try:
+        while True:
+            lectura = asyncio.ensure_future(suscripcion.cola.get())
+            await asyncio.wait((lectura, recepcion), timeout=EVENTOS_KEEPALIVE, return_when=asyncio.FIRST_COMPLETED)
+            desconectado = recepcion.done() and recepcion.result()["type"] == "websocket.disconnect"
+            # si terminaron las dos, el evento ya salio de la cola: se envia antes
+            # de atender lo recibido para no perderlo
+            if lectura.done():
+                if not desconectado:
+                    _, datos = lectura.result()
+                    await websocket.send_text(datos.decode("utf-8"))
+            else:
+                lectura.cancel()
+                if not recepcion.done():
+                    await websocket.send_text('{"tipo":"keepalive"}')
+            if desconectado:
+                break
+            if recepcion.done():
+                recepcion = asyncio.ensure_future(websocket.receive())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        recepcion.cancel()
+        difusor.desuscribir(suscripcion)
 
-    # fetch reservas from the local DB
-    conn = sqlite3.connect(db)
+
+# Ruta para consultar los turnos libres de una fecha, opcionalmente de una cancha
+@app.get("/disponibilidad")
+async def get_disponibilidad(response: Response, fecha: str = Query(..., regex=FECHA_REGEX), cancha_id: Optional[int] = None):
+    horarios = await catalogos[HORARIOS_API_URL].obtener()
+    canchas = await catalogos[CANCHAS_API_URL].obtener()
+    # el indice se reconstruye cuando cambia el catalogo de horarios o de canchas
+    # y se pone al dia con reservas_cambios cuando cambiaron las reservas
+    if disponibilidad.horarios is not horarios or disponibilidad.catalogo_canchas is not canchas:
+        await db_call(disponibilidad.construir, horarios, canchas)
+    elif disponibilidad.version != versiones.version("reservas"):
+        await db_call(disponibilidad.poner_al_dia, horarios, canchas)
+
+    if cancha_id is not None and cancha_id not in catalogos[CANCHAS_API_URL].indice:
+        raise HTTPException(status_code=404, detail="Cancha no encontrada")
+    response.headers.update(headers_stale(catalogos[HORARIOS_API_URL], catalogos[CANCHAS_API_URL]))
+    return {"fecha": fecha, "canchas": disponibilidad.libres(fecha, cancha_id)}
+
+
+# Estadisticas de reservas para tableros. Se leen de los resumenes que mantienen
+# los triggers de migracion_7, asi el costo depende de la cantidad de grupos
+# (canchas, dias, usuarios) del rango y no de la cantidad de reservas.
+# La ocupacion es reservas / turnos: horarios del rango por cada cancha.
+ESTADISTICAS_TOP_USUARIOS = int(os.environ.get("ESTADISTICAS_TOP_USUARIOS", "10"))
+
+
+def ocupacion(reservas, turnos):
+    return round(reservas / turnos, 4) if turnos else None
+
+
+def leer_estadisticas(conn, desde, hasta, usuarios):
+    # sin rango tambien cuentan las reservas de horarios que no estan en el espejo (fecha '')
+    filtros, parametros = [], []
+    if desde is not None:
+        filtros.append("fecha >= ?")
+        parametros.append(desde)
+    if hasta is not None:
+        filtros.append("fecha <= ?")
+        parametros.append(hasta)
+    if filtros:
+        filtros.append("fecha <> ''")
+    where = " WHERE " + " AND ".join(filtros) if filtros else ""
     c = conn.cursor()
-    c.execute("SELECT reserva_id, cancha_id, usuario_id, horario_id, descripcion, num_personas FROM reservas")
-    reservas = c.fetchall()
-    conn.close()
-    
-    # Convertir los resultados en una lista de diccionarios
-    reservas = [
-        {"reserva_id":row[0], "cancha_id": row[1], "usuario_id": row[2], "horario_id": row[3], "descripcion": row[4], "num_personas": row[5]}
-        for row in reservas
-    ]
-
-    # Map cancha_id and usuario_id to their details
-    cancha_map = {cancha['cancha_id']: cancha for cancha in canchas}
-    usuario_map = {usuario['id']: { 'usuario_id': usuario['id'],'nombre': usuario['nombre'], 'apellido': usuario['apellido']} for usuario in usuarios}
-
-    # Combine the data
-    horarioreserva_array = []
-
-    for horario in horarios:
-        
-        if horario_id is not None and horario['horario_id'] != horario_id:
-            continue
-        
-        horarioreserva = {
-            "horario_id": horario['horario_id'],
-            "fecha": horario['fecha'],
-            "hora": horario['hora'],
-            "reserva": None
-        }
 
-        for reserva in reservas:
-            
-            if reserva_id is not None and reserva['reserva_id'] != reserva_id:
-                continue
-            
-            if reserva['horario_id'] == horario['horario_id']:
-                cancha = cancha_map.get(reserva['cancha_id'], {})
-                usuario = usuario_map.get(reserva['usuario_id'], {})
-
-                horarioreserva['reserva'] = {
-                    "reserva_id": reserva['reserva_id'],
-                    "descripcion": reserva['descripcion'],
-                    "num_personas": reserva['num_personas'],
-                    "cancha": cancha,  # Include cancha details
-                    "usuario": usuario  # Include user details
-                }
-                break  # Only one reserva per horario
+    c.execute("SELECT count(*) FROM horarios" + where, parametros)
+    horarios = c.fetchone()[0]
+    c.execute("SELECT count(*) FROM canchas")
+    canchas_catalogo = c.fetchone()[0]
+
+    c.execute("""SELECT cancha_id, sum(reservas), sum(personas) FROM estadisticas_cancha{}
+                 GROUP BY cancha_id ORDER BY cancha_id""".format(where), parametros)
+    canchas = [{"cancha_id": cancha_id, "reservas": reservas, "personas": personas,
+                "ocupacion": ocupacion(reservas, horarios)} for cancha_id, reservas, personas in c.fetchall()]
+    total_reservas = sum(cancha["reservas"] for cancha in canchas)
+    total_personas = sum(cancha["personas"] for cancha in canchas)
+
+    c.execute("""SELECT fecha, count(*), count(e.horario_id), COALESCE(sum(e.reservas), 0), COALESCE(sum(e.personas), 0)
+                 FROM horarios h LEFT JOIN estadisticas_horario e USING (horario_id)
+                 WHERE {} GROUP BY fecha ORDER BY fecha""".format(" AND ".join(["h.fecha IS NOT NULL"] + [
+        filtro.replace("fecha", "h.fecha") for filtro in filtros])), parametros)
+    dias = [{"fecha": fecha, "horarios": cantidad, "horarios_con_reservas": con_reservas, "reservas": reservas,
+             "personas": personas, "ocupacion": ocupacion(reservas, cantidad * canchas_catalogo)}
+            for fecha, cantidad, con_reservas, reservas, personas in c.fetchall()]
+
+    c.execute("SELECT count(DISTINCT usuario_id) FROM estadisticas_usuario" + where, parametros)
+    usuarios_con_reservas = c.fetchone()[0]
+    c.execute("""SELECT usuario_id, sum(reservas) AS total, sum(personas) FROM estadisticas_usuario{}
+                 GROUP BY usuario_id ORDER BY total DESC, usuario_id LIMIT ?""".format(where), parametros + [usuarios])
+    top_usuarios = [{"usuario_id": usuario_id, "reservas": reservas, "personas": personas}
+                    for usuario_id, reservas, personas in c.fetchall()]
+
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "total": {"reservas": total_reservas, "personas": total_personas,
+                  "promedio_personas": round(total_personas / total_reservas, 2) if total_reservas else None,
+                  "horarios": horarios, "ocupacion": ocupacion(total_reservas, horarios * canchas_catalogo),
+                  "usuarios": usuarios_con_reservas},
+        "canchas": canchas,
+        "dias": dias,
+        "usuarios": top_usuarios,
+    }
+
+
+# Ruta para consultar estadisticas de reservas por cancha, por dia y por usuario
+@app.get("/estadisticas")
+async def get_estadisticas(request: Request,
+                           desde: Optional[str] = Query(None, regex=FECHA_REGEX),
+                           hasta: Optional[str] = Query(None, regex=FECHA_REGEX),
+                           usuarios: int = Query(ESTADISTICAS_TOP_USUARIOS, ge=0, le=PAGINA_LIMITE_MAX)):
+    # los turnos por dia salen del espejo de horarios y canchas
+    await catalogos[HORARIOS_API_URL].obtener()
+    await catalogos[CANCHAS_API_URL].obtener()
+    no_modificado, headers_cache = validar_cache_http(request, ("reservas", "horarios", "canchas"), str(request.url.query))
+    if no_modificado:
+        return no_modificado
+    estadisticas = await db_call(leer_estadisticas, desde, hasta, usuarios)
+    headers_cache.update(headers_stale(catalogos[HORARIOS_API_URL], catalogos[CANCHAS_API_URL]))
+    return ORJSONResponse(estadisticas, headers=headers_cache)
+
+
+# Programador de recordatorios: un min-heap de (vence_en, id) en memoria indica
+# cuando despertar, y al despertar los vencidos se reclaman en la base con un
+# UPDATE ... RETURNING sobre el indice de pendientes, de a RECORDATORIOS_LOTE.
+# El reclamo es atomico, asi cada recordatorio se dispara en un solo worker;
+# cada RECORDATORIOS_TICK segundos se reclama igual, para los que agendo otro
+# worker o se escribieron por fuera de la app. Los vencidos hace mas de
+# RECORDATORIOS_TOLERANCIA segundos se marcan como perdidos sin enviarse.
+# Si un destino falla el lote se libera y se reintenta en el proximo tick.
+RECORDATORIOS_TICK = float(os.environ.get("RECORDATORIOS_TICK", "30"))
+RECORDATORIOS_LOTE = int(os.environ.get("RECORDATORIOS_LOTE", "100"))
+RECORDATORIOS_TOLERANCIA = float(os.environ.get("RECORDATORIOS_TOLERANCIA", "86400"))
+# destinos separados por coma: log, eventos (SSE/WebSocket) o una url de webhook
+RECORDATORIOS_DESTINOS = os.environ.get("RECORDATORIOS_DESTINOS", "log")
+# zona de las fechas de los recordatorios (ej. America/Argentina/Buenos_Aires); vacio: la del servidor
+RECORDATORIOS_ZONA = os.environ.get("RECORDATORIOS_ZONA", "")
+metricas.registrar("recordatorios_programados", "gauge", "Entradas en el heap del programador de recordatorios")
+metricas.registrar("recordatorios_disparados_total", "counter", "Recordatorios vencidos por resultado")
+
+
+def vencimiento(fecha, hora):
+    # mismo valor que VENCE_EN_SQL para fechas y horas validas; None si no lo son
+    # (filas escritas por fuera de la app), que no se agendan
+    try:
+        return calendar.timegm(time.strptime(fecha + " " + hora, "%Y-%m-%d %H:%M"))
+    except ValueError:
+        return None
+
+
+def ahora_recordatorios():
+    if RECORDATORIOS_ZONA:
+        from zoneinfo import ZoneInfo
+        return calendar.timegm(datetime.now(ZoneInfo(RECORDATORIOS_ZONA)).timetuple())
+    return calendar.timegm(time.localtime())
+
+
+COLUMNAS_RECORDATORIO_VENCIMIENTO = COLUMNAS_RECORDATORIO + ("vence_en",)
+
+
+def reclamar_recordatorios(conn, ahora, lote):
+    c = conn.cursor()
+    c.execute("UPDATE recordatorios SET disparado = ? WHERE disparado IS NULL AND vence_en < ?",
+              (time.time(), ahora - RECORDATORIOS_TOLERANCIA))
+    perdidos = c.rowcount
+    c.execute("""UPDATE recordatorios SET disparado = ?
+                 WHERE id IN (SELECT id FROM recordatorios WHERE disparado IS NULL AND vence_en <= ? ORDER BY vence_en LIMIT ?)
+                 RETURNING {}""".format(", ".join(COLUMNAS_RECORDATORIO_VENCIMIENTO)), (time.time(), ahora, lote))
+    recordatorios = [dict(zip(COLUMNAS_RECORDATORIO_VENCIMIENTO, row)) for row in c.fetchall()]
+    conn.commit()
+    return perdidos, sorted(recordatorios, key=lambda recordatorio: (recordatorio['vence_en'], recordatorio['id']))
+
+
+def liberar_recordatorios(conn, ids):
+    conn.executemany("UPDATE recordatorios SET disparado = NULL WHERE id = ?", ((i,) for i in ids))
+    conn.commit()
+
+
+def leer_proximos(conn, desde, hasta, limit):
+    c = conn.cursor()
+    c.execute("SELECT {} FROM recordatorios WHERE disparado IS NULL AND vence_en BETWEEN ? AND ? ORDER BY vence_en, id LIMIT ?"
+              .format(objeto_json_sql(COLUMNAS_RECORDATORIO_VENCIMIENTO)), (desde, hasta, limit))
+    return ("[" + ",".join(row[0] for row in c.fetchall()) + "]").encode("utf-8")
+
+
+def leer_pendientes(conn):
+    c = conn.cursor()
+    c.execute("SELECT vence_en, id FROM recordatorios WHERE disparado IS NULL AND vence_en IS NOT NULL")
+    return c.fetchall()
+
+
+async def destino_log(recordatorios):
+    log.info("recordatorios vencidos", extra={"datos": {"ids": [recordatorio['id'] for recordatorio in recordatorios]}})
+
+
+async def destino_eventos(recordatorios):
+    fechas = {recordatorio['fecha'] for recordatorio in recordatorios}
+    difusor.publicar({"tipo": "recordatorios_vencidos", "recordatorios": recordatorios}, (), fechas)
+
+
+def destino_webhook(url):
+    async def enviar(recordatorios):
+        response = await get_http_client().post(url, content=orjson.dumps(recordatorios),
+                                                headers={"Content-Type": "application/json"})
+        response.raise_for_status()
+    return enviar
+
+
+# Destinos por nombre; se pueden agregar otros antes del startup
+DESTINOS_RECORDATORIO = {"log": destino_log, "eventos": destino_eventos}
+
+
+def destinos_configurados():
+    # se resuelven al arrancar: un destino mal escrito hace fallar el startup
+    destinos = []
+    for nombre in RECORDATORIOS_DESTINOS.split(","):
+        nombre = nombre.strip()
+        if nombre.startswith(("http://", "https://")):
+            destinos.append(destino_webhook(nombre))
+        elif nombre in DESTINOS_RECORDATORIO:
+            destinos.append(DESTINOS_RECORDATORIO[nombre])
+        elif nombre:
+            raise ValueError("RECORDATORIOS_DESTINOS: destino desconocido {!r} (validos: {} o una url de webhook)"
+                             .format(nombre, ", ".join(sorted(DESTINOS_RECORDATORIO))))
+    return destinos
+
+
+class ProgramadorRecordatorios:
+    def __init__(self, lote=RECORDATORIOS_LOTE, tick=RECORDATORIOS_TICK):
+        self.lote = lote
+        self.tick = tick
+        self.heap = []  # (vence_en, id); las entradas de recordatorios modificados o borrados quedan y no reclaman nada
+        self.destinos = []
+        self.loop = None
+        self.despertar = None
+        self.enviados = 0
+        self.perdidos = 0
+        self.errores = 0
+
+    def agendar(self, recordatorio_id, vence_en):
+        # Se puede llamar desde el event loop o desde los hilos de los handlers sync
+        if self.loop is None or self.loop.is_closed():
+            return
+        try:
+            en_el_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            en_el_loop = False
+        if en_el_loop:
+            self._agendar(recordatorio_id, vence_en)
+        else:
+            self.loop.call_soon_threadsafe(self._agendar, recordatorio_id, vence_en)
+
+    def _agendar(self, recordatorio_id, vence_en):
+        heapq.heappush(self.heap, (vence_en, recordatorio_id))
+        # solo hace falta despertar si cambia el proximo vencimiento
+        if self.heap[0][1] == recordatorio_id:
+            self.despertar.set()
+
+    async def correr(self):
+        self.loop = asyncio.get_running_loop()
+        self.despertar = asyncio.Event()
+        # estado inicial en una sola pasada por la tabla; se suma a lo agendado mientras tanto
+        while True:
+            try:
+                pendientes = await db_call(leer_pendientes)
+                break
+            except Exception:
+                log.exception("error leyendo recordatorios pendientes")
+                await asyncio.sleep(self.tick)
+        self.heap = pendientes + self.heap
+        heapq.heapify(self.heap)
+        while True:
+            ahora = ahora_recordatorios()
+            while self.heap and self.heap[0][0] <= ahora:
+                heapq.heappop(self.heap)
+            try:
+                await self.disparar(ahora)
+            except Exception:
+                log.exception("error disparando recordatorios")
+            espera = min(self.tick, self.heap[0][0] - ahora) if self.heap else self.tick
+            self.despertar.clear()
+            try:
+                await asyncio.wait_for(self.despertar.wait(), max(espera, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def disparar(self, ahora):
+        while True:
+            perdidos, recordatorios = await db_call(reclamar_recordatorios, ahora, self.lote)
+            if perdidos:
+                self.perdidos += perdidos
+                log.warning("recordatorios vencidos sin enviar", extra={"datos": {"cantidad": perdidos}})
+            if not recordatorios:
+                return
+            try:
+                for destino in self.destinos:
+                    await destino(recordatorios)
+            except Exception:
+                self.errores += len(recordatorios)
+                log.exception("error enviando recordatorios", extra={"datos": {"cantidad": len(recordatorios)}})
+                await db_call(liberar_recordatorios, [recordatorio['id'] for recordatorio in recordatorios])
+                return
+            self.enviados += len(recordatorios)
+            if len(recordatorios) < self.lote:
+                return
+
+
+programador = ProgramadorRecordatorios()
+tarea_programador = None
+
+
+@metricas.recolector
+def metricas_programador():
+    return [("recordatorios_programados", (), len(programador.heap))] + [
+        ("recordatorios_disparados_total", (("resultado", resultado),), getattr(programador, resultado))
+        for resultado in ("enviados", "perdidos", "errores")]
+
+
+async def iniciar_programador():
+    global tarea_programador
+    if RECORDATORIOS_TICK > 0 and tarea_programador is None:
+        programador.destinos = destinos_configurados()
+        tarea_programador = asyncio.ensure_future(programador.correr())
+
+
+async def detener_programador():
+    global tarea_programador
+    if tarea_programador is not None:
+        tarea_programador.cancel()
+        try:
+            await tarea_programador
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # que no impida cerrar lo demas
+            log.exception("el programador de recordatorios termino con error")
+        tarea_programador = None
+        programador.loop = None
+
+
+# Ruta para consultar los recordatorios pendientes que vencen en los proximos minutos
+@app.get("/recordatorios/proximos")
+async def get_recordatorios_proximos(minutos: int = Query(60, ge=1, le=7 * 24 * 60),
+                                     limit: int = Query(PAGINA_LIMITE_DEFAULT, ge=1, le=PAGINA_LIMITE_MAX)):
+    ahora = ahora_recordatorios()
+    cuerpo = await db_call(leer_proximos, ahora, ahora + minutos * 60, limit)
+    return Response(cuerpo, media_type="application/json")
+
+
+# Arranque y parada de cada worker. FastAPI 0.88 no acepta lifespan= en el
+# constructor, asi que el context manager se instala en el router de starlette.
+# Antes de aceptar requests se verifica el esquema, se abren las conexiones del
+# pool y el cliente de upstream y se cargan los catalogos del espejo local; la
+# parada detiene las tareas de fondo antes de cerrar lo que usan.
+ARRANQUE_PRECALENTAR = os.environ.get("ARRANQUE_PRECALENTAR", "1") == "1"
+# espera maxima de la carga de catalogos al arrancar (con el espejo vacio sincroniza con upstream)
+ARRANQUE_ESPERA_CATALOGOS = float(os.environ.get("ARRANQUE_ESPERA_CATALOGOS", "5"))
+
+
+async def precalentar():
+    inicio = time.perf_counter()
+    await asyncio.get_running_loop().run_in_executor(_get_db_executor(), pool.precalentar, DB_POOL_SIZE)
+    get_http_client()
+    try:
+        resultados = await asyncio.wait_for(asyncio.gather(*[cache.obtener() for cache in catalogos.values()],
+                                                           return_exceptions=True), ARRANQUE_ESPERA_CATALOGOS)
+    except asyncio.TimeoutError as e:
+        resultados = [e]
+    errores = [repr(resultado) for resultado in resultados if isinstance(resultado, BaseException)]
+    if errores:
+        # los catalogos se vuelven a pedir en el primer request o en la sincronizacion
+        log.warning("catalogos no cargados al arrancar", extra={"datos": {"errores": errores}})
+    log.info("worker precalentado", extra={"datos": {"segundos": round(time.perf_counter() - inicio, 3)}})
 
-        horarioreserva_array.append(horarioreserva)
-        
-    if horario_id is not None and not horarioreserva_array:
-        raise HTTPException(status_code=404, detail="Horario no encontrado")
 
-    return JSONResponse(content=horarioreserva_array)
+@asynccontextmanager
+async def ciclo_de_vida(app):
+    iniciar_logging()
+    await asyncio.get_running_loop().run_in_executor(_get_db_executor(), asegurar_esquema)
+    if ARRANQUE_PRECALENTAR:
+        await precalentar()
+    try:
+        await iniciar_sincronizacion()
+        await iniciar_programador()
+        yield
+    finally:
+        await detener_programador()
+        await detener_sincronizacion()
+        await cerrar_http_client()
+        cerrar_pool()
+        detener_logging()
 
 
+app.router.lifespan_context = ciclo_de_vida
 
 
 if __name__ == '__main__':
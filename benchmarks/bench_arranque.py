@@ -0,0 +1,106 @@
+# Arranque de un worker, como en un reinicio o un autoscaling en frio sobre una
+# base ya migrada y un espejo ya sincronizado:
+#  - importar_ms: import api.main en un proceso nuevo
+#  - listo_ms: desde que se lanza uvicorn hasta la primera respuesta a GET /
+#  - primer_request_ms / segundo_request_ms: GET /horariosreservas/1 y
+#    GET /disponibilidad recien arrancado (sin precalentar, el primero abre las
+#    conexiones y el cliente de upstream y carga los catalogos)
+# Con --comparar REF mide tambien el api/main.py de esa revision de git.
+#   python -m benchmarks.bench_arranque --repeticiones 5 --comparar HEAD~1
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import RAIZ, detener, esperar, iniciar, imprimir, puerto_libre
+
+RUTAS = ("/horariosreservas/1", "/disponibilidad?fecha=2024-01-01")
+
+
+def extraer(ref):
+    # copia de api/main.py de la revision 'ref' en un directorio aparte
+    fuente = tempfile.mkdtemp(prefix="arranque-{}-".format(ref.replace("/", "_")))
+    os.mkdir(os.path.join(fuente, "api"))
+    with open(os.path.join(fuente, "api", "main.py"), "wb") as archivo:
+        archivo.write(subprocess.check_output(["git", "show", "{}:api/main.py".format(ref)], cwd=RAIZ))
+    return fuente
+
+
+def importar(fuente, directorio):
+    codigo = ("import sys, time; sys.path.insert(0, {!r}); inicio = time.perf_counter(); import api.main; "
+              "print(time.perf_counter() - inicio)").format(fuente)
+    salida = subprocess.check_output([sys.executable, "-c", codigo], cwd=directorio, env=dict(os.environ, LOG_LEVEL="ERROR"))
+    return float(salida.decode().split()[-1]) * 1000
+
+
+def arrancar(fuente, directorio, entorno):
+    puerto = puerto_libre()
+    url = "http://127.0.0.1:{}".format(puerto)
+    inicio = time.perf_counter()
+    app = iniciar(["-m", "uvicorn", "api.main:app", "--app-dir", fuente, "--host", "127.0.0.1", "--port", str(puerto),
+                   "--no-access-log", "--log-level", "warning"], directorio, entorno)
+    try:
+        while True:
+            try:
+                httpx.get(url + "/", timeout=1.0)
+                break
+            except httpx.HTTPError:
+                if app.poll() is not None:
+                    raise RuntimeError("la app termino al arrancar")
+                time.sleep(0.005)
+        resultado = {"listo_ms": (time.perf_counter() - inicio) * 1000}
+        with httpx.Client(base_url=url, timeout=30.0) as http:
+            for orden in ("primer", "segundo"):
+                inicio = time.perf_counter()
+                for ruta in RUTAS:
+                    assert http.get(ruta).status_code == 200
+                resultado[orden + "_request_ms"] = (time.perf_counter() - inicio) * 1000
+    finally:
+        detener(app)
+    return resultado
+
+
+def medir(fuente, entorno, repeticiones):
+    directorio = tempfile.mkdtemp(prefix="arranque-")
+    # primer arranque: crea la base y sincroniza el espejo (no se cuenta)
+    importar(fuente, directorio)
+    arrancar(fuente, directorio, entorno)
+    corridas = []
+    for _ in range(repeticiones):
+        corrida = {"importar_ms": importar(fuente, directorio)}
+        corrida.update(arrancar(fuente, directorio, entorno))
+        corridas.append(corrida)
+    return {clave: round(statistics.median(corrida[clave] for corrida in corridas), 1) for clave in corridas[0]}
+
+
+def main_arranque():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--comparar", help="revision de git con la que comparar (ej. HEAD~1)")
+    parser.add_argument("--horarios", type=int, default=2000)
+    args = parser.parse_args()
+
+    puerto_stub = puerto_libre()
+    stub = iniciar(["-m", "benchmarks.upstream_stub", "--puerto", str(puerto_stub), "--horarios", str(args.horarios)], RAIZ)
+    entorno = {"UPSTREAM_PREFIX": "http://127.0.0.1:{}".format(puerto_stub), "LOG_LEVEL": "WARNING",
+               "LIMITE_ALTAS": "0", "LIMITE_CONSULTAS": "0"}
+    versiones = [("actual", RAIZ)] + ([(args.comparar, extraer(args.comparar))] if args.comparar else [])
+    resultados = {}
+    try:
+        esperar("http://127.0.0.1:{}/api/canchas".format(puerto_stub), stub)
+        for nombre, fuente in versiones:
+            resultados[nombre] = medir(fuente, entorno, args.repeticiones)
+            if nombre == "actual":
+                resultados["actual_sin_precalentar"] = medir(fuente, dict(entorno, ARRANQUE_PRECALENTAR="0"), args.repeticiones)
+    finally:
+        detener(stub)
+    imprimir({"parametros": vars(args), "resultados": resultados})
+
+
+if __name__ == "__main__":
+    main_arranque()
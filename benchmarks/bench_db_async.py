@@ -0,0 +1,78 @@
+# Latencia p99 con lecturas y escrituras concurrentes, con el acceso a la base
+# dentro del event loop ("bloqueante", como antes) y via db_call en hilos dedicados.
+#   python -m benchmarks.bench_db_async --reservas 20000 --clientes 32 --duracion 5
+import argparse
+import asyncio
+import itertools
+import time
+
+import httpx
+
+from benchmarks.common import cargar_app, imprimir, resumen, sembrar
+
+
+_horarios = itertools.count(100000)
+
+
+async def _inline_db_call(fn, *args, **kwargs):
+    # Comportamiento anterior: sqlite3 ejecutado directamente en el event loop
+    with main.pool.connection() as conn:
+        return fn(conn, *args, **kwargs)
+
+
+async def _cliente(http, tipo, fin, latencias):
+    # La latencia se mide desde el momento en que el request deberia haber
+    # salido, asi se incluye el tiempo que el cliente espero a que el event
+    # loop quedara libre (evita la "omision coordinada")
+    pausa = 0.005 if tipo == "sonda" else 0.001
+    objetivo = time.perf_counter()
+    while time.perf_counter() < fin:
+        if tipo == "lectura":
+            r = await http.get("/reservas")
+        elif tipo == "escritura":
+            r = await http.post("/reservas", json={"cancha_id": 1, "usuario_id": 1, "horario_id": next(_horarios),
+                                                   "descripcion": "bench", "num_personas": 4})
+        else:
+            r = await http.get("/")
+        r.raise_for_status()
+        latencias[tipo].append(time.perf_counter() - objetivo)
+        objetivo = time.perf_counter() + pausa
+        await asyncio.sleep(pausa)
+
+
+async def _correr(clientes, duracion):
+    latencias = {"lectura": [], "escritura": [], "sonda": []}
+    transporte = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as http:
+        fin = time.perf_counter() + duracion
+        tareas = []
+        for i in range(clientes):
+            tipo = "escritura" if i % 4 else "lectura"
+            tareas.append(_cliente(http, tipo, fin, latencias))
+        tareas.append(_cliente(http, "sonda", fin, latencias))
+        await asyncio.gather(*tareas)
+    return {tipo: resumen(valores, duracion) for tipo, valores in latencias.items()}
+
+
+def main_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reservas", type=int, default=20000)
+    parser.add_argument("--clientes", type=int, default=32)
+    parser.add_argument("--duracion", type=float, default=5.0)
+    args = parser.parse_args()
+
+    sembrar(main.db, reservas=args.reservas)
+    async_db_call = main.db_call
+
+    main.db_call = _inline_db_call
+    antes = asyncio.run(_correr(args.clientes, args.duracion))
+    main.db_call = async_db_call
+    despues = asyncio.run(_correr(args.clientes, args.duracion))
+
+    imprimir({"parametros": vars(args), "bloqueante": antes, "executor": despues})
+
+
+main, _ = cargar_app()
+
+if __name__ == "__main__":
+    main_bench()
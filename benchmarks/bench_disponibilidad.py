@@ -0,0 +1,113 @@
+# Costo de mantener al dia el indice de disponibilidad de un worker cuando las
+# reservas las escribe otro worker (la version compartida avanza sin que este
+# vea el cambio):
+#  - reconstruir: releer toda la tabla de reservas (lo que se hacia antes)
+#  - poner_al_dia: reaplicar las filas nuevas de reservas_cambios
+# para distintas cantidades de cambios pendientes. Despues de altas, cambios de
+# turno y bajas al azar verifica que el indice puesto al dia coincide con uno
+# reconstruido desde cero, y mide cuanto les cuesta a las altas escribir el
+# registro (triggers activos o borrados).
+#   python -m benchmarks.bench_disponibilidad --reservas 200000 --pendientes 1 10 100 1000
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+from benchmarks.common import cargar_app, imprimir, sembrar
+
+CANCHAS = 8
+
+
+def catalogos(horarios):
+    return ([{"horario_id": i, "fecha": "2024-{:02d}-{:02d}".format(1 + (i - 1) // 28 // 16 % 12, 1 + (i - 1) // 16 % 28),
+              "hora": "{:02d}:00".format(8 + (i - 1) % 16)} for i in range(1, horarios + 1)],
+            [{"cancha_id": i} for i in range(1, CANCHAS + 1)])
+
+
+def escribir(conn, rnd, cantidad, horarios):
+    # altas, cambios de turno y bajas de "otro worker"
+    c = conn.cursor()
+    ultima = c.execute("SELECT max(reserva_id) FROM reservas").fetchone()[0]
+    for _ in range(cantidad):
+        op = rnd.random()
+        if op < 0.4:
+            c.execute("INSERT OR IGNORE INTO reservas (cancha_id, usuario_id, horario_id, descripcion, num_personas) VALUES (?, 1, ?, 'b', 4)",
+                      (rnd.randint(1, CANCHAS), rnd.randint(1, horarios)))
+        elif op < 0.7:
+            c.execute("UPDATE OR IGNORE reservas SET cancha_id = ?, horario_id = ? WHERE reserva_id = ?",
+                      (rnd.randint(1, CANCHAS), rnd.randint(1, horarios), rnd.randint(1, ultima)))
+        else:
+            c.execute("DELETE FROM reservas WHERE reserva_id = ?", (rnd.randint(1, ultima),))
+        conn.commit()
+        main.versiones.incrementar("reservas")
+
+
+def altas_por_segundo(conn, cantidad, primer_horario):
+    inicio = time.perf_counter()
+    c = conn.cursor()
+    for i in range(cantidad):
+        main.insertar_reserva(c, main.Reserva(cancha_id=i % CANCHAS + 1, usuario_id=1, horario_id=primer_horario + i // CANCHAS,
+                                              descripcion="bench", num_personas=4))
+        conn.commit()
+    return round(cantidad / (time.perf_counter() - inicio))
+
+
+def main_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reservas", type=int, default=200000)
+    parser.add_argument("--pendientes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--altas", type=int, default=2000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    ruta = os.path.join(directorio, main.db)
+    horarios_total = -(-args.reservas // CANCHAS) * 2
+    sembrar(ruta, args.reservas, 0, horarios=horarios_total, canchas=CANCHAS)
+    horarios, canchas = catalogos(horarios_total)
+    conn = sqlite3.connect(ruta)
+    escritor = sqlite3.connect(ruta)
+    rnd = random.Random(3)
+    indice = main.IndiceDisponibilidad()
+    indice.construir(conn, horarios, canchas)
+
+    resultados = {}
+    for pendientes in args.pendientes:
+        reconstruir, al_dia = [], []
+        for _ in range(args.repeticiones):
+            escribir(escritor, rnd, pendientes, horarios_total)
+            inicio = time.perf_counter()
+            main.IndiceDisponibilidad().construir(conn, horarios, canchas)
+            reconstruir.append(time.perf_counter() - inicio)
+            inicio = time.perf_counter()
+            indice.poner_al_dia(conn, horarios, canchas)
+            al_dia.append(time.perf_counter() - inicio)
+        resultados[str(pendientes)] = {"reconstruir_ms": round(min(reconstruir) * 1000, 3),
+                                       "poner_al_dia_ms": round(min(al_dia) * 1000, 3)}
+
+    escribir(escritor, rnd, 2000, horarios_total)
+    indice.poner_al_dia(conn, horarios, canchas)
+    referencia = main.IndiceDisponibilidad()
+    referencia.construir(conn, horarios, canchas)
+    coinciden = ({clave: bits for clave, bits in indice.ocupacion.items() if bits}
+                 == {clave: bits for clave, bits in referencia.ocupacion.items() if bits})
+    al_dia = indice.version == main.versiones.version("reservas")
+
+    altas = {"altas_con_registro_por_s": altas_por_segundo(escritor, args.altas, horarios_total + 1)}
+    for (nombre,) in escritor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'reservas_cambios_%'").fetchall():
+        escritor.execute("DROP TRIGGER " + nombre)
+    altas["altas_sin_registro_por_s"] = altas_por_segundo(escritor, args.altas, horarios_total + 1 + args.altas)
+    escritor.close()
+    conn.close()
+
+    imprimir({"parametros": vars(args), "por_pendientes": resultados, "altas": altas,
+              "coincide_con_reconstruido": coinciden, "version_al_dia": al_dia})
+    if not coinciden or not al_dia:
+        sys.exit(1)
+
+
+main, directorio = cargar_app()
+
+if __name__ == "__main__":
+    main_bench()
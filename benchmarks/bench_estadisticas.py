@@ -0,0 +1,155 @@
+# Estadisticas de reservas para un tablero (por cancha, por dia y por usuario
+# en un rango de fechas):
+#  - cliente: leer todas las reservas con la fecha de su horario y agregar en Python
+#  - resumenes: leer_estadisticas sobre las tablas que mantienen los triggers
+# Despues de altas, modificaciones, bajas y cambios de fecha de horarios al azar
+# verifica que los resumenes coinciden con recalcularlos desde cero, y mide
+# cuanto les cuesta a las altas mantenerlos (triggers activos o borrados).
+#   python -m benchmarks.bench_estadisticas --reservas 200000 --dias 60
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+from benchmarks.common import cargar_app, imprimir, sembrar
+
+CANCHAS = 8
+
+
+def sembrar_espejo(conn, horarios, dias):
+    # horarios repartidos en 'dias' fechas consecutivas desde 2024-01-01
+    conn.executemany("INSERT INTO horarios (horario_id, orden, fecha, hora, datos) VALUES (?, ?, date('2024-01-01', ?), '10:00', '{}')",
+                     ((i, i, "+{} days".format(i % dias)) for i in range(1, horarios + 1)))
+    conn.executemany("INSERT INTO canchas (cancha_id, orden, datos) VALUES (?, ?, '{}')",
+                     ((i, i) for i in range(1, CANCHAS + 1)))
+    conn.commit()
+
+
+def cliente(conn, desde, hasta, usuarios):
+    canchas, dias, por_usuario = {}, {}, {}
+    for cancha_id, usuario_id, num_personas, fecha in conn.execute(
+            "SELECT r.cancha_id, r.usuario_id, r.num_personas, h.fecha FROM reservas r JOIN horarios h USING (horario_id)"):
+        if desde <= fecha <= hasta:
+            for grupos, clave in ((canchas, cancha_id), (dias, fecha), (por_usuario, usuario_id)):
+                grupo = grupos.setdefault(clave, [0, 0])
+                grupo[0] += 1
+                grupo[1] += num_personas
+    top = sorted(por_usuario.items(), key=lambda item: (-item[1][0], item[0]))[:usuarios]
+    return sum(grupo[0] for grupo in canchas.values()), sorted(canchas.items()), top
+
+
+def resumenes(conn, desde, hasta, usuarios):
+    estadisticas = main.leer_estadisticas(conn, desde, hasta, usuarios)
+    return (estadisticas["total"]["reservas"],
+            [(cancha["cancha_id"], [cancha["reservas"], cancha["personas"]]) for cancha in estadisticas["canchas"]],
+            [(usuario["usuario_id"], [usuario["reservas"], usuario["personas"]]) for usuario in estadisticas["usuarios"]])
+
+
+def medir(fn, repeticiones, *args):
+    mejor, resultado = None, None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = fn(*args)
+        duracion = time.perf_counter() - inicio
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    return round(mejor * 1000, 3), resultado
+
+
+def recalculo(conn):
+    # los resumenes como deberian ser, agregando todas las reservas
+    consultas = {
+        "estadisticas_cancha": """SELECT r.cancha_id, COALESCE(h.fecha, ''), count(*), COALESCE(sum(r.num_personas), 0)
+                                  FROM reservas r LEFT JOIN horarios h USING (horario_id) GROUP BY 1, 2 ORDER BY 1, 2""",
+        "estadisticas_usuario": """SELECT r.usuario_id, COALESCE(h.fecha, ''), count(*), COALESCE(sum(r.num_personas), 0)
+                                   FROM reservas r LEFT JOIN horarios h USING (horario_id) GROUP BY 1, 2 ORDER BY 1, 2""",
+        "estadisticas_horario": """SELECT horario_id, count(*), COALESCE(sum(num_personas), 0) FROM reservas
+                                   GROUP BY 1 ORDER BY 1""",
+    }
+    return [tabla for tabla, consulta in consultas.items()
+            if conn.execute(consulta).fetchall() != conn.execute("SELECT * FROM {} ORDER BY 1, 2".format(tabla)).fetchall()]
+
+
+def mutar(conn, rnd, operaciones, horarios, dias):
+    c = conn.cursor()
+    ultima = c.execute("SELECT max(reserva_id) FROM reservas").fetchone()[0]
+    for _ in range(operaciones):
+        op = rnd.random()
+        if op < 0.4:
+            c.execute("INSERT OR IGNORE INTO reservas (cancha_id, usuario_id, horario_id, descripcion, num_personas) VALUES (?, ?, ?, 'm', ?)",
+                      (rnd.randint(1, CANCHAS), rnd.randint(1, 500), rnd.randint(1, horarios + 50), rnd.randint(1, 16)))
+        elif op < 0.7:
+            c.execute("""UPDATE OR IGNORE reservas SET cancha_id = ?, usuario_id = ?, horario_id = ?, num_personas = ?
+                         WHERE reserva_id = ?""",
+                      (rnd.randint(1, CANCHAS), rnd.randint(1, 500), rnd.randint(1, horarios + 50), rnd.randint(1, 16),
+                       rnd.randint(1, ultima)))
+        elif op < 0.9:
+            c.execute("DELETE FROM reservas WHERE reserva_id = ?", (rnd.randint(1, ultima),))
+        elif op < 0.95:
+            c.execute("UPDATE horarios SET fecha = date('2024-01-01', ?) WHERE horario_id = ?",
+                      ("+{} days".format(rnd.randrange(dias)), rnd.randint(1, horarios)))
+        else:
+            # horarios que desaparecen del catalogo y otros que aparecen
+            c.execute("DELETE FROM horarios WHERE horario_id = ?", (rnd.randint(1, horarios),))
+            c.execute("INSERT OR IGNORE INTO horarios (horario_id, orden, fecha, hora, datos) VALUES (?, 0, '2024-01-01', '10:00', '{}')",
+                      (rnd.randint(horarios + 1, horarios + 50),))
+    # bajas en lote
+    c.executemany("DELETE FROM reservas WHERE reserva_id = ?", ((rnd.randint(1, ultima),) for _ in range(operaciones // 10)))
+    conn.commit()
+
+
+def altas_por_segundo(conn, cantidad, primer_horario):
+    inicio = time.perf_counter()
+    c = conn.cursor()
+    for i in range(cantidad):
+        main.insertar_reserva(c, main.Reserva(cancha_id=i % CANCHAS + 1, usuario_id=1, horario_id=primer_horario + i // CANCHAS,
+                                              descripcion="bench", num_personas=4))
+        conn.commit()
+    return round(cantidad / (time.perf_counter() - inicio))
+
+
+def main_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reservas", type=int, default=200000)
+    parser.add_argument("--dias", type=int, default=60)
+    parser.add_argument("--rango", type=int, default=7, help="dias del rango consultado")
+    parser.add_argument("--usuarios", type=int, default=10)
+    parser.add_argument("--operaciones", type=int, default=2000)
+    parser.add_argument("--altas", type=int, default=2000)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    ruta = os.path.join(directorio, main.db)
+    horarios = -(-args.reservas // CANCHAS)
+    conn = sqlite3.connect(ruta)
+    sembrar_espejo(conn, horarios, args.dias)
+    inicio = time.perf_counter()
+    sembrar(ruta, args.reservas, 0, horarios=horarios, canchas=CANCHAS)
+    siembra = round(time.perf_counter() - inicio, 3)
+
+    desde, hasta = "2024-01-15", conn.execute("SELECT date('2024-01-15', ?)", ("+{} days".format(args.rango - 1),)).fetchone()[0]
+    resultados = {"siembra_s": siembra}
+    for nombre, fn in (("cliente", cliente), ("resumenes", resumenes)):
+        resultados[nombre + "_ms"], resultados[nombre] = medir(fn, args.repeticiones, conn, desde, hasta, args.usuarios)
+    iguales = resultados.pop("cliente") == resultados.pop("resumenes")
+
+    mutar(conn, random.Random(2), args.operaciones, horarios, args.dias)
+    desactualizados = recalculo(conn)
+
+    resultados["altas_con_triggers_por_s"] = altas_por_segundo(conn, args.altas, horarios + 100)
+    for (nombre,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'estadisticas_%'").fetchall():
+        conn.execute("DROP TRIGGER " + nombre)
+    resultados["altas_sin_triggers_por_s"] = altas_por_segundo(conn, args.altas, horarios + 100 + args.altas)
+    conn.close()
+
+    imprimir({"parametros": vars(args), "resultados": resultados,
+              "coinciden_con_cliente": iguales, "resumenes_desactualizados": desactualizados})
+    if not iguales or desactualizados:
+        sys.exit(1)
+
+
+main, directorio = cargar_app()
+
+if __name__ == "__main__":
+    main_bench()
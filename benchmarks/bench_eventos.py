@@ -0,0 +1,65 @@
+# Fan-out del difusor de eventos con miles de suscriptores ociosos:
+#  - ociosos: suscripciones que nunca leen su cola (clientes lentos); la mitad
+#    filtra por una cancha que no aparece en los eventos
+#  - activos: consumidores que leen todo y miden la latencia publicar -> recibir
+#   python -m benchmarks.bench_eventos --ociosos 5000 --activos 50 --eventos 2000
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import cargar_app, imprimir, resumen
+
+
+async def consumir(suscripcion, enviados, latencias, total):
+    for _ in range(total):
+        evento_id, _ = await suscripcion.cola.get()
+        if evento_id in enviados:
+            latencias.append(time.perf_counter() - enviados[evento_id])
+
+
+async def correr(args):
+    difusor = main.Difusor()
+    ociosos = [difusor.suscribir(cancha_id=1 if i % 2 else 999) for i in range(args.ociosos)]
+    activos = [difusor.suscribir() for _ in range(args.activos)]
+    enviados, latencias = {}, []
+    consumidores = [asyncio.ensure_future(consumir(s, enviados, latencias, args.eventos)) for s in activos]
+
+    evento = {"tipo": "reserva", "accion": "creada",
+              "reserva": {"reserva_id": 1, "cancha_id": 1, "usuario_id": 1, "horario_id": 1,
+                          "descripcion": "reserva de prueba", "num_personas": 4}}
+    publicar = []
+    inicio = time.perf_counter()
+    for i in range(1, args.eventos + 1):
+        t0 = time.perf_counter()
+        enviados[i] = t0
+        difusor.publicar(evento, {1}, {"2024-01-01"})
+        publicar.append(time.perf_counter() - t0)
+        # se cede el loop cada tanto para que los consumidores activos lean
+        if i % args.rafaga == 0:
+            await asyncio.sleep(0)
+    await asyncio.gather(*consumidores)
+    duracion = time.perf_counter() - inicio
+
+    return {
+        "publicar": resumen(publicar, duracion),
+        "entrega_activos": resumen(latencias, duracion),
+        "descartados_ociosos": sum(s.descartados for s in ociosos),
+        "desincronizados_activos": sum(s.descartados for s in activos),
+        "max_cola_ociosos": max((s.cola.qsize() for s in ociosos), default=0),
+    }
+
+
+def main_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ociosos", type=int, default=5000)
+    parser.add_argument("--activos", type=int, default=50)
+    parser.add_argument("--eventos", type=int, default=2000)
+    parser.add_argument("--rafaga", type=int, default=10)
+    args = parser.parse_args()
+    imprimir({"parametros": vars(args), "resultados": asyncio.run(correr(args))})
+
+
+main, _ = cargar_app()
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,67 @@
+# Altas por segundo con y sin group commit: --concurrencia corrutinas insertan
+# reservas (turnos distintos) y recordatorios por el mismo camino que
+# create_reserva/create_recordatorio (db_alta) durante --duracion segundos.
+# Se mide con PRAGMA synchronous NORMAL (fsync solo en los checkpoints del WAL)
+# y FULL (fsync en cada commit), que es donde mas se nota agrupar los commits.
+#   python -m benchmarks.bench_group_commit --concurrencia 64 --duracion 3
+import argparse
+import asyncio
+import itertools
+import time
+
+from benchmarks.common import cargar_app, imprimir, resumen
+
+
+# turnos distintos en todas las corridas, que comparten la base
+turnos = itertools.count(1)
+
+
+async def correr(concurrencia, duracion):
+    latencias = []
+    fin = time.monotonic() + duracion
+
+    async def cliente(i):
+        while time.monotonic() < fin:
+            inicio = time.perf_counter()
+            if i % 2:
+                turno = next(turnos)
+                reserva = main.Reserva(cancha_id=turno % 8 + 1, usuario_id=1, horario_id=turno // 8 + 1,
+                                       descripcion="bench", num_personas=4)
+                assert await main.db_alta(main.insertar_reserva, reserva) is not None
+            else:
+                recordatorio = main.Recordatorio(titulo="bench", descripcion="d", fecha="2030-01-01", hora="10:00")
+                await main.db_alta(main.insertar_recordatorio, recordatorio)
+            latencias.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*[cliente(i) for i in range(concurrencia)])
+    return latencias, time.perf_counter() - inicio
+
+
+def main_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrencia", type=int, default=64)
+    parser.add_argument("--duracion", type=float, default=3.0)
+    parser.add_argument("--synchronous", nargs="+", default=["NORMAL", "FULL"])
+    args = parser.parse_args()
+
+    resultados = []
+    for synchronous in args.synchronous:
+        for grupo in (False, True):
+            # conexiones nuevas con el modo de sincronizacion de esta corrida
+            main.cerrar_pool()
+            main.DB_SYNCHRONOUS = synchronous
+            main.GRUPO_COMMIT = grupo
+            latencias, duracion = asyncio.run(correr(args.concurrencia, args.duracion))
+            escritor = main.escritor
+            resultados.append(dict(resumen(latencias, duracion), synchronous=synchronous,
+                                   modo="grupo" if grupo else "individual",
+                                   filas_por_commit=round(escritor.operaciones / escritor.commits, 1) if grupo else 1))
+    main.cerrar_pool()
+    imprimir({"parametros": vars(args), "resultados": resultados})
+
+
+main, _ = cargar_app()
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,128 @@
+# Micro-benchmark del join horarios x reservas de get_horario_reserva, desde
+# la base hasta el JSON de la respuesta:
+#  - anidado: bucle anidado original, O(horarios x reservas)
+#  - indexado: join en Python con un indice por horario_id (catalogos en memoria)
+#  - sql: una sola consulta sobre el espejo local de los catalogos (leer_horarios_reservas)
+#   python -m benchmarks.bench_join --tamanos 1000 10000 100000
+import argparse
+import random
+import time
+
+import orjson
+
+from benchmarks.common import cargar_app, imprimir
+
+SQL_RESERVAS = "SELECT reserva_id, cancha_id, usuario_id, horario_id, descripcion, num_personas FROM reservas ORDER BY reserva_id"
+
+
+def join_anidado(conn, horarios, cancha_map, usuario_map):
+    # Copia del algoritmo original
+    reservas = [
+        {"reserva_id": row[0], "cancha_id": row[1], "usuario_id": row[2], "horario_id": row[3], "descripcion": row[4], "num_personas": row[5]}
+        for row in conn.execute(SQL_RESERVAS)
+    ]
+    horarioreserva_array = []
+    for horario in horarios:
+        horarioreserva = {"horario_id": horario['horario_id'], "fecha": horario['fecha'], "hora": horario['hora'], "reserva": None}
+        for reserva in reservas:
+            if reserva['horario_id'] == horario['horario_id']:
+                horarioreserva['reserva'] = {
+                    "reserva_id": reserva['reserva_id'],
+                    "descripcion": reserva['descripcion'],
+                    "num_personas": reserva['num_personas'],
+                    "cancha": cancha_map.get(reserva['cancha_id'], {}),
+                    "usuario": usuario_map.get(reserva['usuario_id'], {})
+                }
+                break
+        horarioreserva_array.append(horarioreserva)
+    return orjson.dumps(horarioreserva_array)
+
+
+def join_indexado(conn, horarios, cancha_map, usuario_map):
+    # Copia del join en memoria que reemplazo al bucle anidado
+    reservas_por_horario = {}
+    for row in conn.execute(SQL_RESERVAS):
+        reservas_por_horario.setdefault(row[3], row)
+    horarioreserva_array = []
+    for horario in horarios:
+        horarioreserva = {"horario_id": horario['horario_id'], "fecha": horario['fecha'], "hora": horario['hora'], "reserva": None}
+        reserva = reservas_por_horario.get(horario['horario_id'])
+        if reserva is not None:
+            horarioreserva['reserva'] = {
+                "reserva_id": reserva[0],
+                "descripcion": reserva[4],
+                "num_personas": reserva[5],
+                "cancha": cancha_map.get(reserva[1], {}),
+                "usuario": usuario_map.get(reserva[2], {})
+            }
+        horarioreserva_array.append(horarioreserva)
+    return orjson.dumps(horarioreserva_array)
+
+
+def join_sql(conn, horarios, cancha_map, usuario_map):
+    return main.leer_horarios_reservas(conn)
+
+
+def preparar(conn, n, semilla=1):
+    # n reservas en turnos distintos sobre la mitad de los horarios; la otra mitad libre
+    rnd = random.Random(semilla)
+    usados = -(-n // 8)
+    horarios = [{"horario_id": i, "fecha": "2024-05-{:02d}".format(1 + i % 28), "hora": "{:02d}:00".format(8 + i % 14)}
+                for i in range(1, 2 * usados + 1)]
+    canchas = [{"cancha_id": i, "nombre": "Cancha {}".format(i)} for i in range(1, 9)]
+    usuarios = [{"id": i, "nombre": "n{}".format(i), "apellido": "a{}".format(i), "email": "x"} for i in range(1, 501)]
+    conn.execute("DELETE FROM reservas")
+    conn.executemany(
+        "INSERT INTO reservas (reserva_id, cancha_id, usuario_id, horario_id, descripcion, num_personas) VALUES (?, ?, ?, ?, ?, ?)",
+        ((i, turno % 8 + 1, rnd.randint(1, 500), turno // 8 + 1, "d", 4)
+         for i, turno in enumerate(rnd.sample(range(usados * 8), n), 1)))
+    conn.commit()
+    # el espejo se llena por el mismo camino que la sincronizacion
+    for cache, lista in ((main.catalogos[main.HORARIOS_API_URL], horarios), (main.catalogos[main.CANCHAS_API_URL], canchas),
+                         (main.catalogos[main.USUARIOS_API_URL], usuarios)):
+        cache._guardar(conn, orjson.dumps(lista).decode("utf-8"), None, None)
+    cancha_map = {cancha["cancha_id"]: cancha for cancha in canchas}
+    usuario_map = {usuario["id"]: main.resumen_usuario(usuario) for usuario in usuarios}
+    return horarios, cancha_map, usuario_map
+
+
+def medir(fn, args, repeticiones):
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn(*args)
+        duracion = time.perf_counter() - inicio
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    return round(mejor * 1000, 3)
+
+
+def main_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeticiones", type=int, default=3)
+    # el bucle anidado crece cuadraticamente: por encima de este tamano se omite
+    parser.add_argument("--max-anidado", type=int, default=10000)
+    args = parser.parse_args()
+
+    resultados = []
+    with main.pool.connection() as conn:
+        for n in args.tamanos:
+            entrada = (conn,) + preparar(conn, n)
+            # las tres variantes tienen que producir el mismo JSON
+            esperado = orjson.loads(join_indexado(*entrada))
+            assert orjson.loads(join_sql(*entrada)) == esperado
+            assert n > args.max_anidado or orjson.loads(join_anidado(*entrada)) == esperado
+            resultados.append({
+                "reservas": n,
+                "horarios": len(entrada[1]),
+                "anidado_ms": medir(join_anidado, entrada, 1) if n <= args.max_anidado else None,
+                "indexado_ms": medir(join_indexado, entrada, args.repeticiones),
+                "sql_ms": medir(join_sql, entrada, args.repeticiones),
+            })
+    imprimir({"parametros": vars(args), "resultados": resultados})
+
+
+main, _ = cargar_app()
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,73 @@
+# Busqueda de los recordatorios que vencen en los proximos N minutos:
+#  - cliente: listado completo + parseo de fecha/hora en Python (lo que hacia el cliente)
+#  - indice: leer_proximos sobre vence_en y el indice parcial de pendientes
+# y costo de la carga inicial del heap del programador (leer_pendientes + heapify)
+#   python -m benchmarks.bench_recordatorios --recordatorios 200000 --minutos 60
+import argparse
+import heapq
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+import orjson
+
+from benchmarks.common import cargar_app, imprimir, sembrar
+
+
+def cliente(conn, desde, hasta):
+    vencen = []
+    for row in conn.execute("SELECT id, titulo, descripcion, fecha, hora FROM recordatorios"):
+        momento = datetime.strptime(row[3] + " " + row[4], "%Y-%m-%d %H:%M")
+        segundos = (momento - datetime(1970, 1, 1)).total_seconds()
+        if desde <= segundos <= hasta:
+            vencen.append((segundos, row[0]))
+    return sorted(vencen)
+
+
+def indice(conn, desde, hasta):
+    return [(r["vence_en"], r["id"]) for r in orjson.loads(main.leer_proximos(conn, desde, hasta, 1000000))]
+
+
+def carga_heap(conn, desde, hasta):
+    heap = main.leer_pendientes(conn)
+    heapq.heapify(heap)
+    return heap
+
+
+def medir(fn, conn, desde, hasta, repeticiones):
+    mejor, resultado = None, None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = fn(conn, desde, hasta)
+        duracion = time.perf_counter() - inicio
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    return round(mejor * 1000, 3), resultado
+
+
+def main_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recordatorios", type=int, default=200000)
+    parser.add_argument("--minutos", type=int, default=60)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    sembrar(os.path.join(directorio, main.db), 0, args.recordatorios)
+    conn = sqlite3.connect(main.db)
+    # ventana sobre una fecha con recordatorios sembrados
+    desde = main.vencimiento("2024-06-15", "10:00")
+    hasta = desde + args.minutos * 60
+    resultados = {}
+    for nombre, fn in (("cliente", cliente), ("indice", indice), ("carga_heap", carga_heap)):
+        resultados[nombre + "_ms"], encontrados = medir(fn, conn, desde, hasta, args.repeticiones)
+        if nombre != "carga_heap":
+            resultados[nombre + "_encontrados"] = len(encontrados)
+    assert resultados["cliente_encontrados"] == resultados["indice_encontrados"]
+    conn.close()
+    imprimir({"parametros": vars(args), "resultados": resultados})
+
+
+main, directorio = cargar_app()
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,68 @@
+# Throughput de serializacion de un listado de 10k reservas:
+#  - anterior: tuplas -> dict por fila -> JSONResponse (json de la libreria estandar)
+#  - orjson_dicts: tuplas -> dict por fila -> ORJSONResponse
+#  - sql_json: objetos JSON armados por sqlite (leer_pagina) -> Response
+#   python -m benchmarks.bench_serializacion --filas 10000
+import argparse
+import time
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from benchmarks.common import cargar_app, imprimir, sembrar
+
+SQL_FILAS = "SELECT reserva_id, cancha_id, usuario_id, horario_id, descripcion, num_personas FROM reservas ORDER BY reserva_id LIMIT ?"
+
+
+def anterior(conn, filas):
+    rows = conn.execute(SQL_FILAS, (filas,)).fetchall()
+    reservas_list = [{"reserva_id": row[0], "cancha_id": row[1], "usuario_id": row[2], "horario_id": row[3], "descripcion": row[4], "num_personas": row[5]} for row in rows]
+    return JSONResponse(reservas_list).body
+
+
+def orjson_dicts(conn, filas):
+    rows = conn.execute(SQL_FILAS, (filas,)).fetchall()
+    reservas_list = [{"reserva_id": row[0], "cancha_id": row[1], "usuario_id": row[2], "horario_id": row[3], "descripcion": row[4], "num_personas": row[5]} for row in rows]
+    return ORJSONResponse(reservas_list).body
+
+
+def sql_json(conn, filas):
+    cuerpo, _ = main.leer_pagina(conn, main.COLUMNAS_RESERVA, "reservas", "reserva_id", [], None, filas)
+    return main.Response(cuerpo, media_type="application/json").body
+
+
+def medir(fn, conn, filas, duracion):
+    respuestas = 0
+    inicio = time.perf_counter()
+    while time.perf_counter() - inicio < duracion:
+        cuerpo = fn(conn, filas)
+        respuestas += 1
+    transcurrido = time.perf_counter() - inicio
+    return {
+        "respuestas_por_s": round(respuestas / transcurrido, 1),
+        "filas_por_s": round(respuestas * filas / transcurrido),
+        "ms_por_respuesta": round(transcurrido / respuestas * 1000, 3),
+        "bytes": len(cuerpo),
+    }
+
+
+def main_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filas", type=int, default=10000)
+    parser.add_argument("--duracion", type=float, default=3.0)
+    args = parser.parse_args()
+
+    sembrar(main.db, reservas=args.filas)
+    resultados = {}
+    with main.pool.connection() as conn:
+        # las tres variantes tienen que producir el mismo JSON
+        import json
+        assert json.loads(anterior(conn, args.filas)) == json.loads(sql_json(conn, args.filas))
+        for fn in (anterior, orjson_dicts, sql_json):
+            resultados[fn.__name__] = medir(fn, conn, args.filas, args.duracion)
+    imprimir({"parametros": vars(args), "resultados": resultados})
+
+
+main, _ = cargar_app()
+
+if __name__ == "__main__":
+    main_bench()
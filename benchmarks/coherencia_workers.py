@@ -0,0 +1,120 @@
+# Coherencia de las caches entre workers: levanta varios procesos con la app
+# (como los workers de gunicorn, compartiendo la base y el archivo de
+# versiones) y en cada ronda uno de ellos escribe mientras los demas
+# responden GETs condicionales y /disponibilidad. Todos tienen que devolver el
+# mismo ETag, no responder 304 con datos viejos y ver el turno ocupado/libre.
+#   python -m benchmarks.coherencia_workers --workers 4 --rondas 200
+import argparse
+import multiprocessing
+import random
+import sys
+import tempfile
+
+import httpx
+
+from benchmarks.common import cargar_app, imprimir
+
+HORARIOS = [{"horario_id": i, "fecha": "2024-05-{:02d}".format(1 + (i - 1) // 8), "hora": "{:02d}:00".format(8 + (i - 1) % 8)}
+            for i in range(1, 81)]
+CANCHAS = [{"cancha_id": i, "nombre": "Cancha {}".format(i)} for i in range(1, 5)]
+
+
+def _upstream(request):
+    # catalogos fijos en lugar de la api externa
+    return httpx.Response(200, json={"/api/horarios": HORARIOS, "/api/canchas": CANCHAS, "/api/usuarios": []}[request.url.path])
+
+
+def _worker(directorio, canal):
+    from fastapi.testclient import TestClient
+
+    main, _ = cargar_app(directorio)
+    main.http_client = httpx.AsyncClient(transport=httpx.MockTransport(_upstream))
+    with TestClient(main.app) as cliente:
+        while True:
+            pedido = canal.recv()
+            if pedido is None:
+                break
+            metodo, ruta, kwargs = pedido
+            r = cliente.request(metodo, ruta, **kwargs)
+            canal.send((r.status_code, r.headers.get("etag"), r.json() if r.content else None))
+
+
+def ocupado(disponibilidad, cancha_id, horario_id):
+    for cancha in disponibilidad["canchas"]:
+        if cancha["cancha_id"] == cancha_id:
+            return all(libre["horario_id"] != horario_id for libre in cancha["libres"])
+    raise KeyError(cancha_id)
+
+
+def main_coherencia():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rondas", type=int, default=200)
+    parser.add_argument("--semilla", type=int, default=1)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="coherencia-reservas-")
+    cargar_app(directorio)
+    contexto = multiprocessing.get_context("spawn")
+    canales, procesos = [], []
+    for _ in range(args.workers):
+        propio, remoto = contexto.Pipe()
+        proceso = contexto.Process(target=_worker, args=(directorio, remoto), daemon=True)
+        proceso.start()
+        canales.append(propio)
+        procesos.append(proceso)
+
+    def pedir(worker, metodo, ruta, **kwargs):
+        canales[worker].send((metodo, ruta, kwargs))
+        return canales[worker].recv()
+
+    rnd = random.Random(args.semilla)
+    errores = []
+    reservas = {}  # reserva_id -> (horario_id, cancha_id)
+    etags = [pedir(w, "GET", "/reservas")[1] for w in range(args.workers)]
+    if len(set(etags)) != 1:
+        errores.append({"ronda": 0, "error": "etags distintos al arrancar", "etags": etags})
+    for ronda in range(1, args.rondas + 1):
+        escritor = rnd.randrange(args.workers)
+        horario = rnd.choice(HORARIOS)
+        cancha_id = rnd.choice(CANCHAS)["cancha_id"]
+        if reservas and rnd.random() < 0.4:
+            reserva_id = rnd.choice(list(reservas))
+            horario_id, cancha_id = reservas.pop(reserva_id)
+            horario = HORARIOS[horario_id - 1]
+            codigo = pedir(escritor, "DELETE", "/reservas/{}".format(reserva_id))[0]
+            esperado_ocupado = False
+        else:
+            codigo, _, cuerpo = pedir(escritor, "POST", "/reservas", json={
+                "cancha_id": cancha_id, "usuario_id": 1, "horario_id": horario["horario_id"],
+                "descripcion": "ronda {}".format(ronda), "num_personas": 4})
+            if codigo == 201:
+                reservas[cuerpo["id"]] = (horario["horario_id"], cancha_id)
+            esperado_ocupado = True
+        if codigo == 409:
+            continue
+
+        anterior = etags[0]
+        for worker in range(args.workers):
+            codigo, etag, _ = pedir(worker, "GET", "/reservas", headers={"If-None-Match": anterior})
+            etags[worker] = etag
+            if codigo != 200:
+                errores.append({"ronda": ronda, "worker": worker, "error": "304 con datos viejos"})
+            libres = pedir(worker, "GET", "/disponibilidad", params={"fecha": horario["fecha"]})[2]
+            if ocupado(libres, cancha_id, horario["horario_id"]) != esperado_ocupado:
+                errores.append({"ronda": ronda, "worker": worker, "error": "disponibilidad desactualizada"})
+        if len(set(etags)) != 1:
+            errores.append({"ronda": ronda, "error": "etags distintos", "etags": etags})
+
+    for canal in canales:
+        canal.send(None)
+    for proceso in procesos:
+        proceso.join()
+
+    imprimir({"parametros": vars(args), "reservas_finales": len(reservas), "errores": errores[:20], "cantidad_errores": len(errores)})
+    if errores:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_coherencia()
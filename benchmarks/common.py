@@ -0,0 +1,116 @@
+# Utilidades compartidas por los benchmarks.
+# Se ejecutan desde la raiz del repo, por ejemplo:
+#   python -m benchmarks.bench_db_async --reservas 20000
+import importlib
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cargar_app(directorio=None):
+    # La app usa "dbReservas.db" relativo al directorio actual, asi que se
+    # importa desde un directorio temporal para no tocar la base real
+    directorio = directorio or tempfile.mkdtemp(prefix="bench-reservas-")
+    os.chdir(directorio)
+    # todos los clientes de los benchmarks salen de la misma ip: sin limites por
+    # cliente salvo que se pidan explicitamente (los procesos hijos heredan el entorno)
+    for variable in ("LIMITE_ALTAS", "LIMITE_CONSULTAS"):
+        os.environ.setdefault(variable, "0")
+    if RAIZ not in sys.path:
+        sys.path.insert(0, RAIZ)
+    main = importlib.import_module("api.main")
+    # la app crea el esquema al arrancar; los benchmarks siembran la base antes
+    main.init_db()
+    return main, directorio
+
+
+# Procesos auxiliares (app bajo uvicorn, upstream_stub) para los benchmarks
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def iniciar(argumentos, directorio, env=None):
+    entorno = dict(os.environ, PYTHONPATH=RAIZ, **(env or {}))
+    return subprocess.Popen([sys.executable] + argumentos, cwd=directorio, env=entorno,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def esperar(url, proceso, timeout=30.0):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError("el proceso termino al arrancar ({})".format(url))
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError("no respondio a tiempo: {}".format(url))
+
+
+def detener(proceso):
+    proceso.terminate()
+    try:
+        proceso.wait(10)
+    except subprocess.TimeoutExpired:
+        proceso.kill()
+
+
+def sembrar(ruta_db, reservas=0, recordatorios=0, horarios=1000, canchas=8, usuarios=500, semilla=1):
+    rnd = random.Random(semilla)
+    # cada turno (horario_id, cancha_id) admite una sola reserva: se eligen
+    # turnos distintos y se agregan horarios si no alcanzan
+    horarios = max(horarios, -(-reservas // canchas))
+    turnos = rnd.sample(range(horarios * canchas), reservas)
+    conn = sqlite3.connect(ruta_db)
+    conn.executemany(
+        "INSERT INTO reservas (cancha_id, usuario_id, horario_id, descripcion, num_personas) VALUES (?, ?, ?, ?, ?)",
+        ((turno % canchas + 1, rnd.randint(1, usuarios), turno // canchas + 1,
+          "reserva de prueba {}".format(i), rnd.randint(1, 16)) for i, turno in enumerate(turnos)))
+    conn.executemany(
+        "INSERT INTO recordatorios (titulo, descripcion, fecha, hora) VALUES (?, ?, ?, ?)",
+        (("recordatorio {}".format(i), "descripcion de prueba",
+          "2024-{:02d}-{:02d}".format(rnd.randint(1, 12), rnd.randint(1, 28)),
+          "{:02d}:{:02d}".format(rnd.randint(8, 22), rnd.choice((0, 30)))) for i in range(recordatorios)))
+    conn.commit()
+    conn.close()
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    k = min(len(ordenados) - 1, max(0, int(round(p / 100.0 * len(ordenados))) - 1))
+    return ordenados[k]
+
+
+def resumen(latencias, duracion):
+    # latencias en segundos -> resumen en milisegundos
+    return {
+        "requests": len(latencias),
+        "rps": round(len(latencias) / duracion, 1) if duracion else None,
+        "p50_ms": _ms(percentil(latencias, 50)),
+        "p95_ms": _ms(percentil(latencias, 95)),
+        "p99_ms": _ms(percentil(latencias, 99)),
+        "max_ms": _ms(max(latencias) if latencias else None),
+    }
+
+
+def _ms(valor):
+    return None if valor is None else round(valor * 1000, 3)
+
+
+def imprimir(resultado):
+    print(json.dumps(resultado, indent=2, sort_keys=True))
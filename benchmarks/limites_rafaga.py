@@ -0,0 +1,119 @@
+# Limites por cliente bajo una rafaga: levanta la app con varios workers de
+# uvicorn (cubetas compartidas por el archivo de limites) y corre a la vez un
+# cliente agresivo que reserva sin pausa y varios clientes normales que reservan
+# a un ritmo por debajo del limite, cada uno con su X-Client-Id. Verifica que:
+#  - el agresivo recibe 429 con Retry-After, rapido, y lo aceptado no supera
+#    rafaga + tasa * duracion aunque sus requests caigan en workers distintos
+#  - los clientes normales no reciben ningun 429
+#  - con una rafaga de GET /horariosreservas por encima de la concurrencia y
+#    la cola, lo que no entra recibe 429 en lugar de encolarse sin limite
+#   python -m benchmarks.limites_rafaga --workers 2 --duracion 5
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import RAIZ, cargar_app, detener, esperar, iniciar, imprimir, puerto_libre, resumen
+
+TASA, RAFAGA = 5.0, 10.0
+
+
+async def cliente(http, nombre, pausa, fin, horarios, resultados):
+    latencias, codigos, retry_after = [], {}, None
+    while time.monotonic() < fin:
+        horario_id = next(horarios)
+        inicio = time.perf_counter()
+        r = await http.post("/reservas", headers={"X-Client-Id": nombre}, json={
+            "cancha_id": 1 + horario_id % 8, "usuario_id": 1, "horario_id": horario_id, "descripcion": nombre, "num_personas": 4})
+        latencias.append(time.perf_counter() - inicio)
+        codigos[str(r.status_code)] = codigos.get(str(r.status_code), 0) + 1
+        retry_after = r.headers.get("retry-after", retry_after)
+        if pausa:
+            await asyncio.sleep(pausa)
+    resultados[nombre] = {"codigos": codigos, "retry_after": retry_after, "latencias": latencias}
+
+
+async def correr(base_url, args):
+    horarios = iter(range(1, 10 ** 6))
+    resultados = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=30.0,
+                                 limits=httpx.Limits(max_connections=args.clientes + 64)) as http:
+        await http.get("/horariosreservas/1", headers={"X-Client-Id": "calentamiento"})
+        inicio = time.monotonic()
+        fin = inicio + args.duracion
+        # los normales reservan a la mitad de la tasa permitida
+        await asyncio.gather(cliente(http, "agresivo", 0, fin, horarios, resultados),
+                             *[cliente(http, "normal{}".format(i), 2 / TASA, fin, horarios, resultados)
+                               for i in range(args.clientes)])
+        duracion = time.monotonic() - inicio
+
+    # una conexion por request para que la rafaga llegue entera a la vez
+    async with httpx.AsyncClient(base_url=base_url, timeout=30.0, limits=httpx.Limits(max_connections=args.costosas)) as http:
+        respuestas = await asyncio.gather(*[http.get("/horariosreservas", headers={"X-Client-Id": "costosa{}".format(i)})
+                                            for i in range(args.costosas)])
+    codigos_costosas = {}
+    for r in respuestas:
+        codigos_costosas[str(r.status_code)] = codigos_costosas.get(str(r.status_code), 0) + 1
+    return resultados, duracion, codigos_costosas
+
+
+def main_limites():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--clientes", type=int, default=8)
+    parser.add_argument("--duracion", type=float, default=5.0)
+    parser.add_argument("--costosas", type=int, default=200)
+    args = parser.parse_args()
+
+    puerto_stub = puerto_libre()
+    stub = iniciar(["-m", "benchmarks.upstream_stub", "--puerto", str(puerto_stub), "--horarios", "2000",
+                    "--latencia-ms", "5"], RAIZ)
+    directorio = tempfile.mkdtemp(prefix="limites-reservas-")
+    cargar_app(directorio)
+    puerto = puerto_libre()
+    app = iniciar(["-m", "uvicorn", "api.main:app", "--host", "127.0.0.1", "--port", str(puerto),
+                   "--workers", str(args.workers), "--no-access-log", "--log-level", "warning"],
+                  directorio, {"UPSTREAM_PREFIX": "http://127.0.0.1:{}".format(puerto_stub), "LOG_LEVEL": "WARNING",
+                               "LIMITE_ALTAS": "{}:{}".format(TASA, RAFAGA), "LIMITE_CONSULTAS": "0",
+                               "LIMITE_CLIENTE_HEADER": "x-client-id", "LIMITE_CONCURRENCIA": "2",
+                               "LIMITE_COLA": "4", "LIMITE_COLA_ESPERA": "2"})
+    try:
+        esperar("http://127.0.0.1:{}/".format(puerto), app)
+        resultados, duracion, codigos_costosas = asyncio.run(correr("http://127.0.0.1:{}".format(puerto), args))
+    finally:
+        detener(app)
+        detener(stub)
+
+    errores = []
+    agresivo = resultados.pop("agresivo")
+    aceptadas = agresivo["codigos"].get("201", 0) + agresivo["codigos"].get("409", 0)
+    maximo = RAFAGA + TASA * duracion
+    if aceptadas > maximo + 1:
+        errores.append("el agresivo paso {} requests y el maximo era {:.0f}".format(aceptadas, maximo))
+    if not agresivo["codigos"].get("429") or agresivo["retry_after"] is None:
+        errores.append("el agresivo no recibio 429 con Retry-After")
+    normales_429 = sum(normal["codigos"].get("429", 0) for normal in resultados.values())
+    if normales_429:
+        errores.append("los clientes normales recibieron {} respuestas 429".format(normales_429))
+    if not codigos_costosas.get("429"):
+        errores.append("la rafaga de rutas costosas no recibio 429")
+
+    imprimir({
+        "parametros": vars(args),
+        "agresivo": {"codigos": agresivo["codigos"], "aceptadas": aceptadas, "maximo": round(maximo, 1),
+                     "latencia": resumen(agresivo["latencias"], duracion)},
+        "normales": {"codigos": {codigo: sum(normal["codigos"].get(codigo, 0) for normal in resultados.values())
+                                 for codigo in ("201", "409", "429")},
+                     "latencia": resumen([latencia for normal in resultados.values() for latencia in normal["latencias"]], duracion)},
+        "costosas": codigos_costosas,
+        "errores": errores,
+    })
+    if errores:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_limites()
@@ -0,0 +1,126 @@
+# Resiliencia ante la api externa: corre la app (en proceso, via ASGI) contra
+# benchmarks.upstream_stub y le inyecta fallas en caliente. Las
+# sincronizaciones del espejo se piden con POST /sincronizar. Verifica que:
+#  - con el espejo vacio y upstream caido se responde 503 con Retry-After
+#  - con upstream caido o lento se sirve el espejo con X-Upstream-Stale, sin
+#    esperar timeouts, y el circuito termina abierto
+#  - al recuperarse upstream el circuito se cierra y desaparece el header
+#   python -m benchmarks.resiliencia_upstream --requests 50
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import RAIZ, cargar_app, detener, esperar, iniciar, imprimir, percentil, puerto_libre
+
+# tiempos cortos para que la prueba dure unos segundos
+CONFIGURACION = {
+    "UPSTREAM_TIMEOUT": "0.3",
+    "UPSTREAM_CONNECT_TIMEOUT": "0.3",
+    "UPSTREAM_REINTENTOS": "2",
+    "UPSTREAM_BACKOFF": "0.02",
+    "CIRCUITO_FALLAS": "3",
+    "CIRCUITO_ESPERA": "1.0",
+}
+
+
+async def fase(http, cantidad):
+    codigos, stale, latencias, retry_after = {}, 0, [], None
+    for _ in range(cantidad):
+        inicio = time.perf_counter()
+        r = await http.get("/horariosreservas/1")
+        latencias.append(time.perf_counter() - inicio)
+        codigos[r.status_code] = codigos.get(r.status_code, 0) + 1
+        stale += "x-upstream-stale" in r.headers
+        retry_after = r.headers.get("retry-after", retry_after)
+    return {
+        "codigos": {str(codigo): n for codigo, n in sorted(codigos.items())},
+        "con_header_stale": stale,
+        "retry_after": retry_after,
+        "p50_ms": round(percentil(latencias, 50) * 1000, 3),
+        "max_ms": round(max(latencias) * 1000, 3),
+        "ultimo_stale": "x-upstream-stale" in r.headers,
+    }
+
+
+async def correr(main, stub_url, args):
+    espera = float(CONFIGURACION["CIRCUITO_ESPERA"]) + 0.1
+    resultados, errores = {}, []
+
+    def verificar(condicion, mensaje):
+        if not condicion:
+            errores.append(mensaje)
+
+    async with httpx.AsyncClient(base_url=stub_url) as control, \
+            httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app") as http:
+        async def fallas(**parametros):
+            await control.post("/_fallas", params=parametros)
+
+        async def sincronizar(esperado):
+            r = await http.post("/sincronizar")
+            verificar(r.status_code == esperado, "POST /sincronizar respondio {} y se esperaba {}".format(r.status_code, esperado))
+
+        await fallas(error=1, latencia_ms=0)
+        resultados["sin_snapshot"] = r = await fase(http, 5)
+        verificar(r["codigos"] == {"503": 5}, "sin snapshot se esperaba 503")
+        verificar(r["retry_after"] is not None, "sin snapshot se esperaba Retry-After")
+
+        await fallas(error=0)
+        await asyncio.sleep(espera)
+        resultados["recuperado"] = r = await fase(http, 3)
+        verificar(r["codigos"] == {"200": 3} and not r["ultimo_stale"], "recuperado se esperaba 200 sin stale")
+
+        await fallas(error=1)
+        await sincronizar(503)
+        resultados["caido"] = r = await fase(http, args.requests)
+        verificar(r["codigos"] == {"200": args.requests}, "caido se esperaba 200 desde el espejo")
+        verificar(r["con_header_stale"] == args.requests, "caido se esperaba X-Upstream-Stale")
+        verificar(main.circuito.estado == "abierto", "caido se esperaba el circuito abierto")
+
+        await fallas(error=0)
+        await asyncio.sleep(espera)
+        await sincronizar(200)
+        await fallas(latencia_ms=2000)
+        await sincronizar(503)
+        resultados["lento"] = r = await fase(http, args.requests)
+        verificar(r["codigos"] == {"200": args.requests}, "lento se esperaba 200 desde el espejo")
+        verificar(r["con_header_stale"] == args.requests, "lento se esperaba X-Upstream-Stale")
+        verificar(r["p50_ms"] < 50, "lento: los requests no deberian esperar a upstream")
+
+        await fallas(latencia_ms=0)
+        await asyncio.sleep(espera)
+        await sincronizar(200)
+        resultados["recuperado_final"] = r = await fase(http, 3)
+        verificar(r["codigos"] == {"200": 3} and not r["ultimo_stale"], "recuperado_final se esperaba 200 sin stale")
+        verificar(main.circuito.estado == "cerrado", "recuperado_final se esperaba el circuito cerrado")
+
+    resultados["circuito"] = {"aperturas": main.circuito.aperturas, "rechazos": main.circuito.rechazos}
+    return resultados, errores
+
+
+def main_resiliencia():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    puerto = puerto_libre()
+    stub = iniciar(["-m", "benchmarks.upstream_stub", "--puerto", str(puerto), "--horarios", "200"], RAIZ)
+    stub_url = "http://127.0.0.1:{}".format(puerto)
+    try:
+        esperar(stub_url + "/api/canchas", stub)
+        os.environ.update(CONFIGURACION, UPSTREAM_PREFIX=stub_url, LOG_LEVEL="ERROR")
+        main, _ = cargar_app()
+        resultados, errores = asyncio.run(correr(main, stub_url, args))
+    finally:
+        detener(stub)
+
+    imprimir({"parametros": dict(vars(args), **CONFIGURACION), "fases": resultados, "errores": errores})
+    if errores:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_resiliencia()
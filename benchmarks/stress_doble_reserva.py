@@ -0,0 +1,83 @@
+# Prueba de estres de reservas concurrentes: varios procesos (como los workers
+# de gunicorn) con muchos clientes cada uno intentan reservar los mismos turnos
+# a la vez. Al final cada turno debe tener exactamente una reserva.
+#   python -m benchmarks.stress_doble_reserva --procesos 4 --clientes 32 --turnos 20
+import argparse
+import asyncio
+import multiprocessing
+import random
+import sqlite3
+import sys
+import tempfile
+
+import httpx
+
+from benchmarks.common import cargar_app, imprimir
+
+
+async def _cliente(http, turnos, intentos, resultados, rnd):
+    for _ in range(intentos):
+        horario_id, cancha_id = rnd.choice(turnos)
+        r = await http.post("/reservas", json={"cancha_id": cancha_id, "usuario_id": rnd.randint(1, 1000),
+                                               "horario_id": horario_id, "descripcion": "stress", "num_personas": 4})
+        resultados[r.status_code] = resultados.get(r.status_code, 0) + 1
+
+
+async def _proceso_async(clientes, turnos, intentos, semilla):
+    main, _ = cargar_app(_directorio)
+    resultados = {}
+    transporte = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://stress") as http:
+        await asyncio.gather(*[_cliente(http, turnos, intentos, resultados, random.Random(semilla * 1000 + i))
+                               for i in range(clientes)])
+    return resultados
+
+
+def _proceso(args):
+    return asyncio.run(_proceso_async(*args))
+
+
+def _inicializar(directorio):
+    global _directorio
+    _directorio = directorio
+
+
+def main_stress():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--procesos", type=int, default=4)
+    parser.add_argument("--clientes", type=int, default=32)
+    parser.add_argument("--intentos", type=int, default=20)
+    parser.add_argument("--turnos", type=int, default=20)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="stress-reservas-")
+    main, _ = cargar_app(directorio)
+    turnos = [(horario_id, cancha_id) for horario_id in range(1, args.turnos + 1) for cancha_id in (1, 2)]
+
+    with multiprocessing.get_context("spawn").Pool(args.procesos, initializer=_inicializar, initargs=(directorio,)) as procesos:
+        parciales = procesos.map(_proceso, [(args.clientes, turnos, args.intentos, p) for p in range(args.procesos)])
+
+    codigos = {}
+    for parcial in parciales:
+        for codigo, cantidad in parcial.items():
+            codigos[codigo] = codigos.get(codigo, 0) + cantidad
+
+    conn = sqlite3.connect(main.db)
+    duplicados = conn.execute("SELECT COUNT(*) FROM (SELECT 1 FROM reservas GROUP BY horario_id, cancha_id HAVING COUNT(*) > 1)").fetchone()[0]
+    reservas = conn.execute("SELECT COUNT(*) FROM reservas").fetchone()[0]
+    conn.close()
+
+    imprimir({
+        "parametros": vars(args),
+        "intentos": sum(codigos.values()),
+        "codigos": {str(codigo): cantidad for codigo, cantidad in sorted(codigos.items())},
+        "turnos_reservados": reservas,
+        "turnos_con_duplicados": duplicados,
+    })
+    # 201 creadas == filas en la tabla y ningun turno con mas de una reserva
+    if duplicados or codigos.get(201, 0) != reservas:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_stress()
@@ -0,0 +1,186 @@
+# Suite de carga reproducible contra la app real servida por uvicorn.
+# Cada escenario arranca la app sobre una base temporal nueva sembrada con
+# reservas/recordatorios y con la api externa reemplazada por
+# benchmarks.upstream_stub; despues corre clientes concurrentes (lazo cerrado)
+# durante --duracion segundos y reporta throughput y p50/p95/p99 por endpoint
+# en JSON, para comparar corridas entre cambios:
+#   python -m benchmarks.suite_carga --reservas 20000 --salida antes.json
+#   python -m benchmarks.suite_carga --reservas 20000 --salida despues.json
+# Escenarios: rafaga_reservas (muchos clientes reservando los mismos turnos),
+# polling (listados, detalle, disponibilidad y horariosreservas con ETag),
+# importacion (altas en lote) y mixto (los tres a la vez).
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import RAIZ, cargar_app, detener, esperar, iniciar, puerto_libre, resumen, sembrar
+from benchmarks.upstream_stub import HORARIOS_POR_DIA
+
+
+class Registro:
+    # latencias y codigos de estado por endpoint ("GET /reservas/{reserva_id}")
+    def __init__(self):
+        self.latencias = {}
+        self.codigos = {}
+
+    async def pedir(self, http, endpoint, metodo, url, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            r = await http.request(metodo, url, **kwargs)
+            codigo = str(r.status_code)
+        except httpx.HTTPError as e:
+            r, codigo = None, type(e).__name__
+        self.latencias.setdefault(endpoint, []).append(time.perf_counter() - inicio)
+        codigos = self.codigos.setdefault(endpoint, {})
+        codigos[codigo] = codigos.get(codigo, 0) + 1
+        return r
+
+    def reporte(self, duracion):
+        endpoints = {endpoint: dict(resumen(latencias, duracion), codigos=self.codigos[endpoint])
+                     for endpoint, latencias in sorted(self.latencias.items())}
+        todas = [latencia for latencias in self.latencias.values() for latencia in latencias]
+        return {"duracion_s": round(duracion, 3), "total": resumen(todas, duracion), "endpoints": endpoints}
+
+
+def reserva_al_azar(rnd, args, horarios):
+    return {"cancha_id": rnd.randint(1, args.canchas), "usuario_id": rnd.randint(1, args.usuarios),
+            "horario_id": rnd.choice(horarios), "descripcion": "carga", "num_personas": rnd.randint(1, 16)}
+
+
+async def cliente_rafaga(http, registro, rnd, args, fin):
+    # todos compiten por los mismos turnos "calientes": la mayoria termina en 409
+    calientes = list(range(1, args.turnos_calientes + 1))
+    while time.monotonic() < fin:
+        await registro.pedir(http, "POST /reservas", "POST", "/reservas", json=reserva_al_azar(rnd, args, calientes))
+
+
+async def cliente_polling(http, registro, rnd, args, fin):
+    # cada cliente revalida sus listados con el ETag de la ultima respuesta
+    etags = {}
+    while time.monotonic() < fin:
+        opcion = rnd.random()
+        if opcion < 0.3:
+            endpoint, url, params = "GET /reservas", "/reservas", {"limit": 100}
+        elif opcion < 0.45:
+            endpoint, url, params = "GET /recordatorios", "/recordatorios", {"limit": 100}
+        elif opcion < 0.65:
+            endpoint, url, params = "GET /reservas/{reserva_id}", "/reservas/{}".format(rnd.randint(1, max(args.reservas, 1))), {}
+        elif opcion < 0.85:
+            dia = rnd.randrange(max(args.horarios // HORARIOS_POR_DIA, 1))
+            fecha = "2024-{:02d}-{:02d}".format(1 + dia // 28 % 12, 1 + dia % 28)
+            endpoint, url, params = "GET /disponibilidad", "/disponibilidad", {"fecha": fecha}
+        else:
+            endpoint, url, params = "GET /horariosreservas/{horario_id}", "/horariosreservas/{}".format(rnd.randint(1, args.horarios)), {}
+        headers = {"If-None-Match": etags[url]} if url in etags else {}
+        r = await registro.pedir(http, endpoint, "GET", url, params=params, headers=headers)
+        if r is not None and r.headers.get("etag"):
+            etags[url] = r.headers["etag"]
+
+
+async def cliente_importacion(http, registro, rnd, args, fin):
+    horarios = list(range(1, args.horarios + 1))
+    while time.monotonic() < fin:
+        lote = [reserva_al_azar(rnd, args, horarios) for _ in range(args.lote)]
+        await registro.pedir(http, "POST /reservas/bulk", "POST", "/reservas/bulk", json=lote)
+
+
+ESCENARIOS = {
+    "rafaga_reservas": [cliente_rafaga],
+    "polling": [cliente_polling],
+    "importacion": [cliente_importacion],
+    "mixto": [cliente_rafaga, cliente_polling, cliente_polling, cliente_importacion],
+}
+
+
+async def correr_escenario(nombre, base_url, args):
+    registro = Registro()
+    tipos = ESCENARIOS[nombre]
+    clientes = args.clientes if nombre != "importacion" else max(1, args.clientes // 8)
+    limites = httpx.Limits(max_connections=clientes, max_keepalive_connections=clientes)
+    async with httpx.AsyncClient(base_url=base_url, limits=limites, timeout=30.0) as http:
+        # calentamiento: catalogos en cache e indices construidos
+        await http.get("/disponibilidad", params={"fecha": "2024-01-01"})
+        await http.get("/horariosreservas/1")
+        inicio = time.perf_counter()
+        fin = time.monotonic() + args.duracion
+        await asyncio.gather(*[tipos[i % len(tipos)](http, registro, random.Random(args.semilla * 1000 + i), args, fin)
+                               for i in range(clientes)])
+        duracion = time.perf_counter() - inicio
+    return dict(registro.reporte(duracion), clientes=clientes)
+
+
+def entorno():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"python": platform.python_version(), "plataforma": platform.platform(), "cpus": os.cpu_count(), "commit": commit}
+
+
+def main_suite():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--escenarios", default=",".join(ESCENARIOS))
+    parser.add_argument("--reservas", type=int, default=10000)
+    parser.add_argument("--recordatorios", type=int, default=5000)
+    parser.add_argument("--horarios", type=int, default=2000)
+    parser.add_argument("--canchas", type=int, default=8)
+    parser.add_argument("--usuarios", type=int, default=500)
+    parser.add_argument("--clientes", type=int, default=32)
+    parser.add_argument("--duracion", type=float, default=10.0)
+    parser.add_argument("--lote", type=int, default=100)
+    parser.add_argument("--turnos-calientes", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--latencia-upstream-ms", type=float, default=5.0)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--salida")
+    args = parser.parse_args()
+    escenarios = [nombre.strip() for nombre in args.escenarios.split(",") if nombre.strip()]
+    for nombre in escenarios:
+        if nombre not in ESCENARIOS:
+            parser.error("escenario desconocido: {}".format(nombre))
+
+    puerto_stub = puerto_libre()
+    stub = iniciar(["-m", "benchmarks.upstream_stub", "--puerto", str(puerto_stub), "--horarios", str(args.horarios),
+                    "--canchas", str(args.canchas), "--usuarios", str(args.usuarios),
+                    "--latencia-ms", str(args.latencia_upstream_ms)], RAIZ)
+    resultados = {}
+    try:
+        esperar("http://127.0.0.1:{}/api/canchas".format(puerto_stub), stub)
+        for nombre in escenarios:
+            # base nueva por escenario para que las corridas sean comparables
+            directorio = tempfile.mkdtemp(prefix="carga-reservas-")
+            main, _ = cargar_app(directorio)
+            # el modulo ya importado no vuelve a crear el esquema en el directorio nuevo
+            main.init_db()
+            sembrar(os.path.join(directorio, main.db), args.reservas, args.recordatorios, args.horarios,
+                    args.canchas, args.usuarios, args.semilla)
+            puerto = puerto_libre()
+            app = iniciar(["-m", "uvicorn", "api.main:app", "--host", "127.0.0.1", "--port", str(puerto),
+                           "--workers", str(args.workers), "--no-access-log", "--log-level", "warning"],
+                          directorio, {"UPSTREAM_PREFIX": "http://127.0.0.1:{}".format(puerto_stub), "LOG_LEVEL": "WARNING"})
+            try:
+                esperar("http://127.0.0.1:{}/".format(puerto), app)
+                resultados[nombre] = asyncio.run(correr_escenario(nombre, "http://127.0.0.1:{}".format(puerto), args))
+            finally:
+                detener(app)
+    finally:
+        detener(stub)
+
+    salida = json.dumps({"parametros": vars(args), "entorno": entorno(), "escenarios": resultados}, indent=2, sort_keys=True)
+    if args.salida:
+        with open(args.salida, "w") as archivo:
+            archivo.write(salida + "\n")
+    print(salida)
+
+
+if __name__ == "__main__":
+    main_suite()
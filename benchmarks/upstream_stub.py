@@ -0,0 +1,100 @@
+# Servidor local que reemplaza a la api externa (/api/horarios, /api/canchas,
+# /api/usuarios) en los benchmarks. Los catalogos se generan de forma
+# determinista a partir de los parametros, coinciden con los ids que usa
+# common.sembrar y se sirven con ETag (responde 304 a If-None-Match).
+# Permite inyectar fallas (errores 500 y latencia) al arrancar o en caliente:
+#   POST /_fallas?error=0.5&latencia_ms=3000
+#   python -m benchmarks.upstream_stub --puerto 8299 --horarios 1000
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+from urllib.parse import parse_qs
+
+HORARIOS_POR_DIA = 16
+
+
+def generar_catalogos(horarios=1000, canchas=8, usuarios=500):
+    lista_horarios = []
+    for horario_id in range(1, horarios + 1):
+        dia, turno = divmod(horario_id - 1, HORARIOS_POR_DIA)
+        lista_horarios.append({
+            "horario_id": horario_id,
+            "fecha": "2024-{:02d}-{:02d}".format(1 + dia // 28 % 12, 1 + dia % 28),
+            "hora": "{:02d}:{:02d}".format(8 + turno // 2, 30 * (turno % 2)),
+        })
+    return {
+        "/api/horarios": lista_horarios,
+        "/api/canchas": [{"cancha_id": i, "nombre": "Cancha {}".format(i), "tipo": "cristal" if i % 2 else "cemento"}
+                         for i in range(1, canchas + 1)],
+        "/api/usuarios": [{"id": i, "nombre": "Nombre{}".format(i), "apellido": "Apellido{}".format(i),
+                           "email": "usuario{}@example.com".format(i)} for i in range(1, usuarios + 1)],
+    }
+
+
+def crear_app(catalogos, latencia=0.0, error=0.0, semilla=1):
+    # app ASGI minima, sin dependencias fuera de uvicorn
+    fallas = {"latencia": latencia, "error": error}
+    rnd = random.Random(semilla)
+    cuerpos = {}
+    for ruta, datos in catalogos.items():
+        cuerpo = json.dumps(datos).encode("utf-8")
+        cuerpos[ruta] = (cuerpo, '"{}"'.format(hashlib.sha1(cuerpo).hexdigest()[:16]).encode("latin-1"))
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        if scope["path"] == "/_fallas":
+            # error: probabilidad de responder 500; latencia_ms: demora de cada respuesta
+            parametros = parse_qs(scope["query_string"].decode("latin-1"))
+            if "error" in parametros:
+                fallas["error"] = float(parametros["error"][0])
+            if "latencia_ms" in parametros:
+                fallas["latencia"] = float(parametros["latencia_ms"][0]) / 1000.0
+            await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body", "body": json.dumps(fallas).encode("utf-8")})
+            return
+        if fallas["latencia"]:
+            await asyncio.sleep(fallas["latencia"])
+        if fallas["error"] and rnd.random() < fallas["error"]:
+            await send({"type": "http.response.start", "status": 500, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        encontrado = cuerpos.get(scope["path"])
+        if encontrado is None:
+            await send({"type": "http.response.start", "status": 404, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        cuerpo, etag = encontrado
+        if dict(scope["headers"]).get(b"if-none-match") == etag:
+            await send({"type": "http.response.start", "status": 304, "headers": [(b"etag", etag)]})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json"), (b"etag", etag)]})
+        await send({"type": "http.response.body", "body": cuerpo})
+
+    return app
+
+
+def argumentos(parser):
+    parser.add_argument("--puerto", type=int, default=8299)
+    parser.add_argument("--horarios", type=int, default=1000)
+    parser.add_argument("--canchas", type=int, default=8)
+    parser.add_argument("--usuarios", type=int, default=500)
+    parser.add_argument("--latencia-ms", type=float, default=0.0)
+    parser.add_argument("--error", type=float, default=0.0, help="probabilidad de responder 500")
+    return parser
+
+
+def main_stub():
+    import uvicorn
+
+    args = argumentos(argparse.ArgumentParser()).parse_args()
+    app = crear_app(generar_catalogos(args.horarios, args.canchas, args.usuarios), args.latencia_ms / 1000.0, args.error)
+    uvicorn.run(app, host="127.0.0.1", port=args.puerto, log_level="warning")
+
+
+if __name__ == "__main__":
+    main_stub()